@@ -1,9 +1,20 @@
-from flask import Flask,request,render_template# importing flask and other libraries
+import hmac
+import os
+import threading
+import time
+
 import numpy as np
-import pandas as pd
 
-from sklearn.preprocessing import StandardScaler
-from src.pipeline.predict_pipeline import CustomData,PredictPipeline
+from flask import Flask,Response,request,render_template,jsonify# importing flask and other libraries
+
+from src.logger import logging,log_stats
+from src.pipeline.predict_pipeline import CustomData
+from src.pipeline.artifact_registry import get_registry
+from src.pipeline.micro_batcher import get_batcher
+from src.pipeline.concurrency import Overloaded,get_executor
+from src.pipeline.metrics import get_metrics
+from src.pipeline.schema import get_schema
+from src.pipeline.model_versions import get_router
 
 application=Flask(__name__) # creating an instance of Flask class
 # __name__ is a special variable in Python that is set to the name of the module in which it is used.
@@ -11,6 +22,53 @@ application=Flask(__name__) # creating an instance of Flask class
 app=application # it is used to create an instance of the Flask class. The instance is assigned to the variable
 # app, which is then used to define routes and handle requests.
 
+reload_token=os.environ.get("RELOAD_TOKEN","") # POST /reload needs the header "Authorization: Bearer <token>", it is disabled while unset
+
+ready=threading.Event() # it is set once the artifacts are loaded and a warm-up prediction has run, /ready reports it
+
+warm_up_lock=threading.Lock() # it is used so that the warm-up thread and /ready never load the artifacts at the same time
+warm_up_retry_seconds=float(os.environ.get("WARMUP_RETRY_SECONDS","1")) # first delay between warm-up attempts, doubled up to 60 s
+
+def warm_up()->bool: # it is used to load the artifacts and run one dummy prediction before the app reports ready
+    if not warm_up_lock.acquire(blocking=False): # another thread is warming up already
+        return ready.is_set()
+    try:
+        if not ready.is_set():
+            get_router().warm_up() # every loaded model version, so a canary request does not pay for the first load
+            ready.set()
+    except Exception:
+        logging.exception("Warm-up failed, /ready keeps answering 503 until a retry succeeds")
+    finally:
+        warm_up_lock.release()
+    return ready.is_set()
+
+def warm_up_with_retries(): # it is used on the warm-up thread, a temporary artifact problem at startup must not need a restart
+    delay=warm_up_retry_seconds
+    while not warm_up():
+        time.sleep(delay)
+        delay=min(delay*2,60.0)
+
+if os.environ.get("PRELOAD_ARTIFACTS")=="1": # gunicorn.conf.py sets this so the master process loads the artifacts once
+    warm_up() # forked workers then share the loaded model and preprocessor pages copy-on-write, and start ready; /ready retries a failure
+elif os.environ.get("WARMUP","1")!="0":
+    threading.Thread(target=warm_up_with_retries,name="warm-up",daemon=True).start() # the import returns right away, /ready flips when it is done
+
+metrics=get_metrics() # span timings are recorded while METRICS_ENABLED is not 0
+metrics.register_collector("artifacts",lambda: get_registry().stats())
+metrics.register_collector("prediction_cache",lambda: get_registry().prediction_cache.stats())
+metrics.register_collector("batcher",lambda: get_batcher().stats())
+metrics.register_collector("executor",lambda: get_executor().stats())
+metrics.register_collector("model",lambda: get_router().gauges()) # latency per version, canary split and shadow deltas
+metrics.register_collector("logging",log_stats) # records dropped because the log queue was full
+
+@app.errorhandler(Overloaded) # it is used to answer with 429 instead of queueing more work than the server can handle
+def overloaded(error):
+    return jsonify(error=str(error)),429,{"Retry-After":"1"}
+
+@app.errorhandler(TimeoutError) # it is used to answer with 503 when a prediction did not finish within PREDICT_TIMEOUT
+def prediction_timeout(error):
+    return jsonify(error="The prediction did not finish in time"),503,{"Retry-After":"1"}
+
 ## Route for a home page
 
 @app.route('/') # it is used to define a route for the home page of the web application.
@@ -23,26 +81,115 @@ def predict_datapoint(): # it is a function that handles the prediction of data
     if request.method=='GET': # it checks if the request method is GET. If it is, it renders the home.html template.
         return render_template('home.html') # it is used to render the home.html template when the user accesses the '/predictdata' URL with a GET request.
     else:
-        data=CustomData( # it is used to create an instance of the CustomData class. The instance is created with the user input data.
-            gender=request.form.get('gender'),
-            race_ethnicity=request.form.get('ethnicity'),
-            parental_level_of_education=request.form.get('parental_level_of_education'),
-            lunch=request.form.get('lunch'),
-            test_preparation_course=request.form.get('test_preparation_course'),
-            reading_score=float(request.form.get('writing_score')),
-            writing_score=float(request.form.get('reading_score'))
+        with metrics.span("request_parse"):
+            form=request.form.to_dict()
+        with metrics.span("custom_data"):
+            data=CustomData( # it is used to create an instance of the CustomData class. The instance is created with the user input data.
+                gender=form.get('gender'),
+                race_ethnicity=form.get('ethnicity'),
+                parental_level_of_education=form.get('parental_level_of_education'),
+                lunch=form.get('lunch'),
+                test_preparation_course=form.get('test_preparation_course'),
+                reading_score=form.get('reading_score'), # the schema below converts and range checks the scores
+                writing_score=form.get('writing_score')
+
+            )
+            router=get_router()
+            version=router.choose() # the fields are checked against the categories of the version that answers, a canary may differ
+            decoded=get_schema(router.pipelines[version].registry).decode([data.get_data_as_dict()]) # it is used to validate the fields against the fitted categories and score range
+        if not decoded.valid.all(): # the per field messages are missing when SCHEMA_MAX_ERRORS is 0
+            return render_template('home.html',errors=decoded.errors.get(0) or {"the form": "has invalid fields"}),400
+        pred_record={column: values[0] for column,values in decoded.columns.items()} # it is used to pass the typed record to the single-row fast path of the PredictPipeline class.
+        logging.debug("event=predict_form record=%s",pred_record) # arguments are only formatted when DEBUG is enabled
 
+        results,_=get_executor().run(router.predict_record,pred_record,version=version) # it is used to run the prediction of the routed model version on the prediction pool, a full pool answers 429
+        logging.debug("event=predict_form_done prediction=%s",results[0])
+        with metrics.span("render"):
+            return render_template('home.html',results=results[0]) # it is used to render the home.html template with the prediction results. The results are passed to the template as a variable named 'results'.
+
+@app.route('/predict',methods=['POST']) # it is used to define a JSON route that scores one record, an array of records or a {"columns": {field: [values]}} payload
+def predict_json():
+    with metrics.span("request_parse"):
+        payload=request.get_json(silent=True)
+        if isinstance(payload,dict) and 'columns' in payload: # column oriented payloads decode without building one dict per row
+            records=payload['columns']
+            if not isinstance(records,dict) or not all(isinstance(values,list) for values in records.values()):
+                return jsonify(error="Expected columns to be an object mapping every field to an array of values"),400
+        else:
+            records=payload.get('records') if isinstance(payload,dict) and 'records' in payload else payload
+            if isinstance(records,dict): # a single record is scored as a batch of one
+                records=[records]
+            if not isinstance(records,list) or not records or not all(isinstance(record,dict) for record in records):
+                return jsonify(error="Expected a JSON object, a non-empty array of objects or a columns object"),400
+
+    router=get_router()
+    pinned=request.headers.get('X-Model-Version') # it is used to ask a specific loaded version, e.g. to compare versions by hand
+    if pinned is not None and pinned not in router.versions:
+        return jsonify(error=f"Unknown model version {pinned!r}",versions=router.versions),400
+    version=router.choose(pinned) # the payload is checked against the categories of the version that answers, a canary may differ
+
+    try:
+        with metrics.span("custom_data"):
+            decoded=get_schema(router.pipelines[version].registry).decode(records) # typed columns plus the rows that failed validation
+    except ValueError as e:
+        return jsonify(error=str(e)),400
+    if not decoded.valid.any():
+        return jsonify(error="No valid rows",invalid_rows=decoded.n_invalid,errors=decoded.error_list()),400
+
+    executor=get_executor()
+    with executor.admit() as hold: # it is used to reject the request with 429 when too many are in flight
+        # concurrent requests are merged into one vectorized predict call by the micro batcher of the routed version,
+        # the slot stays taken until that call is done, also when the wait below times out
+        results,version=router.predict(decoded.frame(CustomData.feature_columns),timeout=executor.config.timeout,version=version,hold=hold)
+    logging.debug("event=predict_json rows=%d invalid=%d version=%s",decoded.n_rows,decoded.n_invalid,version)
+    with metrics.span("render"):
+        if not decoded.n_invalid:
+            return jsonify(predictions=results.tolist(),model_version=version)
+        predictions=np.full(decoded.n_rows,np.nan)
+        predictions[decoded.valid]=results
+        return jsonify( # invalid rows get a null prediction and are listed with their field errors, the rest of the batch is scored
+            predictions=[None if np.isnan(value) else value for value in predictions.tolist()],
+            invalid_rows=decoded.n_invalid,
+            errors=decoded.error_list(),
+            model_version=version,
         )
-        pred_df=data.get_data_as_data_frame()  # it is used to convert the user input data into a pandas DataFrame using the get_data_as_data_frame() method of the CustomData class.
-        print(pred_df)
-        print("Before Prediction")
-
-        predict_pipeline=PredictPipeline() # it is used to create an instance of the PredictPipeline class. The instance is used to make predictions on the user input data.
-        print("Mid Prediction")
-        results=predict_pipeline.predict(pred_df) # it is used to make predictions on the user input data using the predict() method of the PredictPipeline class.
-        print("after Prediction")
-        return render_template('home.html',results=results[0]) # it is used to render the home.html template with the prediction results. The results are passed to the template as a variable named 'results'.
-    
+
+@app.route('/health',methods=['GET']) # it is used as the liveness probe, it answers as soon as the process serves requests
+def health():
+    return jsonify(status="ok")
+
+@app.route('/ready',methods=['GET']) # it is used as the readiness probe, it answers 503 until the warm-up prediction has run
+def readiness():
+    if not ready.is_set() and not warm_up(): # also in workers forked from a master whose warm-up failed, where no thread retries
+        return jsonify(ready=False),503
+    return jsonify(ready=True)
+
+@app.route('/artifacts',methods=['GET']) # it is used to expose the artifact load time and cache hit/miss counters
+def artifact_stats():
+    return jsonify(get_registry().stats())
+
+@app.route('/cache',methods=['GET']) # it is used to expose the hit rate of the prediction cache
+def prediction_cache_stats():
+    return jsonify(get_registry().prediction_cache.stats())
+
+@app.route('/versions',methods=['GET']) # it is used to expose the loaded model versions, the traffic split and the shadow deltas
+def model_versions():
+    return jsonify(get_router().stats())
+
+@app.route('/metrics',methods=['GET']) # it is used to expose p50/p95/p99 span timings and the stats above to Prometheus
+def prometheus_metrics():
+    return Response(metrics.render(),mimetype="text/plain; version=0.0.4")
+
+@app.route('/reload',methods=['POST']) # it is used to force a reload of model.pkl and proprocessor.pkl without restarting the app
+def reload_artifacts():
+    if not reload_token:
+        return jsonify(error="reload is disabled, set RELOAD_TOKEN"),403
+    if not hmac.compare_digest(request.headers.get("Authorization","").encode(),f"Bearer {reload_token}".encode()):
+        return jsonify(error="unauthorized"),401,{"WWW-Authenticate":"Bearer"}
+    get_registry().reload()
+    return jsonify(get_registry().stats())
+
 if __name__ == "__main__":
+    # development server only, production runs on gunicorn with several workers: gunicorn -c gunicorn.conf.py application:application
     print("Starting Flask App...")
     app.run(host="0.0.0.0") # it is used to run the Flask application. The host is set to "
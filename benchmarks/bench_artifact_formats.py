@@ -0,0 +1,93 @@
+'''
+Compares CSV, Parquet and Feather data artifacts (and .npy feature matrices loaded
+eagerly or memory mapped) by load time and peak RSS. Every load runs in a fresh
+subprocess so the RSS numbers do not leak into each other. Pages of a memory mapped
+.npy count towards RSS once touched, but they are file backed and shared between
+processes, so the kernel can drop them instead of swapping.
+
+Run from the repository root:  python -m benchmarks.bench_artifact_formats --rows 1000000
+'''
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+from src.utils import read_table,write_table
+
+CATEGORICAL_COLUMNS=("gender","race_ethnicity","parental_level_of_education","lunch","test_preparation_course")
+
+
+def peak_rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss/1024 # ru_maxrss is in KiB on Linux
+
+
+def current_rss_mb(): # the peak is already raised by the imports, so the increase is measured on the current RSS
+    with open("/proc/self/statm") as file_obj:
+        return int(file_obj.read().split()[1])*os.sysconf("SC_PAGE_SIZE")/2**20
+
+
+def measure(file_path):
+    '''
+    This function runs in the subprocess: it loads one artifact, touches every value and reports time and RSS
+
+    '''
+    baseline=current_rss_mb()
+    start=time.perf_counter()
+    if file_path.endswith(".npy"):
+        mmap_mode="r" if os.environ.get("BENCH_MMAP")=="1" else None
+        data=np.load(file_path,mmap_mode=mmap_mode)
+        checksum=float(data[:,-1].sum()) # a column scan, what slicing X/y out of the matrix costs
+    else:
+        data=read_table(file_path)
+        checksum=float(data["math_score"].sum())
+    elapsed=time.perf_counter()-start
+    print(json.dumps({"seconds": elapsed,"peak_rss_mb": peak_rss_mb(),"rss_increase_mb": current_rss_mb()-baseline,"checksum": checksum}))
+
+
+def run(file_path,mmap=False):
+    env=dict(os.environ,BENCH_MMAP="1" if mmap else "0")
+    output=subprocess.run([sys.executable,"-m","benchmarks.bench_artifact_formats","--measure",file_path],
+                          check=True,capture_output=True,text=True,env=env).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser=argparse.ArgumentParser(description=__doc__,formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--data",default=os.path.join("artifacts","data.csv"))
+    parser.add_argument("--rows",type=int,default=1_000_000)
+    parser.add_argument("--measure",help=argparse.SUPPRESS)
+    args=parser.parse_args()
+
+    if args.measure:
+        measure(args.measure)
+        return
+
+    source=pd.read_csv(args.data)
+    df=source.sample(n=args.rows,replace=True,random_state=42).reset_index(drop=True) # it is used to scale the dataset up
+    results={}
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for extension in ("csv","parquet","feather"):
+            file_path=os.path.join(tmp_dir,f"data.{extension}")
+            write_table(df,file_path,CATEGORICAL_COLUMNS)
+            results[extension]={"size_mb": os.path.getsize(file_path)/2**20,**run(file_path)}
+
+        matrix=np.random.default_rng(0).random((args.rows,20))
+        file_path=os.path.join(tmp_dir,"train_arr.npy")
+        np.save(file_path,matrix)
+        results["npy"]={"size_mb": os.path.getsize(file_path)/2**20,**run(file_path)}
+        results["npy (mmap)"]={"size_mb": os.path.getsize(file_path)/2**20,**run(file_path,mmap=True)}
+
+    print(f"{'format':<12}{'size MB':>10}{'load s':>10}{'RSS +MB':>10}")
+    for name,result in results.items():
+        print(f"{name:<12}{result['size_mb']:>10.1f}{result['seconds']:>10.3f}{result['rss_increase_mb']:>10.1f}")
+
+
+if __name__=="__main__":
+    main()
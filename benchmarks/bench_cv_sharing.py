@@ -0,0 +1,123 @@
+'''
+Wall time and peak RSS of the hyperparameter search (evaluate_models) before and after a change. The
+train/test feature matrices are built once from synthetic data and saved the way DataTransformation saves
+them (.npy, target in the last column, opened as memory maps). Each search then runs in a fresh process
+against the src/ of the working tree and, with --baseline, against the src/ of that git revision (checked
+out in a temporary worktree), so every peak RSS belongs to one search only. Worker processes are shut
+down before their peak RSS is read. The grids of ModelTrainer.get_params are cut to the first
+--grid-values values of every parameter to keep the runs short.
+
+Run from the repository root:
+  python -m benchmarks.bench_cv_sharing --rows 200000 --n-jobs 2 --baseline HEAD~1
+'''
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+import numpy as np
+
+REPO_ROOT=os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def build_matrices(rows,data_dir):
+    from benchmarks.synthetic import generate_student_data
+    from src.components.data_transformation import DataTransformation
+
+    df=generate_student_data(rows)
+    test_rows=rows//5
+    preprocessor=DataTransformation().get_data_transformer_object()
+    features=df.drop(columns=["math_score"])
+    X_train=preprocessor.fit_transform(features.iloc[test_rows:])
+    X_test=preprocessor.transform(features.iloc[:test_rows])
+    np.save(os.path.join(data_dir,"train_arr.npy"),np.c_[X_train,df["math_score"].to_numpy()[test_rows:]])
+    np.save(os.path.join(data_dir,"test_arr.npy"),np.c_[X_test,df["math_score"].to_numpy()[:test_rows]])
+    return X_train.shape
+
+
+def run_search(args): # runs in the child process, src is imported from the tree on PYTHONPATH
+    import resource
+    import time
+    from joblib.externals.loky import get_reusable_executor
+    from src.components.model_trainers import ModelTrainer
+    from src.utils import evaluate_models
+
+    train=np.load(os.path.join(args.data_dir,"train_arr.npy"),mmap_mode="r")
+    test=np.load(os.path.join(args.data_dir,"test_arr.npy"),mmap_mode="r")
+    trainer=ModelTrainer()
+    models={name:model for name,model in trainer.get_models().items() if name in args.models}
+    for model in models.values():
+        if "random_state" in model.get_params():
+            model.set_params(random_state=0) # it is used to make the r2 of both trees comparable
+    if "CatBoosting Regressor" in models:
+        models["CatBoosting Regressor"].set_params(allow_writing_files=False)
+    params={name:{key:values[:args.grid_values] for key,values in grid.items()} for name,grid in trainer.get_params().items() if name in models}
+
+    start=time.perf_counter()
+    report=evaluate_models(train[:,:-1],train[:,-1],test[:,:-1],test[:,-1],models,params,n_jobs=args.n_jobs)
+    seconds=time.perf_counter()-start
+    get_reusable_executor().shutdown(wait=True) # it is used to count the loky workers in RUSAGE_CHILDREN
+    print(json.dumps({
+        "seconds": seconds,
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss/1024,
+        "workers_peak_rss_mb": resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss/1024,
+        "r2": report,
+    }))
+
+
+def search_in_subprocess(src_root,args,work_dir):
+    command=[sys.executable,os.path.abspath(__file__),"--run-search","--data-dir",args.data_dir,"--n-jobs",str(args.n_jobs),
+             "--grid-values",str(args.grid_values),"--models",*args.models]
+    env={**os.environ,"PYTHONPATH": src_root,"TRAIN_CACHE": "0"}
+    completed=subprocess.run(command,cwd=work_dir,env=env,capture_output=True,text=True) # logs/ and catboost_info/ stay in work_dir
+    if completed.returncode!=0:
+        raise RuntimeError(completed.stderr[-2000:])
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+def main():
+    from src.components.model_trainers import ModelTrainer
+
+    parser=argparse.ArgumentParser(description=__doc__,formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows",type=int,default=100_000)
+    parser.add_argument("--n-jobs",type=int,default=1)
+    parser.add_argument("--grid-values",type=int,default=2)
+    parser.add_argument("--models",nargs="+",default=list(ModelTrainer().get_models()))
+    parser.add_argument("--baseline",help="git revision to compare with, for example HEAD~1")
+    args=parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        args.data_dir=os.path.join(work_dir,"data")
+        os.makedirs(args.data_dir)
+        shape=build_matrices(args.rows,args.data_dir)
+        print(f"{shape[0]} train rows x {shape[1]} features, n_jobs={args.n_jobs}, {len(args.models)} models")
+
+        trees={"working tree": REPO_ROOT}
+        if args.baseline:
+            trees={f"baseline {args.baseline}": os.path.join(work_dir,"baseline"),**trees}
+            subprocess.run(["git","worktree","add","--detach",trees[f"baseline {args.baseline}"],args.baseline],cwd=REPO_ROOT,check=True,capture_output=True)
+        try:
+            results={label:search_in_subprocess(src_root,args,work_dir) for label,src_root in trees.items()}
+        finally:
+            if args.baseline:
+                subprocess.run(["git","worktree","remove","--force",trees[f"baseline {args.baseline}"]],cwd=REPO_ROOT,capture_output=True)
+
+    for label,result in results.items():
+        print(f"  {label:<20} {result['seconds']:7.1f} s   peak RSS {result['peak_rss_mb']:7.0f} MB   workers {result['workers_peak_rss_mb']:7.0f} MB")
+    for name in args.models:
+        print(f"  r2 {name:<22} "+"   ".join(f"{result['r2'][name]:.6f}" for result in results.values()))
+
+
+if __name__=="__main__":
+    if "--run-search" in sys.argv:
+        parser=argparse.ArgumentParser()
+        parser.add_argument("--run-search",action="store_true")
+        parser.add_argument("--data-dir")
+        parser.add_argument("--n-jobs",type=int)
+        parser.add_argument("--grid-values",type=int)
+        parser.add_argument("--models",nargs="+")
+        run_search(parser.parse_args())
+    else:
+        main()
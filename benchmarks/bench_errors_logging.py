@@ -0,0 +1,148 @@
+'''
+Cost of the error path and of logging on the request threads.
+
+errors   a failure raised three layers deep, each layer wrapping it the way the components do
+         (except Exception as e: raise CustomException(e,sys)). The previous CustomException formatted
+         its message at every layer and nested the messages; the current one keeps the first wrap and
+         formats once, when str() is called. Timed per failure, str() included.
+logging  N threads logging at once through the synchronous file handler (LOG_ASYNC=0) and through the
+         NonBlockingQueueHandler used by default. Per call latency on the logging threads is reported,
+         the time the listener needed to drain the queue and the records dropped when it was full.
+         --slow-disk-ms adds a sleep to every write to show a stalled disk.
+
+Run from the repository root:  python -m benchmarks.bench_errors_logging --threads 8 --calls 5000
+'''
+import argparse
+import logging
+import os
+import sys
+import tempfile
+import threading
+import time
+
+import numpy as np
+
+from src.exception import CustomException,error_message_detail
+from src.logger import LazyFileHandler,NonBlockingQueueHandler
+
+
+class LegacyCustomException(Exception): # the exception before the single wrap, formatted when created
+    def __init__(self,error_message,error_detail:sys):
+        super().__init__(error_message)
+        self.error_message=error_message_detail(error_message,error_detail=error_detail)
+
+    def __str__(self):
+        return self.error_message
+
+
+def failing_call(exception_class):
+    def inner():
+        try:
+            {}["reading_score"]
+        except Exception as e:
+            raise exception_class(e,sys)
+
+    def middle():
+        try:
+            inner()
+        except Exception as e:
+            raise exception_class(e,sys)
+
+    def outer():
+        try:
+            middle()
+        except Exception as e:
+            raise exception_class(e,sys)
+
+    try:
+        outer()
+    except Exception as e:
+        return str(e)
+
+
+def bench_errors(calls,repeat):
+    for label,exception_class in (("formatted at every layer",LegacyCustomException),("single wrap, lazy message",CustomException)):
+        best=min(timed(lambda: [failing_call(exception_class) for _ in range(calls)]) for _ in range(repeat))
+        message=failing_call(exception_class)
+        print(f"  {label:<26} {best/calls*1e6:7.2f} us/failure   message of {len(message)} chars")
+
+
+def timed(fn):
+    start=time.perf_counter()
+    fn()
+    return time.perf_counter()-start
+
+
+class SlowDisk(logging.Handler): # it is used to add a fixed delay to every write of the wrapped handler
+    def __init__(self,target,delay):
+        super().__init__()
+        self.target=target
+        self.delay=delay
+
+    def handle(self,record):
+        time.sleep(self.delay)
+        return self.target.handle(record)
+
+    def close(self):
+        self.target.close()
+        super().close()
+
+
+def bench_logging(threads,calls,slow_disk_ms,max_queue,work_dir):
+    formatter=logging.Formatter('[%(asctime)s]: %(lineno)d %(name)s - %(levelname)s - %(message)s',datefmt='%Y-%m-%d %H:%M:%S')
+
+    def file_target(name):
+        target=LazyFileHandler(os.path.join(work_dir,f"{name}.log"),maxBytes=10*1024*1024,backupCount=5,delay=True)
+        target.setFormatter(formatter)
+        return SlowDisk(target,slow_disk_ms/1000) if slow_disk_ms else target
+
+    for label,make_handler in (("synchronous file handler",lambda: file_target("sync")),("queue handler",lambda: NonBlockingQueueHandler(file_target("queue"),max_queue))):
+        handler=make_handler()
+        logger=logging.getLogger(f"bench.{label}")
+        logger.propagate=False
+        logger.setLevel(logging.INFO)
+        logger.addHandler(handler)
+        samples=[[] for _ in range(threads)]
+
+        def work(out):
+            for i in range(calls):
+                start=time.perf_counter()
+                logger.info("predicted %d rows with model %s in %.3f ms",i,"primary",0.25)
+                out.append(time.perf_counter()-start)
+
+        workers=[threading.Thread(target=work,args=(out,)) for out in samples]
+        start=time.perf_counter()
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        logged=time.perf_counter()-start
+        if isinstance(handler,NonBlockingQueueHandler):
+            handler._stop() # it is used to wait until the listener has written every queued record
+        drained=time.perf_counter()-start
+        logger.removeHandler(handler)
+        handler.close()
+
+        calls_ms=np.concatenate(samples)*1000
+        dropped=getattr(handler,"dropped",0)
+        print(f"  {label:<26} p50 {np.percentile(calls_ms,50)*1000:8.1f} us   p99 {np.percentile(calls_ms,99)*1000:8.1f} us   "
+              f"max {calls_ms.max():8.2f} ms   threads done {logged:6.2f} s   written {drained:6.2f} s   dropped {dropped}")
+
+
+def main():
+    parser=argparse.ArgumentParser(description=__doc__,formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--threads",type=int,default=8)
+    parser.add_argument("--calls",type=int,default=5000,help="log calls per thread and failures in the error benchmark")
+    parser.add_argument("--slow-disk-ms",type=float,default=0.0)
+    parser.add_argument("--max-queue",type=int,default=10000,help="LOG_QUEUE_SIZE, records beyond it are dropped")
+    parser.add_argument("--repeat",type=int,default=5)
+    args=parser.parse_args()
+
+    print("errors:")
+    bench_errors(args.calls,args.repeat)
+    print(f"logging, {args.threads} threads x {args.calls} calls:")
+    with tempfile.TemporaryDirectory() as work_dir:
+        bench_logging(args.threads,args.calls,args.slow_disk_ms,args.max_queue,work_dir)
+
+if __name__=="__main__":
+    main()
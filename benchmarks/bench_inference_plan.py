@@ -0,0 +1,54 @@
+'''
+Microbenchmark of single-row preprocessing: the fitted sklearn ColumnTransformer
+on a one-row DataFrame against the compiled NumPy inference plan.
+
+Run from the repository root:  python -m benchmarks.bench_inference_plan
+'''
+import argparse
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+from src.components.inference_plan import InferencePlan,file_checksum
+from src.pipeline.predict_pipeline import CustomData
+from src.utils import load_object
+
+
+def time_per_call(fn,records,repeat):
+    start=time.perf_counter()
+    for i in range(repeat):
+        fn(records[i%len(records)])
+    return (time.perf_counter()-start)/repeat
+
+
+def main():
+    parser=argparse.ArgumentParser(description=__doc__,formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--preprocessor",default=os.path.join("artifacts","proprocessor.pkl"))
+    parser.add_argument("--data",default=os.path.join("artifacts","test.csv"))
+    parser.add_argument("--repeat",type=int,default=2000)
+    args=parser.parse_args()
+
+    preprocessor=load_object(args.preprocessor)
+    plan=InferencePlan.from_preprocessor(preprocessor,source_checksum=file_checksum(args.preprocessor))
+
+    df=pd.read_csv(args.data)[CustomData.feature_columns]
+    records=df.to_dict(orient="records")
+
+    # the plan must reproduce the sklearn output exactly, not approximately
+    expected=preprocessor.transform(df)
+    actual=plan.transform_records(records)
+    if not np.array_equal(expected,actual):
+        raise SystemExit(f"Inference plan output differs from the preprocessor (max abs diff {np.abs(expected-actual).max()})")
+    print(f"parity: identical on {len(records)} rows")
+
+    sklearn_time=time_per_call(lambda record: preprocessor.transform(pd.DataFrame([record])),records,args.repeat)
+    plan_time=time_per_call(plan.transform_record,records,args.repeat)
+    print(f"sklearn ColumnTransformer: {sklearn_time*1e6:10.1f} us/row")
+    print(f"inference plan:            {plan_time*1e6:10.1f} us/row")
+    print(f"speedup:                   {sklearn_time/plan_time:10.1f}x")
+
+
+if __name__=="__main__":
+    main()
@@ -0,0 +1,75 @@
+'''
+Reports file size and load time of each serializer backend for the model types
+ModelTrainer can pick. Models are fitted on artifacts/train.csv with the
+preprocessor in artifacts/proprocessor.pkl. Every round trip must give the same predictions and the
+same get_params(), the script exits with an error otherwise.
+
+Run from the repository root:  python -m benchmarks.bench_serializers
+'''
+import argparse
+import os
+import statistics
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+from catboost import CatBoostRegressor
+from sklearn.ensemble import GradientBoostingRegressor,RandomForestRegressor
+from sklearn.linear_model import LinearRegression
+from sklearn.neighbors import KNeighborsRegressor
+from xgboost import XGBRegressor
+
+from src import serializers
+from src.utils import load_object
+
+
+def same_params(a,b): # NaN parameters (XGBoost's missing) compare equal
+    return a.keys()==b.keys() and all(a[key]==b[key] or (a[key]!=a[key] and b[key]!=b[key]) for key in a)
+
+
+def main():
+    parser=argparse.ArgumentParser(description=__doc__,formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--data",default=os.path.join("artifacts","train.csv"))
+    parser.add_argument("--preprocessor",default=os.path.join("artifacts","proprocessor.pkl"))
+    parser.add_argument("--repeat",type=int,default=5)
+    parser.add_argument("--rows",type=int,default=0,help="resample the training set to this many rows")
+    args=parser.parse_args()
+
+    df=pd.read_csv(args.data)
+    df=df.sample(n=max(len(df),args.rows),replace=len(df)<args.rows,random_state=42) # it is used to scale up the training set
+    X=load_object(args.preprocessor).transform(df.drop(columns=["math_score"]))
+    y=df["math_score"].to_numpy()
+
+    models={
+        "Random Forest (256)": RandomForestRegressor(n_estimators=256,random_state=42),
+        "Gradient Boosting": GradientBoostingRegressor(n_estimators=256,random_state=42),
+        "Linear Regression": LinearRegression(),
+        "K-Neighbors": KNeighborsRegressor(),
+        "XGBRegressor": XGBRegressor(n_estimators=256,learning_rate=0.05,max_depth=4),
+        "CatBoosting Regressor": CatBoostRegressor(iterations=500,depth=8,verbose=False,allow_writing_files=False),
+    }
+
+    print(f"{'model':<24}{'backend':<10}{'size KB':>10}{'load ms':>10}")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for name,model in models.items():
+            model.fit(X,y)
+            expected=model.predict(X)
+            native=serializers.choose_serializer(model).name
+            for backend in dict.fromkeys(["pickle","joblib",native]):
+                file_path=os.path.join(tmp_dir,f"model.{backend}")
+                serializers.dump(model,file_path,serializer=backend)
+                times=[]
+                for _ in range(args.repeat):
+                    start=time.perf_counter()
+                    loaded=serializers.load(file_path)
+                    times.append(time.perf_counter()-start)
+                if not np.allclose(loaded.predict(X),expected):
+                    raise SystemExit(f"{name} loaded with {backend} predicts differently")
+                if not same_params(loaded.get_params(),model.get_params()):
+                    raise SystemExit(f"{name} loaded with {backend} lost its parameters")
+                print(f"{name:<24}{backend:<10}{os.path.getsize(file_path)/1024:>10.1f}{statistics.median(times)*1000:>10.2f}")
+
+
+if __name__=="__main__":
+    main()
@@ -0,0 +1,76 @@
+'''
+Primary latency with shadow scoring off and on. A candidate version is published from the current
+artifacts into a temporary versions directory, so the shadow work costs as much as the primary.
+Client threads send single-record requests in a closed loop with a short pause between requests,
+and the p50/p99 of the primary requests are compared for:
+
+  off          SHADOW_PERCENT=0
+  idle-gated   every request shadowed, the worker only runs while no primary request is in flight (default)
+  always       every request shadowed, the worker competes with the requests (SHADOW_WHEN_IDLE=0)
+
+Run from the repository root:  python -m benchmarks.bench_shadow --requests 2000 --clients 4
+'''
+import argparse
+import tempfile
+import threading
+import time
+
+import numpy as np
+
+from benchmarks.synthetic import generate_student_data
+from src.pipeline.model_versions import ModelRouter,ModelVersionsConfig,publish_version
+from src.pipeline.predict_pipeline import CustomData
+
+
+def run(router,frames,clients,pause):
+    latencies=[]
+    lock=threading.Lock()
+    position=iter(range(len(frames)))
+
+    def client():
+        own=[]
+        for index in position:
+            start=time.perf_counter()
+            router.predict(frames[index],timeout=10)
+            own.append(time.perf_counter()-start)
+            time.sleep(pause)
+        with lock:
+            latencies.extend(own)
+
+    threads=[threading.Thread(target=client) for _ in range(clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return np.array(latencies)*1000
+
+
+def main():
+    parser=argparse.ArgumentParser(description=__doc__,formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests",type=int,default=2000)
+    parser.add_argument("--clients",type=int,default=4)
+    parser.add_argument("--pause-ms",type=float,default=2.0,help="pause of each client between two requests")
+    args=parser.parse_args()
+
+    df=generate_student_data(args.requests)[CustomData.feature_columns]
+    frames=[df.iloc[[i]] for i in range(len(df))]
+    with tempfile.TemporaryDirectory() as versions_dir:
+        publish_version("candidate",ModelVersionsConfig(versions_dir=versions_dir))
+        modes={
+            "off": dict(shadow_percent=0.0),
+            "idle-gated": dict(shadow_percent=100.0,shadow_when_idle=True),
+            "always": dict(shadow_percent=100.0,shadow_when_idle=False),
+        }
+        for label,options in modes.items():
+            router=ModelRouter(ModelVersionsConfig(versions_dir=versions_dir,versions="candidate",canary_percent=0.0,**options))
+            router.warm_up()
+            run(router,frames[:200],args.clients,args.pause_ms/1000) # warm-up round, not measured
+            latencies=run(router,frames,args.clients,args.pause_ms/1000)
+            time.sleep(0.5) # lets the shadow queue drain before its stats are read
+            shadow=router.stats()["shadow"] or {}
+            print(f"{label:>10}: primary p50 {np.percentile(latencies,50):6.2f} ms  p99 {np.percentile(latencies,99):6.2f} ms"
+                  f"  shadow rows {shadow.get('rows',0):>5}  dropped {shadow.get('dropped',0):>5}")
+
+
+if __name__=="__main__":
+    main()
@@ -0,0 +1,121 @@
+'''
+Measures the cold start of the serving process: interpreter start to `import application`,
+the warm-up (artifact load + one dummy prediction) and the first real /predict request.
+Every run is a fresh subprocess, so nothing is cached in memory between runs; the OS page
+cache stays warm, which is what a restarted container on the same node sees.
+
+The compiled NumPy model (artifacts/compiled_model.npz) and the pickled model are compared,
+together with the heavy modules each of them ends up importing and the RSS once ready.
+
+Run from the repository root:  python -m benchmarks.bench_startup --runs 5
+                               python -m benchmarks.bench_startup --importtime 15
+'''
+import argparse
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+import time
+
+HEAVY_MODULES=("sklearn","scipy","joblib","xgboost","catboost","pyarrow")
+SAMPLE_RECORD={
+    "gender": "female",
+    "race_ethnicity": "group B",
+    "parental_level_of_education": "bachelor's degree",
+    "lunch": "standard",
+    "test_preparation_course": "none",
+    "reading_score": 72,
+    "writing_score": 74,
+}
+
+
+def current_rss_mb():
+    with open("/proc/self/statm") as file_obj:
+        return int(file_obj.read().split()[1])*os.sysconf("SC_PAGE_SIZE")/2**20
+
+
+def measure():
+    '''
+    This function runs in the subprocess and prints one JSON line with its timings
+
+    '''
+    start=time.perf_counter()
+    import application
+    imported=time.perf_counter()
+    application.warm_up()
+    warmed=time.perf_counter()
+    client=application.app.test_client()
+    response=client.post("/predict",json=SAMPLE_RECORD)
+    first_request=time.perf_counter()-warmed
+    print(json.dumps({
+        "import_seconds": imported-start,
+        "warm_up_seconds": warmed-imported,
+        "first_request_ms": first_request*1000,
+        "status": response.status_code,
+        "ready": application.ready.is_set(),
+        "rss_mb": current_rss_mb(),
+        "heavy_modules": sorted(module for module in HEAVY_MODULES if module in sys.modules),
+    }))
+
+
+def run(compiled):
+    env=dict(os.environ,SERVE_COMPILED="1" if compiled else "0",PRELOAD_ARTIFACTS="0",WARMUP="0")
+    start=time.perf_counter()
+    output=subprocess.run([sys.executable,"-m","benchmarks.bench_startup","--measure"],
+                          check=True,capture_output=True,text=True,env=env).stdout
+    total=time.perf_counter()-start
+    return {"process_seconds": total,**json.loads(output.strip().splitlines()[-1])}
+
+
+def importtime(top):
+    '''
+    This function prints the modules with the largest cumulative import time under `import application`
+
+    '''
+    env=dict(os.environ,PRELOAD_ARTIFACTS="0",WARMUP="0")
+    stderr=subprocess.run([sys.executable,"-X","importtime","-c","import application"],
+                          check=True,capture_output=True,text=True,env=env).stderr
+    rows=[]
+    for line in stderr.splitlines():
+        match=re.match(r"import time:\s+(\d+) \|\s+(\d+) \|(\s*)(\S+)",line)
+        if match:
+            rows.append((int(match.group(2)),len(match.group(3)),match.group(4)))
+    for cumulative,depth,module in sorted(rows,reverse=True)[:top]:
+        print(f"{cumulative/1000:>9.1f} ms  {module}")
+
+
+def main():
+    parser=argparse.ArgumentParser(description=__doc__,formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs",type=int,default=5)
+    parser.add_argument("--importtime",type=int,default=0,help="print the N slowest imports of application.py instead")
+    parser.add_argument("--output",help="optional JSON file for the results")
+    parser.add_argument("--measure",action="store_true",help=argparse.SUPPRESS)
+    args=parser.parse_args()
+
+    if args.measure:
+        measure()
+        return
+    if args.importtime:
+        importtime(args.importtime)
+        return
+
+    results={}
+    for label,compiled in (("compiled",True),("pickled",False)):
+        runs=[run(compiled) for _ in range(args.runs)]
+        summary={key:statistics.median(r[key] for r in runs) for key in ("process_seconds","import_seconds","warm_up_seconds","first_request_ms","rss_mb")}
+        summary["heavy_modules"]=runs[-1]["heavy_modules"]
+        summary["ready"]=all(r["ready"] and r["status"]==200 for r in runs)
+        results[label]=summary
+        print(f"{label:>9}: process {summary['process_seconds']:.2f}s, import {summary['import_seconds']:.2f}s, "
+              f"warm-up {summary['warm_up_seconds']*1000:.0f}ms, first request {summary['first_request_ms']:.1f}ms, "
+              f"RSS {summary['rss_mb']:.0f}MB, heavy modules {summary['heavy_modules']}")
+
+    if args.output:
+        with open(args.output,"w",encoding="utf-8") as file_obj:
+            json.dump(results,file_obj,indent=1)
+
+
+if __name__=="__main__":
+    main()
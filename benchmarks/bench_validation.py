@@ -0,0 +1,108 @@
+'''
+Decoding and validation of prediction payloads: the per-field path (CustomData built field by field
+with float(), the way the form route did it, then a DataFrame) and CustomData.get_records_as_data_frame
+used by the JSON route before, against the column-wise RecordSchema.decode. Each path ends with
+preprocessor.transform, which is where the old paths found bad input.
+
+With --invalid-rate > 0 some rows get an unknown category or an out of range score: the old paths
+fail the whole batch inside the ColumnTransformer (the time to that CustomException is reported),
+the schema reports those rows and transforms the rest.
+
+Run from the repository root:  python -m benchmarks.bench_validation --sizes 1 64 1024 16384 --invalid-rate 0.01
+'''
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+from benchmarks.synthetic import generate_student_data
+from src.components.inference_plan import InferencePlan
+from src.exception import CustomException
+from src.pipeline.predict_pipeline import CustomData
+from src.pipeline.schema import RecordSchema
+from src.utils import load_object
+
+
+def per_field(records): # the previous form route, one CustomData per record
+    rows=[]
+    for record in records:
+        data=CustomData(
+            gender=record.get("gender"),
+            race_ethnicity=record.get("race_ethnicity"),
+            parental_level_of_education=record.get("parental_level_of_education"),
+            lunch=record.get("lunch"),
+            test_preparation_course=record.get("test_preparation_course"),
+            reading_score=float(record.get("reading_score")),
+            writing_score=float(record.get("writing_score")),
+        )
+        rows.append(data.get_data_as_dict())
+    return pd.DataFrame.from_records(rows,columns=CustomData.feature_columns)
+
+
+def corrupt(records,rate,seed=0): # it is used to make a share of the rows invalid, half by category and half by range
+    rng=np.random.default_rng(seed)
+    records=[dict(record) for record in records]
+    for row in np.flatnonzero(rng.random(len(records))<rate):
+        if row%2:
+            records[row]["gender"]="unknown"
+        else:
+            records[row]["reading_score"]=140
+    return records
+
+
+def best_time(fn,repeat):
+    times=[]
+    for _ in range(repeat):
+        start=time.perf_counter()
+        fn()
+        times.append(time.perf_counter()-start)
+    return min(times)
+
+
+def main():
+    parser=argparse.ArgumentParser(description=__doc__,formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--preprocessor",default=os.path.join("artifacts","proprocessor.pkl"))
+    parser.add_argument("--sizes",type=int,nargs="+",default=[1,64,1024,16384])
+    parser.add_argument("--invalid-rate",type=float,default=0.0)
+    parser.add_argument("--repeat",type=int,default=5)
+    args=parser.parse_args()
+
+    preprocessor=load_object(args.preprocessor)
+    schema=RecordSchema.from_plan(InferencePlan.from_preprocessor(preprocessor))
+    all_records=generate_student_data(max(args.sizes))[CustomData.feature_columns].to_dict(orient="records")
+    all_records=corrupt(all_records,args.invalid_rate)
+
+    def old_path(decode,records):
+        try:
+            preprocessor.transform(decode(records))
+            return "ok"
+        except Exception as e:
+            try:
+                raise CustomException(e,sys) # the route handlers wrapped the failure like this
+            except CustomException:
+                return "batch failed"
+
+    def schema_path(records):
+        decoded=schema.decode(records)
+        if decoded.valid.any():
+            preprocessor.transform(decoded.frame(CustomData.feature_columns))
+        return f"{decoded.n_invalid} rows rejected"
+
+    paths={ # label -> (decode only, decode and transform)
+        "per-field CustomData": (per_field,lambda records: old_path(per_field,records)),
+        "get_records_as_data_frame": (CustomData.get_records_as_data_frame,lambda records: old_path(CustomData.get_records_as_data_frame,records)),
+        "RecordSchema.decode": (schema.decode,schema_path),
+    }
+    for size in args.sizes:
+        records=all_records[:size]
+        print(f"{size} rows:")
+        for label,(decode,full) in paths.items():
+            decode_time=best_time(lambda: decode(records),args.repeat)
+            total_time=best_time(lambda: full(records),args.repeat)
+            print(f"  {label:<27} decode {decode_time/size*1e6:8.2f} us/row   with transform {total_time/size*1e6:8.2f} us/row   ({full(records)})")
+
+if __name__=="__main__":
+    main()
@@ -0,0 +1,349 @@
+'''
+End to end benchmark suite for training and inference. It generates synthetic student data
+(benchmarks/synthetic.py) and times five stages:
+
+  ingestion  DataIngestion in memory and chunked, rows per second
+  transform  reading train/test, preprocessor fit and transform
+  fit        fit time of every model in ModelTrainer.get_models() with default parameters
+  predict    single-row latency (predict_record and a one row DataFrame) and batched throughput
+  http       requests per second and latency of POST /predict under a local load generator
+
+Results are written as JSON together with the commit and library versions, so two runs can be
+compared with --compare. The prediction cache is disabled for predict, and for http unless --http-cache.
+
+Run from the repository root:
+  python -m benchmarks.suite --rows 1000000
+  python -m benchmarks.suite --only predict,http --compare benchmarks/results/<commit>.json
+'''
+import argparse
+import http.client
+import json
+import os
+import platform
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+import sklearn
+from catboost import CatBoostRegressor
+from sklearn.base import clone
+
+from benchmarks.synthetic import CATEGORICAL_COLUMNS,generate_student_data
+from src.components.data_ingestion import DataIngestion,DataIngestionConfig
+from src.components.data_transformation import DataTransformation
+from src.components.model_trainers import ModelTrainer
+from src.components.training_cache import TrainingCache,TrainingCacheConfig
+from src.pipeline.artifact_registry import ArtifactRegistry
+from src.pipeline.predict_pipeline import CustomData,PredictPipeline
+from src.pipeline.prediction_cache import PredictionCache,PredictionCacheConfig
+from src.utils import read_table,write_table
+
+SECTIONS=("ingestion","transform","fit","predict","http")
+TARGET_COLUMN="math_score"
+
+
+def latency_summary(samples)->dict: # it is used to summarize per call timings in milliseconds
+    samples=np.asarray(samples,dtype=np.float64)*1000
+    return {
+        "calls": int(samples.size),
+        "mean_ms": float(samples.mean()),
+        "p50_ms": float(np.percentile(samples,50)),
+        "p95_ms": float(np.percentile(samples,95)),
+        "p99_ms": float(np.percentile(samples,99)),
+    }
+
+
+def timed(fn,*args,**kwargs):
+    start=time.perf_counter()
+    result=fn(*args,**kwargs)
+    return result,time.perf_counter()-start
+
+
+def bench_ingestion(source_path,work_dir,rows,chunksize):
+    '''
+    This function times the regular and the chunked ingestion of the synthetic file, with the training cache off
+
+    '''
+    results={}
+    paths=None
+    for mode in ("in_memory","chunked"):
+        mode_dir=os.path.join(work_dir,mode)
+        ingestion=DataIngestion()
+        ingestion.training_cache=TrainingCache(TrainingCacheConfig(cache_dir=os.path.join(mode_dir,"cache"),enabled=False))
+        ingestion.ingestion_config=DataIngestionConfig(
+            source_data_path=source_path,
+            train_data_path=os.path.join(mode_dir,"train.csv"),
+            test_data_path=os.path.join(mode_dir,"test.csv"),
+            raw_data_path=os.path.join(mode_dir,"data.csv"),
+            chunksize=chunksize,
+        )
+        if mode=="in_memory":
+            paths,seconds=timed(ingestion.initiate_data_ingestion)
+        else:
+            _,seconds=timed(ingestion.initiate_chunked_data_ingestion)
+        results[mode]={"seconds": seconds,"rows_per_second": rows/seconds}
+    return results,paths
+
+
+def bench_transform(train_path,test_path):
+    '''
+    This function times reading the split and fitting/applying the preprocessor, it returns the feature matrices for the fit stage
+
+    '''
+    train_df,read_train=timed(read_table,train_path)
+    test_df,read_test=timed(read_table,test_path)
+    X_train_df,y_train=train_df.drop(columns=[TARGET_COLUMN]),train_df[TARGET_COLUMN].to_numpy()
+    X_test_df,y_test=test_df.drop(columns=[TARGET_COLUMN]),test_df[TARGET_COLUMN].to_numpy()
+
+    preprocessor=DataTransformation().get_data_transformer_object()
+    _,fit_seconds=timed(preprocessor.fit,X_train_df)
+    X_train,transform_train=timed(preprocessor.transform,X_train_df)
+    X_test,transform_test=timed(preprocessor.transform,X_test_df)
+    results={
+        "read_seconds": read_train+read_test,
+        "fit_seconds": fit_seconds,
+        "transform_train_seconds": transform_train,
+        "transform_test_seconds": transform_test,
+        "transform_rows_per_second": len(X_train_df)/transform_train,
+        "n_features": int(X_train.shape[1]),
+    }
+    return results,(X_train,y_train,X_test,y_test)
+
+
+def bench_fit(X_train,y_train,fit_rows):
+    '''
+    This function fits every candidate model once with its default parameters on the first fit_rows rows
+
+    '''
+    X,y=X_train[:fit_rows],y_train[:fit_rows]
+    results={"rows": int(len(X))}
+    for name,model in ModelTrainer().get_models().items():
+        estimator=clone(model)
+        if isinstance(estimator,CatBoostRegressor):
+            estimator.set_params(allow_writing_files=False) # it is used to keep catboost_info/ out of the working tree
+        _,seconds=timed(estimator.fit,X,y)
+        results[name]={"seconds": seconds}
+        print(f"  fit {name}: {seconds:.2f}s",flush=True)
+    return results
+
+
+def bench_predict(records_df,single_calls,batch_sizes):
+    '''
+    This function measures the deployed artifacts: single-row latency on both paths and batched throughput
+
+    '''
+    pipeline=PredictPipeline(registry=ArtifactRegistry())
+    pipeline.registry.prediction_cache=PredictionCache(PredictionCacheConfig(max_entries=0)) # every call reaches the model
+    pipeline.registry.get()
+
+    records=records_df[CustomData.feature_columns].head(single_calls).to_dict(orient="records")
+    record_samples=[]
+    for record in records:
+        _,seconds=timed(pipeline.predict_record,record)
+        record_samples.append(seconds)
+    frame_samples=[]
+    for record in records:
+        _,seconds=timed(pipeline.predict,pd.DataFrame([record],columns=CustomData.feature_columns),use_cache=False)
+        frame_samples.append(seconds)
+
+    batches={}
+    for batch_size in batch_sizes:
+        batch=records_df[CustomData.feature_columns].head(batch_size)
+        repeats=max(1,min(50,100_000//batch_size))
+        samples=[timed(pipeline.predict,batch,use_cache=False)[1] for _ in range(repeats)]
+        batches[str(batch_size)]={**latency_summary(samples),"rows_per_second": batch_size/float(np.median(samples))}
+    return {"predict_record": latency_summary(record_samples),"predict_dataframe_1_row": latency_summary(frame_samples),"batch": batches}
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1",0))
+        return sock.getsockname()[1]
+
+
+def start_server(server,port,use_cache):
+    env=dict(os.environ,PREDICTION_CACHE_SIZE=os.environ.get("PREDICTION_CACHE_SIZE","100000") if use_cache else "0")
+    if server=="gunicorn":
+        command=["gunicorn","-c","gunicorn.conf.py","-b",f"127.0.0.1:{port}","application:application"]
+    else:
+        command=[sys.executable,"-c",f"from application import app; app.run(host='127.0.0.1',port={port},threaded=True)"]
+    process=subprocess.Popen(command,env=env,stdout=subprocess.DEVNULL,stderr=subprocess.DEVNULL)
+    deadline=time.monotonic()+60
+    while time.monotonic()<deadline:
+        try:
+            connection=http.client.HTTPConnection("127.0.0.1",port,timeout=1)
+            connection.request("GET","/artifacts")
+            connection.getresponse().read()
+            return process
+        except OSError:
+            time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError(f"{server} did not start on port {port}")
+
+
+def bench_http(records_df,server,concurrency,duration,use_cache):
+    '''
+    This function starts the app in a subprocess and drives POST /predict from concurrency client threads for duration seconds
+
+    '''
+    bodies=[json.dumps(record) for record in records_df[CustomData.feature_columns].head(10_000).to_dict(orient="records")]
+    port=free_port()
+    process=start_server(server,port,use_cache)
+    latencies=[[] for _ in range(concurrency)]
+    errors=[0]*concurrency
+
+    def client(worker):
+        connection=http.client.HTTPConnection("127.0.0.1",port,timeout=30)
+        i=worker
+        while time.monotonic()<deadline:
+            start=time.perf_counter()
+            try:
+                connection.request("POST","/predict",body=bodies[i%len(bodies)],headers={"Content-Type": "application/json"})
+                response=connection.getresponse()
+                response.read()
+                ok=response.status==200
+            except OSError:
+                connection.close()
+                connection=http.client.HTTPConnection("127.0.0.1",port,timeout=30)
+                ok=False
+            if ok:
+                latencies[worker].append(time.perf_counter()-start)
+            else:
+                errors[worker]+=1
+            i+=concurrency
+
+    try:
+        start=time.perf_counter()
+        deadline=time.monotonic()+duration
+        threads=[threading.Thread(target=client,args=(worker,)) for worker in range(concurrency)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed=time.perf_counter()-start
+    finally:
+        process.terminate()
+        process.wait(timeout=30)
+
+    samples=[sample for worker in latencies for sample in worker]
+    return {
+        "server": server,
+        "concurrency": concurrency,
+        "prediction_cache": use_cache,
+        "requests": len(samples),
+        "errors": sum(errors),
+        "requests_per_second": len(samples)/elapsed,
+        **(latency_summary(samples) if samples else {}),
+    }
+
+
+def run_metadata(args)->dict:
+    def git(*command):
+        try:
+            return subprocess.run(["git",*command],capture_output=True,text=True,check=True).stdout.strip()
+        except (OSError,subprocess.CalledProcessError):
+            return None
+    return {
+        "commit": git("rev-parse","--short","HEAD"),
+        "dirty": bool(git("status","--porcelain","--untracked-files=no")),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "numpy": np.__version__,
+        "pandas": pd.__version__,
+        "sklearn": sklearn.__version__,
+        "args": vars(args),
+    }
+
+
+def flatten(results,prefix="")->dict: # it is used to line up the numeric leaves of two result files
+    flat={}
+    for key,value in results.items():
+        name=f"{prefix}{key}"
+        if isinstance(value,dict):
+            flat.update(flatten(value,f"{name}."))
+        elif isinstance(value,(int,float)) and not isinstance(value,bool):
+            flat[name]=value
+    return flat
+
+
+def compare(baseline_path,results):
+    with open(baseline_path,encoding="utf-8") as file_obj:
+        baseline=flatten(json.load(file_obj)["results"])
+    current=flatten(results)
+    print(f"{'metric':<60} {'baseline':>12} {'current':>12} {'ratio':>8}")
+    for name in sorted(set(baseline)&set(current)):
+        ratio=current[name]/baseline[name] if baseline[name] else float("nan")
+        print(f"{name:<60} {baseline[name]:>12.4g} {current[name]:>12.4g} {ratio:>8.2f}")
+
+
+def main():
+    parser=argparse.ArgumentParser(description=__doc__,formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows",type=int,default=1_000_000,help="synthetic rows generated for ingestion and transform")
+    parser.add_argument("--source",default=os.path.join("artifacts","data.csv"))
+    parser.add_argument("--only",default=",".join(SECTIONS),help=f"comma separated subset of {','.join(SECTIONS)}")
+    parser.add_argument("--chunksize",type=int,default=100_000)
+    parser.add_argument("--fit-rows",type=int,default=20_000,help="rows used for the per-model fit times")
+    parser.add_argument("--single-calls",type=int,default=2_000)
+    parser.add_argument("--batch-sizes",default="1,10,100,1000,10000,100000")
+    parser.add_argument("--server",choices=("werkzeug","gunicorn"),default="werkzeug")
+    parser.add_argument("--concurrency",type=int,default=8)
+    parser.add_argument("--duration",type=float,default=10.0,help="seconds of HTTP load")
+    parser.add_argument("--http-cache",action="store_true",help="keep the prediction cache on for the HTTP run")
+    parser.add_argument("--output",help="result file, defaults to benchmarks/results/<commit>.json")
+    parser.add_argument("--compare",help="earlier result file to print ratios against")
+    args=parser.parse_args()
+
+    sections=[section for section in args.only.split(",") if section]
+    unknown=set(sections)-set(SECTIONS)
+    if unknown:
+        parser.error(f"unknown sections: {sorted(unknown)}")
+
+    metadata=run_metadata(args)
+    results={}
+    with tempfile.TemporaryDirectory() as work_dir:
+        df,seconds=timed(generate_student_data,args.rows,args.source)
+        source_path=os.path.join(work_dir,"stud.csv")
+        write_table(df,source_path,CATEGORICAL_COLUMNS)
+        results["synthetic"]={"rows": args.rows,"generate_seconds": seconds}
+        print(f"Generated {args.rows} rows in {seconds:.1f}s",flush=True)
+
+        train_path,test_path=None,None
+        if "ingestion" in sections or "transform" in sections or "fit" in sections:
+            ingestion,(train_path,test_path)=bench_ingestion(source_path,work_dir,args.rows,args.chunksize)
+            if "ingestion" in sections:
+                results["ingestion"]=ingestion
+                print(f"ingestion: {ingestion}",flush=True)
+        if "transform" in sections or "fit" in sections:
+            transform,arrays=bench_transform(train_path,test_path)
+            if "transform" in sections:
+                results["transform"]=transform
+                print(f"transform: {transform}",flush=True)
+            if "fit" in sections:
+                results["fit"]=bench_fit(arrays[0],arrays[1],args.fit_rows)
+        if "predict" in sections:
+            batch_sizes=[int(size) for size in args.batch_sizes.split(",") if size]
+            results["predict"]=bench_predict(df,args.single_calls,batch_sizes)
+            print(f"predict_record: {results['predict']['predict_record']}",flush=True)
+        if "http" in sections:
+            results["http"]=bench_http(df,args.server,args.concurrency,args.duration,args.http_cache)
+            print(f"http: {results['http']}",flush=True)
+
+    output=args.output or os.path.join("benchmarks","results",f"{metadata['commit'] or 'unknown'}.json")
+    os.makedirs(os.path.dirname(output) or ".",exist_ok=True)
+    with open(output,"w",encoding="utf-8") as file_obj:
+        json.dump({"metadata": metadata,"results": results},file_obj,indent=1)
+    print(f"Saved results to {output}")
+
+    if args.compare:
+        compare(args.compare,results)
+
+
+if __name__=="__main__":
+    main()
@@ -0,0 +1,48 @@
+'''
+Synthetic student data scaled up from artifacts/data.csv. Rows are bootstrapped so the
+category mix and the correlation between the scores are kept, then every score gets
+Gaussian noise, is rounded and clipped to 0-100 so the rows are not plain copies.
+
+Run from the repository root:  python -m benchmarks.synthetic --rows 1000000 --output /tmp/stud_1m.csv
+'''
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+
+from src.utils import write_table
+
+SCORE_COLUMNS=("math_score","reading_score","writing_score")
+CATEGORICAL_COLUMNS=("gender","race_ethnicity","parental_level_of_education","lunch","test_preparation_course")
+
+
+def generate_student_data(rows,source=os.path.join("artifacts","data.csv"),noise=3.0,seed=42)->pd.DataFrame:
+    '''
+    This function returns rows synthetic records with the columns and value ranges of source
+
+    '''
+    rng=np.random.default_rng(seed)
+    base=pd.read_csv(source)
+    df=base.iloc[rng.integers(0,len(base),size=rows)].reset_index(drop=True)
+    for column in SCORE_COLUMNS:
+        scores=df[column].to_numpy(dtype=np.float64)+rng.normal(0.0,noise,size=rows)
+        df[column]=np.clip(np.rint(scores),0,100).astype(np.int64)
+    return df
+
+
+def main():
+    parser=argparse.ArgumentParser(description=__doc__,formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows",type=int,default=1_000_000)
+    parser.add_argument("--source",default=os.path.join("artifacts","data.csv"))
+    parser.add_argument("--seed",type=int,default=42)
+    parser.add_argument("--output",required=True,help="csv, parquet or feather, taken from the extension")
+    args=parser.parse_args()
+
+    df=generate_student_data(args.rows,args.source,seed=args.seed)
+    write_table(df,args.output,CATEGORICAL_COLUMNS)
+    print(f"Wrote {len(df)} rows to {args.output}")
+
+
+if __name__=="__main__":
+    main()
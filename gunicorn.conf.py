@@ -0,0 +1,25 @@
+# Production server settings, used with:  gunicorn -c gunicorn.conf.py application:application
+import gc
+import multiprocessing
+import os
+
+bind=f"0.0.0.0:{os.environ.get('PORT','8000')}"
+workers=int(os.environ.get("WEB_CONCURRENCY",multiprocessing.cpu_count())) # one process per core for the CPU bound predict calls
+worker_class="gthread" # each worker serves requests on threads, predictions run on the PredictionExecutor pool
+threads=int(os.environ.get("GUNICORN_THREADS","8"))
+timeout=int(os.environ.get("GUNICORN_TIMEOUT","30"))
+keepalive=5
+
+# the app is imported (and the artifacts loaded) once in the master, the workers are forked afterwards
+# and share the model and preprocessor memory copy-on-write
+preload_app=True
+os.environ.setdefault("PRELOAD_ARTIFACTS","1")
+
+loglevel=os.environ.get("LOG_LEVEL","info").lower()
+accesslog="-" if os.environ.get("ACCESS_LOG")=="1" else None
+
+
+def pre_fork(server,worker):
+    # moving the loaded objects to the permanent generation stops the garbage collector from
+    # touching (and so copying) their pages in every worker
+    gc.freeze()
@@ -20,5 +20,11 @@ setup(
     author="Tanishq Anand",
     author_email="tanishqanand26@gmail.com", 
     packages=find_packages(),
-    install_requires=get_requirements('requirements.txt')
+    install_requires=get_requirements('requirements.txt'),
+    entry_points={
+        "console_scripts": [
+            "mlproject-score=src.pipeline.predict_pipeline:main", # offline bulk scoring of CSV/Parquet files
+            "mlproject-train=src.pipeline.train_pipeline:main", # incremental training, full search on schedule or drift
+        ]
+    },
 )
\ No newline at end of file
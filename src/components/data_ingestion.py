@@ -1,7 +1,10 @@
+import hashlib
+import io
 import os
 import sys
 from src.exception import CustomException
 from src.logger import logging
+import numpy as np
 import pandas as pd
 
 from sklearn.model_selection import train_test_split
@@ -12,11 +15,26 @@ from src.components.data_transformation import DataTransformationConfig
 
 from src.components.model_trainers import ModelTrainerConfig
 from src.components.model_trainers import ModelTrainer
+from src.components.model_compiler import ModelCompiler,ModelCompilerConfig
+from src import serializers
+from src.components.training_cache import TrainingCache
+from src.utils import TableWriter,append_table,write_table
 @dataclass
 class DataIngestionConfig: 
+    source_data_path: str=os.path.join('notebook','data','stud.csv')
     train_data_path: str=os.path.join('artifacts',"train.csv")
     test_data_path: str=os.path.join('artifacts',"test.csv")
     raw_data_path: str=os.path.join('artifacts',"data.csv")
+    test_size: float=0.2
+    random_state: int=42
+    chunksize: int=int(os.environ.get("PIPELINE_CHUNKSIZE","0")) # rows per chunk, 0 reads the whole dataset at once
+    artifact_format: str=os.environ.get("ARTIFACT_FORMAT","csv") # "csv", "parquet" or "feather"
+    categorical_columns: tuple=("gender","race_ethnicity","parental_level_of_education","lunch","test_preparation_course")
+
+    def __post_init__(self): # it is used to give the artifact files the extension of the chosen format
+        if self.artifact_format!="csv":
+            for name in ("train_data_path","test_data_path","raw_data_path"):
+                setattr(self,name,os.path.splitext(getattr(self,name))[0]+f".{self.artifact_format}")
 
 
 class DataIngestion:   # This class is responsible for data ingestion, which includes reading the data from a CSV 
@@ -24,33 +42,89 @@ class DataIngestion:   # This class is responsible for data ingestion, which inc
 
     def __init__(self): # This is the constructor method that initializes the DataIngestion class.
         self.ingestion_config=DataIngestionConfig()
+        self.training_cache=TrainingCache() # it is used to skip the split when stud.csv has not changed
+
+    def _outputs_fingerprint(self):
+        paths=(self.ingestion_config.raw_data_path,self.ingestion_config.train_data_path,self.ingestion_config.test_data_path)
+        if not all(os.path.exists(path) for path in paths):
+            return None
+        return self.training_cache.file_fingerprint(*paths)
+
+    def _is_test_row(self,df): # it is used to assign rows to the test set by a hash of their content, independent of chunking
+        threshold=np.uint64(int(self.ingestion_config.test_size*2**32))
+        categorical_columns=self.ingestion_config.categorical_columns
+        normalized=pd.DataFrame({ # the dtypes read_csv infers differ between chunks (int or float scores when one has a gap), the hash must not
+            column: df[column].astype(object).fillna("").astype(str) if column in categorical_columns
+            else pd.to_numeric(df[column],errors="coerce").astype(np.float64)
+            for column in df.columns
+        })
+        row_hash=pd.util.hash_pandas_object(normalized,index=False).to_numpy() # it is used to hash each row by its content only
+        return (row_hash>>np.uint64(32))<threshold
+
+    def _source_prefix_checksum(self,n_bytes): # it is used to check that the rows already ingested were not edited
+        digest=hashlib.sha256()
+        with open(self.ingestion_config.source_data_path,"rb") as file_obj:
+            remaining=n_bytes
+            while remaining>0:
+                block=file_obj.read(min(remaining,1<<20))
+                if not block:
+                    break
+                digest.update(block)
+                remaining-=len(block)
+        return digest.hexdigest()
+
+    def source_checkpoint(self)->dict: # it is used to remember how much of the source file the current artifacts cover
+        offset=os.path.getsize(self.ingestion_config.source_data_path)
+        return {"offset": offset,"checksum": self._source_prefix_checksum(offset)}
+
+    def is_source_appended(self,checkpoint)->bool: # it is used to check that the source only grew since checkpoint was taken
+        offset=checkpoint["offset"]
+        source_path=self.ingestion_config.source_data_path
+        return os.path.getsize(source_path)>=offset and self._source_prefix_checksum(offset)==checkpoint["checksum"]
 
     def initiate_data_ingestion(self): # This method is responsible for initiating the data ingestion process.
         logging.info("Entered the data ingestion method or component")
         try:
-            df=pd.read_csv('notebook\data\stud.csv')
+            cache_key=self.training_cache.key(
+                "ingestion",
+                self.training_cache.file_fingerprint(self.ingestion_config.source_data_path),
+                self.ingestion_config.test_size,
+                self.ingestion_config.random_state,
+                self.ingestion_config.artifact_format,
+            )
+            outputs=self.training_cache.get(cache_key)
+            if outputs is not None and outputs==self._outputs_fingerprint(): # the dataset and split settings are unchanged
+                logging.info("Source data unchanged, reusing the existing train and test split")
+                return(
+                    self.ingestion_config.train_data_path,
+                    self.ingestion_config.test_data_path
+                )
+
+            df=pd.read_csv(self.ingestion_config.source_data_path)
             logging.info('Read the dataset as dataframe') #
 
             os.makedirs(os.path.dirname(self.ingestion_config.train_data_path),exist_ok=True) # This line creates 
             # the directory for the train data path if it does not exist.
         
 
-            df.to_csv(self.ingestion_config.raw_data_path,index=False,header=True)
-            # This line saves the raw data to a CSV file at the specified path.
+            write_table(df,self.ingestion_config.raw_data_path,self.ingestion_config.categorical_columns)
+            # This line saves the raw data to a CSV (or typed columnar) file at the specified path.
 
             logging.info("Train test split initiated") # This line logs that the train-test split process has started.
             # The train_test_split function is used to split the data into training and testing sets.
-            train_set,test_set=train_test_split(df,test_size=0.2,random_state=42)
+            train_set,test_set=train_test_split(df,test_size=self.ingestion_config.test_size,random_state=self.ingestion_config.random_state)
 
 
-            train_set.to_csv(self.ingestion_config.train_data_path,index=False,header=True)
-# This line saves the training set to a CSV file at the specified path.
+            write_table(train_set,self.ingestion_config.train_data_path,self.ingestion_config.categorical_columns)
+# This line saves the training set to a CSV (or typed columnar) file at the specified path.
 
-            test_set.to_csv(self.ingestion_config.test_data_path,index=False,header=True)
-# This line saves the testing set to a CSV file at the specified path.
+            write_table(test_set,self.ingestion_config.test_data_path,self.ingestion_config.categorical_columns)
+# This line saves the testing set to a CSV (or typed columnar) file at the specified path.
 
             logging.info("Ingestion of the data iss completed")
 
+            self.training_cache.put(cache_key,self._outputs_fingerprint())
+
             return( 
                 self.ingestion_config.train_data_path, # This line returns the paths of the training and testing sets.
                 self.ingestion_config.test_data_path
@@ -58,19 +132,104 @@ class DataIngestion:   # This class is responsible for data ingestion, which inc
             )
         except Exception as e:
             raise CustomException(e,sys)
-        
+
+    def initiate_chunked_data_ingestion(self): # This method splits the dataset chunk by chunk so memory does not grow with its size.
+        '''
+        Rows are assigned to the test set when a hash of their content falls below test_size,
+        so the split is deterministic and does not need the whole dataset in memory.
+        The raw data.csv copy is not written in this mode, the source file is read in place.
+
+        '''
+        logging.info("Entered the chunked data ingestion method or component")
+        try:
+            os.makedirs(os.path.dirname(self.ingestion_config.train_data_path),exist_ok=True)
+            rows={"train":0,"test":0}
+
+            categorical_columns=self.ingestion_config.categorical_columns
+            with TableWriter(self.ingestion_config.train_data_path,categorical_columns) as train_writer, \
+                 TableWriter(self.ingestion_config.test_data_path,categorical_columns) as test_writer:
+                for chunk in pd.read_csv(self.ingestion_config.source_data_path,chunksize=self.ingestion_config.chunksize):
+                    is_test=self._is_test_row(chunk)
+
+                    train_writer.write(chunk[~is_test])
+                    test_writer.write(chunk[is_test])
+                    rows["train"]+=int((~is_test).sum())
+                    rows["test"]+=int(is_test.sum())
+
+            logging.info(f"Chunked ingestion of the data is completed: {rows}")
+
+            return(
+                self.ingestion_config.train_data_path,
+                self.ingestion_config.test_data_path
+            )
+        except Exception as e:
+            raise CustomException(e,sys)
+
+    def initiate_incremental_data_ingestion(self,checkpoint):
+        '''
+        This function ingests only the rows appended to the source file after checkpoint (see source_checkpoint).
+        The new rows are split with the content hash of the chunked ingestion and appended to the train and
+        test files, the rows already ingested are not read again. It returns the new train rows, the new test
+        rows and the checkpoint to store for the next run; a ValueError means the already ingested part of the
+        source was changed and a full ingestion is needed.
+
+        '''
+        logging.info("Entered the incremental data ingestion method or component")
+        try:
+            source_path=self.ingestion_config.source_data_path
+            offset=checkpoint["offset"]
+            if not self.is_source_appended(checkpoint):
+                raise ValueError(f"{source_path} was modified before byte {offset}, run the full ingestion")
+
+            with open(source_path,"rb") as file_obj:
+                header=file_obj.readline()
+                file_obj.seek(offset)
+                appended=file_obj.read()
+            new_checkpoint={"offset": offset+len(appended),"checksum": self._source_prefix_checksum(offset+len(appended))}
+            if not appended.strip():
+                logging.info("No new rows in the source data")
+                empty=pd.read_csv(io.BytesIO(header))
+                return empty,empty,new_checkpoint
+
+            df=pd.read_csv(io.BytesIO(header+appended)) # the header line gives the appended rows their column names
+            is_test=self._is_test_row(df)
+            train_set,test_set=df[~is_test],df[is_test]
+
+            categorical_columns=self.ingestion_config.categorical_columns
+            append_table(train_set,self.ingestion_config.train_data_path,categorical_columns)
+            append_table(test_set,self.ingestion_config.test_data_path,categorical_columns)
+            if os.path.exists(self.ingestion_config.raw_data_path): # the chunked ingestion does not keep a raw copy
+                append_table(df,self.ingestion_config.raw_data_path,categorical_columns)
+
+            logging.info(f"Incremental ingestion completed: {len(train_set)} train rows and {len(test_set)} test rows appended")
+            return train_set,test_set,new_checkpoint
+        except Exception as e:
+            raise CustomException(e,sys)
+
 if __name__=="__main__":
     obj=DataIngestion() # This line creates an instance of the DataIngestion class.
-    train_data,test_data=obj.initiate_data_ingestion() # This line calls the initiate_data_ingestion method to 
-    # start the data ingestion process.
-
     data_transformation=DataTransformation() # This line creates an instance of the DataTransformation class.
-    train_arr,test_arr,_=data_transformation.initiate_data_transformation(train_data,test_data) # This line calls 
-    # the initiate_data_transformation method to start the data transformation process.
+
+    if obj.ingestion_config.chunksize: # This branch runs the bounded memory pipeline when PIPELINE_CHUNKSIZE is set.
+        train_data,test_data=obj.initiate_chunked_data_ingestion()
+        train_arr,test_arr,_=data_transformation.initiate_chunked_data_transformation(train_data,test_data,
+                                                                                      chunksize=obj.ingestion_config.chunksize)
+    else:
+        train_data,test_data=obj.initiate_data_ingestion() # This line calls the initiate_data_ingestion method to 
+        # start the data ingestion process.
+
+        train_arr,test_arr,_=data_transformation.initiate_data_transformation(train_data,test_data) # This line calls 
+        # the initiate_data_transformation method to start the data transformation process.
 
     modeltrainer=ModelTrainer() # This line creates an instance of the ModelTrainer class.
     print(modeltrainer.initiate_model_trainer(train_arr,test_arr))
     # This line calls the initiate_model_trainer method to start the model training process.
     # It prints the report of the model training process.
 
+    compiler=ModelCompiler(ModelCompilerConfig(test_data_path=test_data)) # This line exports the chosen model to a NumPy-only artifact for serving,
+    print(compiler.initiate_model_compilation()) # after checking its predictions on the test set against the original model.
+
+    serializers.write_version(modeltrainer.model_trainer_config.trained_model_file_path, # This line marks the saved model and preprocessor
+                              data_transformation.data_transformation_config.preprocessor_obj_file_path) # as one version, the app loads them together.
+
 
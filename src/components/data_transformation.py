@@ -1,10 +1,11 @@
 import sys
+from collections import Counter
 from dataclasses import dataclass
 
 import numpy as np 
-import pandas as pd
 from sklearn.compose import ColumnTransformer # it is used to apply different transformations to different columns of the dataframe 
 from sklearn.impute import SimpleImputer # it is used to fill the missing values in the dataframe 
+from sklearn.base import clone
 from sklearn.pipeline import Pipeline # it is used to create a pipeline of different transformations to be applied to the dataframe
 from sklearn.preprocessing import OneHotEncoder,StandardScaler
 
@@ -12,15 +13,48 @@ from src.exception import CustomException
 from src.logger import logging
 import os
 
-from src.utils import save_object # it is used to save the object in the specified path
+from src.utils import save_object,load_object,read_table,iter_table_chunks # it is used to save the object in the specified path and read the data artifacts
+from src.components.inference_plan import InferencePlan,file_checksum
+from src.components.training_cache import TrainingCache
 
 @dataclass # 
 class DataTransformationConfig: # it is used to create a class with the specified attributes and default values 
     preprocessor_obj_file_path=os.path.join('artifacts',"proprocessor.pkl")
+    inference_plan_file_path=os.path.join('artifacts',"inference_plan.json") # it is used by the serving fast path for single rows
+    train_array_file_path=os.path.join('artifacts',"train_arr.npy") # it is used for the memory mapped feature matrices
+    test_array_file_path=os.path.join('artifacts',"test_arr.npy")
 # it is used to create a file path for the preprocessor object to be saved in the artifacts folder
+def _median_from_counts(counts): # it is used to get the exact median (same as np.median) from value counts
+    values=sorted(counts)
+    total=sum(counts.values())
+    middle=[(total-1)//2,total//2]
+    result=[]
+    seen=0
+    for value in values:
+        seen+=counts[value]
+        while middle and middle[0]<seen:
+            result.append(value)
+            middle.pop(0)
+    return (result[0]+result[1])/2
+
+def _mode_from_counts(counts): # it is used to get the most frequent value, ties go to the smallest value like SimpleImputer
+    best=max(counts.values())
+    return min(value for value,count in counts.items() if count==best)
+
+def _set_imputer_statistics(preprocessing_obj,counts): # it is used to set the fitted imputers' medians/modes from merged value counts
+    for name,pipeline,columns in preprocessing_obj.transformers_:
+        if name=="remainder":
+            continue
+        imputer=pipeline.named_steps["imputer"]
+        if imputer.strategy=="median":
+            imputer.statistics_=np.array([_median_from_counts(counts[column]) for column in columns],dtype=imputer.statistics_.dtype)
+        elif imputer.strategy=="most_frequent":
+            imputer.statistics_=np.array([_mode_from_counts(counts[column]) for column in columns],dtype=imputer.statistics_.dtype)
+
 class DataTransformation:# it is used to create a class for data transformation
     def __init__(self): # it is used to create a constructor for the class
         self.data_transformation_config=DataTransformationConfig() # it is used to create an object of the DataTransformationConfig class
+        self.training_cache=TrainingCache() # it is used to reuse the fitted preprocessor when the data and its config are unchanged
 
     def get_data_transformer_object(self):
         '''
@@ -73,18 +107,62 @@ class DataTransformation:# it is used to create a class for data transformation
         except Exception as e:
             raise CustomException(e,sys) # it is used to raise an exception if there is any error in the code
         
-    def initiate_data_transformation(self,train_path,test_path):
+    def _save_preprocessor(self,preprocessing_obj):
+        save_object(
 
-        try:
-            train_df=pd.read_csv(train_path)
-            test_df=pd.read_csv(test_path)
+            file_path=self.data_transformation_config.preprocessor_obj_file_path, # it is used to save the preprocessor object in the specified path
+            # file_path is the path where the object is to be saved
+            obj=preprocessing_obj  # it is used to save the preprocessor object created by the ColumnTransformer class
 
-            logging.info("Read train and test data completed")
+        )
+
+        logging.info(f"Saved preprocessing object.")
+
+        InferencePlan.from_preprocessor( # it is used to export the fitted preprocessor as a NumPy-only plan for single-row inference
+            preprocessing_obj,
+            source_checksum=file_checksum(self.data_transformation_config.preprocessor_obj_file_path)
+        ).save(self.data_transformation_config.inference_plan_file_path)
+
+        logging.info("Saved inference plan.")
+
+    def _arrays_fingerprint(self):
+        paths=(self.data_transformation_config.train_array_file_path,self.data_transformation_config.test_array_file_path)
+        if not all(os.path.exists(path) for path in paths):
+            return None
+        return self.training_cache.file_fingerprint(*paths)
+
+    def _load_arrays(self): # it is used to open the persisted feature matrices as read only memory maps
+        return (
+            np.load(self.data_transformation_config.train_array_file_path,mmap_mode="r"),
+            np.load(self.data_transformation_config.test_array_file_path,mmap_mode="r"),
+        )
+
+    def initiate_data_transformation(self,train_path,test_path):
 
+        try:
             logging.info("Obtaining preprocessing object")
 
             preprocessing_obj=self.get_data_transformer_object() # it is used to get the preprocessor object created by the get_data_transformer_object function
 
+            cache_key=self.training_cache.key(
+                "features",
+                self.training_cache.file_fingerprint(train_path,test_path),
+                self.training_cache.config_fingerprint(preprocessing_obj),
+            )
+            cached=self.training_cache.get(cache_key)
+            if cached is not None and cached[1]==self._arrays_fingerprint(): # the persisted matrices are still the ones this run produced
+                logging.info("Train/test data and preprocessor config unchanged, reusing the fitted preprocessor and feature matrices")
+                self._save_preprocessor(cached[0])
+                return (
+                    *self._load_arrays(),
+                    self.data_transformation_config.preprocessor_obj_file_path,
+                )
+
+            train_df=read_table(train_path) # csv, parquet or feather, picked from the extension
+            test_df=read_table(test_path)
+
+            logging.info("Read train and test data completed")
+
             target_column_name="math_score"
             numerical_columns = ["writing_score", "reading_score"]
 
@@ -108,15 +186,14 @@ class DataTransformation:# it is used to create a class for data transformation
             ]
             test_arr = np.c_[input_feature_test_arr, np.array(target_feature_test_df)] # it is used to concatenate the input features and target features of the testing dataframe into a single array
 
-            logging.info(f"Saved preprocessing object.")
+            self._save_preprocessor(preprocessing_obj)
 
-            save_object(
+            np.save(self.data_transformation_config.train_array_file_path,train_arr) # it is used to persist the feature matrices so later stages do not re-transform
+            np.save(self.data_transformation_config.test_array_file_path,test_arr)
 
-                file_path=self.data_transformation_config.preprocessor_obj_file_path, # it is used to save the preprocessor object in the specified path
-                # file_path is the path where the object is to be saved
-                obj=preprocessing_obj  # it is used to save the preprocessor object created by the ColumnTransformer class
+            self.training_cache.put(cache_key,(preprocessing_obj,self._arrays_fingerprint()))
 
-            )
+            train_arr,test_arr=self._load_arrays()
 
             return (
                 train_arr,
@@ -124,4 +201,135 @@ class DataTransformation:# it is used to create a class for data transformation
                 self.data_transformation_config.preprocessor_obj_file_path, # it is used to return the path where the preprocessor object is saved
             )
         except Exception as e:
-            raise CustomException(e,sys)
\ No newline at end of file
+            raise CustomException(e,sys)
+
+    def initiate_chunked_data_transformation(self,train_path,test_path,chunksize=100_000):
+        '''
+        This function fits the preprocessor by streaming over the train file and writes memory mapped feature matrices.
+        Imputer medians/modes and the one-hot categories come from value counts merged over all chunks, the scalers
+        are fitted with partial_fit, so peak memory is bounded by the chunk size and the number of distinct values.
+
+        '''
+        try:
+            target_column_name="math_score"
+            preprocessing_obj=self.get_data_transformer_object()
+            column_groups={name:columns for name,_,columns in preprocessing_obj.transformers}
+
+            logging.info("Collecting column statistics chunk by chunk")
+            counts={column:Counter() for columns in column_groups.values() for column in columns}
+            n_train=0
+            first_chunk=None
+            for chunk in iter_table_chunks(train_path,chunksize):
+                if first_chunk is None:
+                    first_chunk=chunk
+                for column,counter in counts.items():
+                    counter.update(chunk[column].value_counts(dropna=True).to_dict())
+                n_train+=len(chunk)
+            n_test=sum(len(chunk) for chunk in iter_table_chunks(test_path,chunksize))
+
+            # the encoder gets every category seen in any chunk, not only the ones present in the first chunk
+            categorical_columns=column_groups["cat_pipelines"]
+            preprocessing_obj.set_params(
+                cat_pipelines__one_hot_encoder__categories=[sorted(counts[column]) for column in categorical_columns]
+            )
+            preprocessing_obj.fit(first_chunk.drop(columns=[target_column_name],axis=1))
+
+            _set_imputer_statistics(preprocessing_obj,counts)
+            for name,pipeline,columns in preprocessing_obj.transformers_:
+                if name=="remainder":
+                    continue
+                pipeline.steps[-1]=(pipeline.steps[-1][0],clone(pipeline.steps[-1][1])) # the scaler is refitted incrementally below
+
+            logging.info("Fitting scalers chunk by chunk")
+            for chunk in iter_table_chunks(train_path,chunksize):
+                for name,pipeline,columns in preprocessing_obj.transformers_:
+                    if name=="remainder":
+                        continue
+                    pipeline.steps[-1][1].partial_fit(pipeline[:-1].transform(chunk[columns]))
+
+            logging.info("Writing memory mapped feature matrices")
+            for path,array_path,n_rows in ((train_path,self.data_transformation_config.train_array_file_path,n_train),
+                                           (test_path,self.data_transformation_config.test_array_file_path,n_test)):
+                n_features=len(preprocessing_obj.get_feature_names_out())
+                array=np.lib.format.open_memmap(array_path,mode="w+",dtype=np.float64,shape=(n_rows,n_features+1))
+                offset=0
+                for chunk in iter_table_chunks(path,chunksize):
+                    features=preprocessing_obj.transform(chunk.drop(columns=[target_column_name],axis=1))
+                    array[offset:offset+len(chunk),:-1]=features.toarray() if hasattr(features,"toarray") else features
+                    array[offset:offset+len(chunk),-1]=chunk[target_column_name].to_numpy()
+                    offset+=len(chunk)
+                array.flush()
+                del array
+
+            self._save_preprocessor(preprocessing_obj)
+
+            return (
+                *self._load_arrays(), # it is used to hand the matrices on without loading them into memory
+                self.data_transformation_config.preprocessor_obj_file_path,
+            )
+        except Exception as e:
+            raise CustomException(e,sys)
+
+    def column_counts(self,preprocessing_obj,df)->dict: # it is used to keep the value counts the imputer statistics are computed from
+        counts={}
+        for name,_,columns in preprocessing_obj.transformers_:
+            if name=="remainder":
+                continue
+            for column in columns:
+                counts[column]=Counter(df[column].value_counts(dropna=True).to_dict())
+        return counts
+
+    def unseen_categories(self,preprocessing_obj,df)->dict: # it is used to find categories the fitted one-hot encoder cannot represent
+        unseen={}
+        for name,pipeline,columns in preprocessing_obj.transformers_:
+            if name=="remainder" or "one_hot_encoder" not in pipeline.named_steps:
+                continue
+            for column,categories in zip(columns,pipeline.named_steps["one_hot_encoder"].categories_):
+                new_values=set(df[column].dropna().unique())-set(categories)
+                if new_values:
+                    unseen[column]=sorted(new_values)
+        return unseen
+
+    def initiate_incremental_data_transformation(self,train_path,test_path,new_train_df,preprocessing_obj,counts,serve=True):
+        '''
+        This function updates a fitted preprocessor with appended train rows instead of refitting it: the value counts
+        get the new rows and the imputer medians/modes are recomputed from them, the scalers continue with partial_fit.
+        With serve=True the updated preprocessor is saved (with its inference plan), otherwise it only carries the
+        statistics forward and the saved preprocessor, which the current model was trained on, is kept.
+        The train and test matrices are rebuilt with the saved preprocessor. counts and preprocessing_obj are updated in place.
+
+        '''
+        try:
+            target_column_name="math_score"
+            unseen=self.unseen_categories(preprocessing_obj,new_train_df)
+            if unseen: # the encoder width, and so the model input, would change
+                raise ValueError(f"New categories {unseen} need a full data transformation")
+
+            if len(new_train_df):
+                for column,counter in counts.items():
+                    counter.update(new_train_df[column].value_counts(dropna=True).to_dict())
+                _set_imputer_statistics(preprocessing_obj,counts)
+                for name,pipeline,columns in preprocessing_obj.transformers_:
+                    if name=="remainder":
+                        continue
+                    pipeline.steps[-1][1].partial_fit(pipeline[:-1].transform(new_train_df[columns]))
+                logging.info(f"Updated the preprocessor statistics with {len(new_train_df)} new rows")
+
+            if serve:
+                self._save_preprocessor(preprocessing_obj)
+                serving_obj=preprocessing_obj
+            else:
+                serving_obj=load_object(self.data_transformation_config.preprocessor_obj_file_path)
+
+            for path,array_path in ((train_path,self.data_transformation_config.train_array_file_path),
+                                    (test_path,self.data_transformation_config.test_array_file_path)):
+                df=read_table(path)
+                features=serving_obj.transform(df.drop(columns=[target_column_name],axis=1))
+                np.save(array_path,np.c_[features,np.array(df[target_column_name])])
+
+            return (
+                *self._load_arrays(),
+                self.data_transformation_config.preprocessor_obj_file_path,
+            )
+        except Exception as e:
+            raise CustomException(e,sys)
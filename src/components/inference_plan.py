@@ -0,0 +1,183 @@
+import json
+import os
+import sys
+
+import numpy as np
+
+from src.exception import CustomException
+from src.serializers import file_sha256 as file_checksum # it is used to tie a plan to the exact preprocessor file it was compiled from
+
+
+def _is_nan(value): # it is used for the categorical columns, the imputer only fills NaN and the encoder rejects None as unknown
+    return isinstance(value,float) and value!=value
+
+
+def _is_missing(value): # it is used for the numerical columns, sklearn converts None to NaN there
+    return value is None or _is_nan(value)
+
+
+class InferencePlan: # This class applies a fitted preprocessor to single rows with plain NumPy, without pandas or sklearn.
+    def __init__(self,n_features,numerical,categorical,source_checksum=None):
+        self.n_features=n_features
+        self.numerical=numerical # list of {"column","fill","mean","scale","position"}
+        self.categorical=categorical # list of {"column","fill","categories","positions","base","values","handle_unknown"}
+        self.source_checksum=source_checksum
+
+        # the one-hot blocks are (0 - mean) / scale everywhere except the hot position, so they are precomputed once
+        self._template=np.zeros(n_features,dtype=np.float64)
+        self._numerical=[(c["column"],c["fill"],c["mean"],c["scale"],c["position"]) for c in numerical]
+        self._categorical=[]
+        for c in categorical:
+            positions=np.asarray(c["positions"],dtype=np.intp)
+            self._template[positions]=np.asarray(c["base"],dtype=np.float64)
+            index={category:(position,value) for category,position,value in zip(c["categories"],c["positions"],c["values"])}
+            self._categorical.append((c["column"],c["fill"],index,c["handle_unknown"]))
+
+    @classmethod
+    def from_preprocessor(cls,preprocessor,source_checksum=None):
+        '''
+        This function compiles a fitted ColumnTransformer of imputer/one-hot/scaler pipelines into an inference plan
+
+        '''
+        try:
+            numerical=[]
+            categorical=[]
+            position=0
+            for name,transformer,columns in preprocessor.transformers_:
+                if transformer=="drop" or name=="remainder":
+                    continue
+                steps=[step for _,step in transformer.steps] if hasattr(transformer,"steps") else [transformer]
+                kinds=[type(step).__name__ for step in steps]
+
+                if "OneHotEncoder" in kinds:
+                    imputer,encoder,scaler=cls._split_steps(steps,kinds,"OneHotEncoder")
+                    if encoder.drop_idx_ is not None or getattr(encoder,"infrequent_categories_",None):
+                        raise ValueError("OneHotEncoder with drop or infrequent categories is not supported by the inference plan")
+                    width=sum(len(categories) for categories in encoder.categories_)
+                    mean=scaler.mean_ if scaler is not None and scaler.with_mean else np.zeros(width) # mean_ is fitted even when with_mean=False
+                    scale=scaler.scale_ if scaler is not None and scaler.with_std else np.ones(width)
+                    offset=0
+                    for i,column in enumerate(columns):
+                        categories=encoder.categories_[i]
+                        block=slice(offset,offset+len(categories))
+                        categorical.append({
+                            "column": column,
+                            "fill": None if imputer is None else cls._python_value(imputer.statistics_[i]),
+                            "categories": [cls._python_value(category) for category in categories],
+                            "positions": list(range(position+block.start,position+block.stop)),
+                            "base": ((0.0-mean[block])/scale[block]).tolist(),
+                            "values": ((1.0-mean[block])/scale[block]).tolist(),
+                            "handle_unknown": encoder.handle_unknown,
+                        })
+                        offset+=len(categories)
+                    position+=width
+                else:
+                    imputer,_,scaler=cls._split_steps(steps,kinds,None)
+                    for i,column in enumerate(columns):
+                        numerical.append({
+                            "column": column,
+                            "fill": None if imputer is None else float(imputer.statistics_[i]),
+                            "mean": float(scaler.mean_[i]) if scaler is not None and scaler.with_mean else 0.0,
+                            "scale": float(scaler.scale_[i]) if scaler is not None and scaler.with_std else 1.0,
+                            "position": position+i,
+                        })
+                    position+=len(columns)
+
+            return cls(position,numerical,categorical,source_checksum=source_checksum)
+
+        except Exception as e:
+            raise CustomException(e,sys)
+
+    @staticmethod
+    def _split_steps(steps,kinds,encoder_kind):
+        supported={"SimpleImputer","StandardScaler"} | ({encoder_kind} if encoder_kind else set())
+        unsupported=[kind for kind in kinds if kind not in supported]
+        if unsupported:
+            raise ValueError(f"Unsupported preprocessing steps for the inference plan: {unsupported}")
+        by_kind=dict(zip(kinds,steps))
+        return by_kind.get("SimpleImputer"),by_kind.get(encoder_kind),by_kind.get("StandardScaler")
+
+    @staticmethod
+    def _python_value(value):
+        return value.item() if isinstance(value,np.generic) else value
+
+    def transform_record(self,record: dict)->np.ndarray:
+        '''
+        This function turns one record into a (1, n_features) array identical to preprocessor.transform
+
+        '''
+        row=self._template.copy()
+        for column,fill,mean,scale,position in self._numerical:
+            value=record.get(column)
+            value=fill if _is_missing(value) else float(value)
+            row[position]=(value-mean)/scale
+
+        for column,fill,index,handle_unknown in self._categorical:
+            value=record.get(column)
+            if _is_nan(value):
+                value=fill
+            hot=index.get(value)
+            if hot is None:
+                if handle_unknown=="ignore":
+                    continue
+                raise ValueError(f"Found unknown category {value!r} in column {column!r}")
+            row[hot[0]]=hot[1]
+        return row.reshape(1,-1)
+
+    def transform_records(self,records)->np.ndarray:
+        return np.vstack([self.transform_record(record) for record in records])
+
+    def transform(self,features)->np.ndarray:
+        '''
+        This function transforms a whole DataFrame (or a dict of columns) at once, column by column,
+        with the same result as preprocessor.transform; it lets the plan stand in for the preprocessor
+
+        '''
+        n_rows=len(features[self._numerical[0][0]] if self._numerical else features[self._categorical[0][0]])
+        out=np.tile(self._template,(n_rows,1))
+        for column,fill,mean,scale,position in self._numerical:
+            values=np.asarray(features[column],dtype=np.float64)
+            if fill is not None:
+                values=np.where(np.isnan(values),fill,values)
+            out[:,position]=(values-mean)/scale
+
+        for column,fill,index,handle_unknown in self._categorical:
+            hots=[index.get(fill if _is_nan(value) else value) for value in features[column]]
+            rows=[row for row,hot in enumerate(hots) if hot is not None]
+            if len(rows)<n_rows and handle_unknown!="ignore":
+                unknown=next(value for value,hot in zip(features[column],hots) if hot is None)
+                raise ValueError(f"Found unknown category {unknown!r} in column {column!r}")
+            if rows:
+                out[rows,[hots[row][0] for row in rows]]=[hots[row][1] for row in rows]
+        return out
+
+    def sample_record(self)->dict: # it is used to build a valid record from the fitted values, e.g. for a warm-up prediction
+        record={c["column"]:c["fill"] if c["fill"] is not None else c["mean"] for c in self.numerical}
+        record.update({c["column"]:c["fill"] if c["fill"] is not None else c["categories"][0] for c in self.categorical})
+        return record
+
+    def to_dict(self)->dict:
+        return {
+            "n_features": self.n_features,
+            "numerical": self.numerical,
+            "categorical": self.categorical,
+            "source_checksum": self.source_checksum,
+        }
+
+    def save(self,file_path):
+        try:
+            os.makedirs(os.path.dirname(file_path),exist_ok=True)
+            with open(file_path,"w",encoding="utf-8") as file_obj:
+                json.dump(self.to_dict(),file_obj,indent=1)
+
+        except Exception as e:
+            raise CustomException(e,sys)
+
+    @classmethod
+    def load(cls,file_path):
+        try:
+            with open(file_path,encoding="utf-8") as file_obj:
+                return cls(**json.load(file_obj))
+
+        except Exception as e:
+            raise CustomException(e,sys)
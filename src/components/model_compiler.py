@@ -0,0 +1,315 @@
+import io
+import json
+import os
+import sys
+import tempfile
+from dataclasses import dataclass
+
+import numpy as np
+
+from src.components.inference_plan import InferencePlan,file_checksum
+from src.exception import CustomException
+from src.logger import logging
+
+
+class CompiledModel: # This class predicts with a trained model exported to flat NumPy arrays, without sklearn, xgboost or catboost.
+    '''
+    kind "linear":            coef, intercept, the prediction is one dot product
+    kind "trees":             node tables (feature, threshold, left, right, value, default_left) of every tree, walked
+                              level by level for all rows and trees at once; leaves point to themselves
+    kind "oblivious_trees":   CatBoost symmetric trees, the leaf index is the bits of depth (feature > border) tests
+
+    The tree predictions are combined as base + scale * sum, mean or weighted median (AdaBoost) over the trees.
+    '''
+    BLOCK_ELEMENTS=1<<20 # rows x trees walked at once, it bounds the memory of the node index matrix
+
+    def __init__(self,kind,arrays,meta):
+        self.kind=kind
+        self.arrays=arrays
+        self.meta=meta
+        self.plan=InferencePlan(**meta["plan"]) if meta.get("plan") else None
+
+    @property
+    def model_checksum(self):
+        return self.meta.get("model_checksum")
+
+    def predict(self,X)->np.ndarray:
+        '''
+        This function predicts on a (n_samples, n_features) array transformed by the preprocessor (or its plan)
+
+        '''
+        X=np.asarray(X,dtype=np.float64)
+        if self.kind=="linear":
+            return X@self.arrays["coef"]+self.arrays["intercept"]
+        step=max(1,self.BLOCK_ELEMENTS//max(1,self.meta["n_trees"]))
+        per_tree=np.vstack([self._tree_values(X[start:start+step]) for start in range(0,len(X),step)]) if len(X) else np.zeros((0,self.meta["n_trees"]))
+        if self.meta.get("float32_sum"): # xgboost adds the trees one by one onto base_score in float32
+            margin=np.concatenate([np.full((len(per_tree),1),self.meta["base"]),per_tree],axis=1).astype(np.float32)
+            return np.cumsum(margin,axis=1,dtype=np.float32)[:,-1].astype(np.float64)
+        return self.meta["base"]+self.meta["scale"]*self._combine(per_tree)
+
+    def _tree_values(self,X)->np.ndarray:
+        X=X.astype(np.float32).astype(np.float64) # the trees were fitted on float32 inputs, thresholds compare against those values
+        arrays=self.arrays
+        if self.kind=="oblivious_trees":
+            bits=X[:,arrays["split_feature"]]>arrays["split_border"] # (rows, trees, depth)
+            leaf=bits.astype(np.int64)@(1<<np.arange(bits.shape[2],dtype=np.int64))
+            return arrays["leaf_values"][np.arange(leaf.shape[1]),leaf]
+
+        node=np.broadcast_to(arrays["roots"],(len(X),len(arrays["roots"]))).copy()
+        rows=np.arange(len(X))[:,None]
+        less_equal=self.meta["comparison"]=="<="
+        for _ in range(self.meta["max_depth"]):
+            value=X[rows,arrays["feature"][node]]
+            threshold=arrays["threshold"][node]
+            go_left=value<=threshold if less_equal else value<threshold
+            go_left=np.where(np.isnan(value),arrays["default_left"][node],go_left)
+            node=np.where(go_left,arrays["left"][node],arrays["right"][node])
+        return arrays["value"][node]
+
+    def _combine(self,per_tree)->np.ndarray:
+        combine=self.meta["combine"]
+        if combine=="sum":
+            return per_tree.sum(axis=1)
+        if combine=="mean":
+            return per_tree.mean(axis=1)
+        # weighted median, as AdaBoostRegressor.predict
+        sorted_index=np.argsort(per_tree,axis=1)
+        weight_cdf=np.cumsum(self.arrays["weights"][sorted_index],axis=1,dtype=np.float64)
+        median_index=(weight_cdf>=0.5*weight_cdf[:,-1][:,None]).argmax(axis=1)
+        rows=np.arange(len(per_tree))
+        return per_tree[rows,sorted_index[rows,median_index]]
+
+    @classmethod
+    def from_estimator(cls,model,plan=None,model_checksum=None):
+        '''
+        This function exports a fitted regressor: linear models, a decision tree, random forest, gradient boosting,
+        AdaBoost over trees, XGBoost (gbtree) or CatBoost. Anything else raises ValueError.
+
+        '''
+        name=type(model).__name__
+        meta={"source_class": f"{type(model).__module__}.{type(model).__qualname__}","base": 0.0,"scale": 1.0,"combine": "sum"}
+        if hasattr(model,"coef_") and hasattr(model,"intercept_") and np.ndim(model.coef_)==1:
+            kind,arrays="linear",{"coef": np.asarray(model.coef_,dtype=np.float64),"intercept": np.float64(model.intercept_)}
+        elif name=="DecisionTreeRegressor":
+            kind,arrays=cls._sklearn_trees([model],meta)
+        elif name in ("RandomForestRegressor","ExtraTreesRegressor"):
+            kind,arrays=cls._sklearn_trees(model.estimators_,meta)
+            meta["combine"]="mean"
+        elif name=="GradientBoostingRegressor":
+            if model.init_=="zero":
+                base=0.0
+            elif type(model.init_).__name__=="DummyRegressor":
+                base=float(np.ravel(model.init_.constant_)[0])
+            else:
+                raise ValueError("Only the default (mean) or zero init of GradientBoostingRegressor can be compiled")
+            kind,arrays=cls._sklearn_trees(model.estimators_[:,0],meta)
+            meta.update(base=base,scale=float(model.learning_rate))
+        elif name=="AdaBoostRegressor":
+            if not all(type(member).__name__=="DecisionTreeRegressor" for member in model.estimators_):
+                raise ValueError("Only AdaBoostRegressor over decision trees can be compiled")
+            kind,arrays=cls._sklearn_trees(model.estimators_,meta)
+            arrays["weights"]=np.asarray(model.estimator_weights_[:len(model.estimators_)],dtype=np.float64)
+            meta["combine"]="weighted_median"
+        elif name=="XGBRegressor":
+            kind,arrays=cls._xgboost_trees(model,meta)
+        elif name=="CatBoostRegressor":
+            kind,arrays=cls._catboost_trees(model,meta)
+        else:
+            raise ValueError(f"{name} cannot be compiled to a NumPy predictor")
+
+        meta["kind"]=kind
+        meta["n_trees"]=int(len(arrays["roots"])) if "roots" in arrays else int(len(arrays.get("leaf_values",())))
+        meta["plan"]=plan.to_dict() if plan is not None else None
+        meta["model_checksum"]=model_checksum
+        return cls(kind,arrays,meta)
+
+    @staticmethod
+    def _node_tables(trees,meta,comparison):
+        '''
+        This function concatenates per tree node lists (feature, threshold, left, right, value, default_left, depth)
+        into flat arrays; child indices become global and leaves get themselves as children
+
+        '''
+        columns={key:[] for key in ("feature","threshold","left","right","value","default_left")}
+        roots=[]
+        offset=0
+        max_depth=0
+        for feature,threshold,left,right,value,default_left,depth in trees:
+            is_leaf=left<0
+            n_nodes=len(left)
+            own=np.arange(offset,offset+n_nodes)
+            columns["feature"].append(np.where(is_leaf,0,feature))
+            columns["threshold"].append(np.where(is_leaf,np.inf,threshold)) # a leaf always "goes left" to itself
+            columns["left"].append(np.where(is_leaf,own,left+offset))
+            columns["right"].append(np.where(is_leaf,own,right+offset))
+            columns["value"].append(value)
+            columns["default_left"].append(default_left)
+            roots.append(offset)
+            offset+=n_nodes
+            max_depth=max(max_depth,depth)
+        arrays={
+            "feature": np.concatenate(columns["feature"]).astype(np.int64),
+            "threshold": np.concatenate(columns["threshold"]).astype(np.float64),
+            "left": np.concatenate(columns["left"]).astype(np.int64),
+            "right": np.concatenate(columns["right"]).astype(np.int64),
+            "value": np.concatenate(columns["value"]).astype(np.float64),
+            "default_left": np.concatenate(columns["default_left"]).astype(bool),
+            "roots": np.asarray(roots,dtype=np.int64),
+        }
+        meta.update(max_depth=int(max_depth),comparison=comparison)
+        return "trees",arrays
+
+    @classmethod
+    def _sklearn_trees(cls,estimators,meta):
+        trees=[]
+        for estimator in estimators:
+            tree=estimator.tree_
+            trees.append((tree.feature,tree.threshold,tree.children_left,tree.children_right,
+                          tree.value[:,0,0],np.ones(tree.node_count,dtype=bool),tree.max_depth))
+        return cls._node_tables(trees,meta,"<=") # sklearn goes left when x <= threshold
+
+    @classmethod
+    def _xgboost_trees(cls,model,meta):
+        dump=json.loads(model.get_booster().save_raw("json"))
+        learner=dump["learner"]
+        objective=learner["objective"]["name"]
+        if objective not in ("reg:squarederror","reg:absoluteerror","reg:pseudohubererror"):
+            raise ValueError(f"XGBoost objective {objective} cannot be compiled, only identity link regressors")
+        booster=learner["gradient_booster"]
+        if booster.get("name","gbtree")!="gbtree":
+            raise ValueError("Only the gbtree booster can be compiled")
+        trees=booster["model"]["trees"]
+        best_iteration=learner.get("attributes",{}).get("best_iteration") # set by early stopping, predict reads it whatever the wrapper parameters say
+        if best_iteration is not None: # predict uses the trees up to the best iteration only
+            trees=trees[:int(booster["model"]["iteration_indptr"][int(best_iteration)+1])]
+        nodes=[]
+        for tree in trees:
+            left=np.asarray(tree["left_children"],dtype=np.int64)
+            right=np.asarray(tree["right_children"],dtype=np.int64)
+            conditions=np.asarray(tree["split_conditions"],dtype=np.float32).astype(np.float64)
+            nodes.append((np.asarray(tree["split_indices"],dtype=np.int64),conditions,left,right,
+                          conditions,np.asarray(tree["default_left"],dtype=bool),cls._depth(left,right)))
+        meta["base"]=float(str(learner["learner_model_param"]["base_score"]).strip("[]"))
+        meta["float32_sum"]=True
+        return cls._node_tables(nodes,meta,"<") # xgboost goes left when x < split condition, a leaf keeps its value in split_conditions
+
+    @staticmethod
+    def _depth(left,right):
+        depth=0
+        level=[0]
+        while True:
+            level=[child for node in level for child in (left[node],right[node]) if child>=0]
+            if not level:
+                return depth
+            depth+=1
+
+    @classmethod
+    def _catboost_trees(cls,model,meta):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            json_path=os.path.join(tmp_dir,"model.json")
+            model.save_model(json_path,format="json")
+            with open(json_path,encoding="utf-8") as file_obj:
+                dump=json.load(file_obj)
+        if dump["features_info"].get("categorical_features"):
+            raise ValueError("CatBoost models with categorical features cannot be compiled")
+        flat_index=[feature["flat_feature_index"] for feature in dump["features_info"]["float_features"]]
+        trees=dump["oblivious_trees"]
+        depth=max((len(tree["splits"]) for tree in trees),default=0)
+        split_feature=np.zeros((len(trees),depth),dtype=np.int64)
+        split_border=np.full((len(trees),depth),np.inf) # a padded level is never true, so it keeps leaf bit 0
+        leaf_values=np.zeros((len(trees),1<<depth))
+        for i,tree in enumerate(trees):
+            for level,split in enumerate(tree["splits"]):
+                split_feature[i,level]=flat_index[split["float_feature_index"]]
+                split_border[i,level]=np.float64(np.float32(split["border"]))
+            leaf_values[i,:len(tree["leaf_values"])]=tree["leaf_values"]
+        scale,bias=dump.get("scale_and_bias",[1.0,[0.0]])
+        meta.update(base=float(np.ravel(bias)[0]),scale=float(scale))
+        return "oblivious_trees",{"split_feature": split_feature,"split_border": split_border,"leaf_values": leaf_values}
+
+    def save(self,file_path):
+        try:
+            os.makedirs(os.path.dirname(file_path),exist_ok=True)
+            buffer=io.BytesIO()
+            np.savez(buffer,__meta__=np.array(json.dumps(self.meta)),**self.arrays) # uncompressed, it loads without a copy per array
+            tmp_path=f"{file_path}.tmp"
+            with open(tmp_path,"wb") as file_obj:
+                file_obj.write(buffer.getvalue())
+            os.replace(tmp_path,file_path)
+
+        except Exception as e:
+            raise CustomException(e,sys)
+
+    @classmethod
+    def load(cls,file_path):
+        try:
+            with np.load(file_path,allow_pickle=False) as data: # plain arrays only, loading never executes code
+                meta=json.loads(str(data["__meta__"]))
+                arrays={key:data[key] for key in data.files if key!="__meta__"}
+            return cls(meta["kind"],arrays,meta)
+
+        except Exception as e:
+            raise CustomException(e,sys)
+
+
+@dataclass
+class ModelCompilerConfig: # it is used to store the artifact paths of the export step
+    model_file_path: str=os.path.join("artifacts","model.pkl")
+    preprocessor_file_path: str=os.path.join("artifacts","proprocessor.pkl")
+    compiled_model_file_path: str=os.path.join("artifacts","compiled_model.npz")
+    test_data_path: str=os.path.join("artifacts","test.csv")
+    target_column: str="math_score"
+    tolerance: float=1e-6 # largest absolute difference to the original predictions accepted on test.csv
+
+
+class ModelCompiler: # This class exports model.pkl + proprocessor.pkl to a NumPy-only artifact and checks it against the originals.
+    def __init__(self,config: ModelCompilerConfig=None):
+        self.config=config or ModelCompilerConfig()
+
+    def _remove_stale(self): # it is used so that the app never serves a compiled model of an earlier training run
+        if os.path.exists(self.config.compiled_model_file_path):
+            os.remove(self.config.compiled_model_file_path)
+
+    def initiate_model_compilation(self)->dict:
+        '''
+        This function compiles the saved model and preprocessor, verifies the predictions on test.csv and saves the
+        compiled artifact only when they match within the tolerance. It returns the parity report.
+
+        '''
+        from src.utils import load_object,read_table # training side imports, the serving process only needs CompiledModel
+
+        try:
+            config=self.config
+            model=load_object(config.model_file_path)
+            preprocessor=load_object(config.preprocessor_file_path)
+            plan=InferencePlan.from_preprocessor(preprocessor,source_checksum=file_checksum(config.preprocessor_file_path))
+            try:
+                compiled=CompiledModel.from_estimator(model,plan=plan,model_checksum=file_checksum(config.model_file_path))
+            except ValueError as error: # unsupported models are served from model.pkl as before
+                self._remove_stale()
+                logging.warning(f"Model not compiled: {error}")
+                return {"kind": None,"passed": False,"reason": str(error)}
+
+            test_df=read_table(config.test_data_path)
+            features=test_df.drop(columns=[config.target_column],errors="ignore")
+            expected=np.asarray(model.predict(preprocessor.transform(features)),dtype=np.float64).ravel()
+            actual=compiled.predict(plan.transform(features))
+            max_abs_diff=float(np.max(np.abs(expected-actual))) if len(expected) else 0.0
+            report={"kind": compiled.kind,"rows": int(len(expected)),"max_abs_diff": max_abs_diff,"tolerance": config.tolerance,
+                    "passed": max_abs_diff<=config.tolerance}
+
+            if report["passed"]:
+                compiled.save(config.compiled_model_file_path)
+                logging.info(f"Saved compiled model: {report}")
+            else:
+                self._remove_stale()
+                logging.warning(f"Compiled model does not match the original predictions, not saving it: {report}")
+            return report
+
+        except Exception as e:
+            raise CustomException(e,sys)
+
+
+if __name__=="__main__":
+    print(ModelCompiler().initiate_model_compilation())
@@ -1,8 +1,10 @@
+import json
 import os
 import sys
 from dataclasses import dataclass
 
 from catboost import CatBoostRegressor
+from sklearn.base import clone
 from sklearn.ensemble import (
     AdaBoostRegressor,
     GradientBoostingRegressor,
@@ -17,16 +19,118 @@ from xgboost import XGBRegressor
 from src.exception import CustomException
 from src.logger import logging
 
-from src.utils import save_object,evaluate_models # it is used to save the object in the specified path and evaluate the models
+from src.components.training_cache import TrainingCache
+from src.utils import save_object,load_object,fit_estimator,evaluate_models,measure_serving_cost # it is used to save the object in the specified path and evaluate the models
+
+CONTINUABLE_MODELS=("XGBRegressor","CatBoostRegressor","GradientBoostingRegressor") # boosting models that can add rounds to a fitted model
 
 @dataclass
 class ModelTrainerConfig: # it is used to create a class with the specified attributes and default values
     trained_model_file_path=os.path.join("artifacts","model.pkl") # it is used to create a file path for the trained model to be saved in the artifacts folder
+    n_jobs=int(os.environ.get("TRAIN_N_JOBS","-1")) # -1 uses every core, models run in parallel and folds share the remaining cores
+    search_strategy=os.environ.get("TRAIN_SEARCH","grid") # "grid", "random" or "halving"
+    n_iter=int(os.environ.get("TRAIN_N_ITER","20")) # number of candidates per model for the random search
+    time_budget=float(os.environ["TRAIN_TIME_BUDGET"]) if os.environ.get("TRAIN_TIME_BUDGET") else None # wall clock seconds for the search, shared evenly by the models
+    early_stopping_rounds=int(os.environ.get("TRAIN_EARLY_STOPPING_ROUNDS","0")) # 0 disables early stopping of XGBoost and CatBoost fits
+    sparse_density=float(os.environ.get("TRAIN_SPARSE_DENSITY","0.5")) # linear models are searched on CSR up to this share of non-zero features, 0 disables
+    tradeoff_file_path=os.path.join("artifacts","model_tradeoffs.json") # it is used to save the score/latency/size table of every model next to model.pkl
+    max_p99_ms=float(os.environ["SERVE_MAX_P99_MS"]) if os.environ.get("SERVE_MAX_P99_MS") else None # single-row p99 latency budget
+    max_model_bytes=int(os.environ["SERVE_MAX_MODEL_BYTES"]) if os.environ.get("SERVE_MAX_MODEL_BYTES") else None # serialized size budget
+    min_r2=0.6 # models below this test score are never shipped
+    latency_calls=int(os.environ.get("SERVE_LATENCY_CALLS","200")) # single-row predict calls timed per model
 
 class ModelTrainer: # it is used to create a class for model training
     def __init__(self):
         self.model_trainer_config=ModelTrainerConfig() #  it is used to create an object of the ModelTrainerConfig class
+        self.training_cache=TrainingCache() # it is used to skip grid points that were already cross validated on the same data
+
+
+    def get_models(self): # it is used to get the candidate models, the benchmarks fit the same estimators
+        return {
+            "Random Forest": RandomForestRegressor(),
+            "Decision Tree": DecisionTreeRegressor(),
+            "Gradient Boosting": GradientBoostingRegressor(),
+            "Linear Regression": LinearRegression(),
+            "XGBRegressor": XGBRegressor(),
+            "CatBoosting Regressor": CatBoostRegressor(verbose=False),
+            "AdaBoost Regressor": AdaBoostRegressor(),
+        }
+
+    def get_params(self): # it is used to get the hyperparameter grid of every candidate model
+        return {
+            "Decision Tree": {
+                'criterion':['squared_error', 'friedman_mse', 'absolute_error', 'poisson'],
+                # 'splitter':['best','random'],
+                # 'max_features':['sqrt','log2'],
+            },
+            "Random Forest":{
+                # 'criterion':['squared_error', 'friedman_mse', 'absolute_error', 'poisson'],
+             
+                # 'max_features':['sqrt','log2',None],
+                'n_estimators': [8,16,32,64,128,256]
+            },
+            "Gradient Boosting":{
+                # 'loss':['squared_error', 'huber', 'absolute_error', 'quantile'],
+                'learning_rate':[.1,.01,.05,.001],
+                'subsample':[0.6,0.7,0.75,0.8,0.85,0.9],
+                # 'criterion':['squared_error', 'friedman_mse'],
+                # 'max_features':['auto','sqrt','log2'],
+                'n_estimators': [8,16,32,64,128,256]
+            },
+            "Linear Regression":{},
+            "XGBRegressor":{
+                'learning_rate':[.1,.01,.05,.001],
+                'n_estimators': [8,16,32,64,128,256]
+            },
+            "CatBoosting Regressor":{
+                'depth': [6,8,10],
+                'learning_rate': [0.01, 0.05, 0.1],
+                'iterations': [30, 50, 100]
+            },
+            "AdaBoost Regressor":{
+                'learning_rate':[.1,.01,0.5,.001],
+                # 'loss':['linear','square','exponential'],
+                'n_estimators': [8,16,32,64,128,256]
+            }
+            
+        }
+
+    def measure_tradeoffs(self,models,model_report,X_test):
+        '''
+        This function measures the serving latency, throughput and serialized size of every fitted model,
+        one model at a time so that the timings do not compete for the cores
+
+        '''
+        config=self.model_trainer_config
+        tradeoffs=[]
+        for name,model in models.items():
+            cost=measure_serving_cost(model,X_test,single_calls=config.latency_calls)
+            within_budget=(
+                (config.max_p99_ms is None or cost["p99_ms"]<=config.max_p99_ms)
+                and (config.max_model_bytes is None or cost["serialized_bytes"]<=config.max_model_bytes)
+            )
+            tradeoffs.append({"model": name,"test_r2": model_report[name],**cost,"within_budget": within_budget})
+            logging.info(f"{name}: r2 {model_report[name]:.4f}, p99 {cost['p99_ms']:.3f}ms, {cost['serialized_bytes']} bytes")
+        return sorted(tradeoffs,key=lambda row: row["test_r2"],reverse=True)
+
+    def select_model(self,tradeoffs):
+        '''
+        This function picks the best test r2 among the models within the serving budget and saves the tradeoff table
+
+        '''
+        config=self.model_trainer_config
+        eligible=[row for row in tradeoffs if row["within_budget"] and row["test_r2"]>=config.min_r2]
+        best=eligible[0]["model"] if eligible else None
+        for row in tradeoffs:
+            row["selected"]=row["model"]==best
 
+        os.makedirs(os.path.dirname(config.tradeoff_file_path),exist_ok=True)
+        with open(config.tradeoff_file_path,"w",encoding="utf-8") as file_obj:
+            json.dump({"max_p99_ms": config.max_p99_ms,"max_model_bytes": config.max_model_bytes,"min_r2": config.min_r2,"models": tradeoffs},file_obj,indent=1)
+
+        if best is None: # it is used to check if no model reaches the score floor within the budget
+            raise ValueError(f"No best model found within the serving budget, see {config.tradeoff_file_path}")
+        return best
 
     def initiate_model_trainer(self,train_array,test_array): # it is used to create a method for model training
         try:
@@ -37,70 +141,24 @@ class ModelTrainer: # it is used to create a class for model training
                 test_array[:,:-1],
                 test_array[:,-1]
             )
-            models = {
-                "Random Forest": RandomForestRegressor(),
-                "Decision Tree": DecisionTreeRegressor(),
-                "Gradient Boosting": GradientBoostingRegressor(),
-                "Linear Regression": LinearRegression(),
-                "XGBRegressor": XGBRegressor(),
-                "CatBoosting Regressor": CatBoostRegressor(verbose=False),
-                "AdaBoost Regressor": AdaBoostRegressor(),
-            }
-            params={
-                "Decision Tree": {
-                    'criterion':['squared_error', 'friedman_mse', 'absolute_error', 'poisson'],
-                    # 'splitter':['best','random'],
-                    # 'max_features':['sqrt','log2'],
-                },
-                "Random Forest":{
-                    # 'criterion':['squared_error', 'friedman_mse', 'absolute_error', 'poisson'],
-                 
-                    # 'max_features':['sqrt','log2',None],
-                    'n_estimators': [8,16,32,64,128,256]
-                },
-                "Gradient Boosting":{
-                    # 'loss':['squared_error', 'huber', 'absolute_error', 'quantile'],
-                    'learning_rate':[.1,.01,.05,.001],
-                    'subsample':[0.6,0.7,0.75,0.8,0.85,0.9],
-                    # 'criterion':['squared_error', 'friedman_mse'],
-                    # 'max_features':['auto','sqrt','log2'],
-                    'n_estimators': [8,16,32,64,128,256]
-                },
-                "Linear Regression":{},
-                "XGBRegressor":{
-                    'learning_rate':[.1,.01,.05,.001],
-                    'n_estimators': [8,16,32,64,128,256]
-                },
-                "CatBoosting Regressor":{
-                    'depth': [6,8,10],
-                    'learning_rate': [0.01, 0.05, 0.1],
-                    'iterations': [30, 50, 100]
-                },
-                "AdaBoost Regressor":{
-                    'learning_rate':[.1,.01,0.5,.001],
-                    # 'loss':['linear','square','exponential'],
-                    'n_estimators': [8,16,32,64,128,256]
-                }
-                
-            }
-
+            models=self.get_models()
+            params=self.get_params()
 
             model_report:dict=evaluate_models(X_train=X_train,y_train=y_train,X_test=X_test,y_test=y_test,
-                                             models=models,param=params) # it is used to evaluate the models using the training and testing data and return the model report
+                                             models=models,param=params,
+                                             n_jobs=self.model_trainer_config.n_jobs,
+                                             search=self.model_trainer_config.search_strategy,
+                                             n_iter=self.model_trainer_config.n_iter,
+                                             time_budget=self.model_trainer_config.time_budget,
+                                             early_stopping_rounds=self.model_trainer_config.early_stopping_rounds,
+                                             sparse_density=self.model_trainer_config.sparse_density,
+                                             cache=self.training_cache) # it is used to evaluate the models using the training and testing data and return the model report
+            # the entries of models are now the fitted best estimators of each search
             
-            ## To get best model score from dict
-            best_model_score = max(sorted(model_report.values()))
-
-            ## To get best model name from dict
-
-            best_model_name = list(model_report.keys())[
-                list(model_report.values()).index(best_model_score)
-            ]
+            tradeoffs=self.measure_tradeoffs(models,model_report,X_test)
+            best_model_name=self.select_model(tradeoffs)
             best_model = models[best_model_name]
-
-            if best_model_score<0.6: # it is used to check if the best model score is less than 0.6
-                raise CustomException("No best model found")
-            logging.info(f"Best found model on both training and testing dataset")
+            logging.info(f"Best found model on both training and testing dataset: {best_model_name}")
 
             save_object( # it is used to save the best model in the specified path
                 file_path=self.model_trainer_config.trained_model_file_path,
@@ -117,4 +175,64 @@ class ModelTrainer: # it is used to create a class for model training
 
             
         except Exception as e:
-            raise CustomException(e,sys)
\ No newline at end of file
+            raise CustomException(e,sys)
+
+    def continue_training(self,model,X_new,y_new,extra_estimators):
+        '''
+        This function adds extra_estimators boosting rounds fitted on the new rows to a fitted XGBoost, CatBoost or
+        gradient boosting model, keeping its hyperparameters. It returns None for models that cannot continue.
+
+        '''
+        name=type(model).__name__
+        if name not in CONTINUABLE_MODELS:
+            return None
+        if name=="XGBRegressor":
+            booster=model.get_booster()
+            best_iteration=booster.attr("best_iteration") # set by early stopping, also when the wrapper parameters no longer say so
+            if best_iteration is not None:
+                booster=booster[:int(best_iteration)+1] # the rounds after the best iteration were never used for predictions
+            params={**model.get_params(),"n_estimators": extra_estimators,"early_stopping_rounds": None}
+            return type(model)(**params).fit(X_new,y_new,xgb_model=booster,verbose=False)
+        if name=="CatBoostRegressor":
+            params={**model.get_params(),"iterations": extra_estimators}
+            return type(model)(**params).fit(X_new,y_new,init_model=model)
+        model.set_params(warm_start=True,n_estimators=model.n_estimators+extra_estimators).fit(X_new,y_new) # gradient boosting
+        return model.set_params(warm_start=False)
+
+    def initiate_incremental_model_trainer(self,train_array,test_array,n_new_rows,strategy="refit",extra_estimators=20):
+        '''
+        This function updates the saved model without a hyperparameter search. With strategy "refit" the model is
+        refitted on all train rows with the hyperparameters the last search picked; with "continue" boosting models
+        add extra_estimators rounds fitted on the n_new_rows appended at the end of train_array (other models are
+        refitted). The model is saved only if its test r2 reaches min_r2; the test r2 is returned either way.
+
+        '''
+        try:
+            X_train,y_train,X_test,y_test=(
+                train_array[:,:-1],
+                train_array[:,-1],
+                test_array[:,:-1],
+                test_array[:,-1]
+            )
+            current_model=load_object(self.model_trainer_config.trained_model_file_path)
+
+            model=None
+            if strategy=="continue" and n_new_rows:
+                model=self.continue_training(current_model,X_train[-n_new_rows:],y_train[-n_new_rows:],extra_estimators)
+            if model is None:
+                model=clone(current_model)
+                if not self.model_trainer_config.early_stopping_rounds and "early_stopping_rounds" in model.get_params():
+                    model.set_params(early_stopping_rounds=None) # XGBoost cannot early stop without the validation split
+                fit_estimator(model,X_train,y_train,self.model_trainer_config.early_stopping_rounds)
+                strategy="refit"
+            logging.info(f"Updated {type(model).__name__} incrementally ({strategy}) with {n_new_rows} new rows")
+
+            r2_square=r2_score(y_test,model.predict(X_test))
+            if r2_square>=self.model_trainer_config.min_r2:
+                save_object(file_path=self.model_trainer_config.trained_model_file_path,obj=model)
+            else:
+                logging.info(f"Incremental model r2 {r2_square:.4f} is below {self.model_trainer_config.min_r2}, the saved model is kept")
+            return r2_square
+
+        except Exception as e:
+            raise CustomException(e,sys)
@@ -0,0 +1,148 @@
+import hashlib
+import json
+import os
+import sys
+import threading
+import time
+from dataclasses import dataclass
+
+import numpy as np
+
+from src.components.inference_plan import file_checksum
+from src import serializers
+from src.exception import CustomException
+from src.logger import logging
+from src.utils import load_object,save_object
+
+
+def hash_arrays(*arrays,block_bytes=64*1024*1024)->str: # it is used to fingerprint training matrices by content
+    digest=hashlib.sha256()
+    for array in arrays:
+        array=np.asarray(array)
+        if array.ndim==0:
+            array=np.ascontiguousarray(array)
+        digest.update(str((array.dtype.str,array.shape)).encode())
+        step=max(1,block_bytes//max(1,array[:1].nbytes))
+        for start in range(0,len(array),step): # row blocks hash the same bytes without a contiguous copy of a whole memory map
+            digest.update(memoryview(np.ascontiguousarray(array[start:start+step])).cast("B"))
+    return digest.hexdigest()
+
+
+def hash_params(obj)->str: # it is used to fingerprint configuration such as param grids and estimator params
+    return hashlib.sha256(json.dumps(obj,sort_keys=True,default=repr).encode()).hexdigest()
+
+
+def estimator_fingerprint(estimator)->str: # it is used to fingerprint an unfitted estimator by its class and parameters
+    params=estimator.get_params(deep=True)
+    return hash_params({"class": f"{type(estimator).__module__}.{type(estimator).__qualname__}","params": params})
+
+
+@dataclass
+class TrainingCacheConfig: # it is used to store where the cache lives and how large it may grow
+    cache_dir: str=os.path.join("artifacts","cache")
+    max_size_bytes: int=int(os.environ.get("TRAIN_CACHE_MAX_BYTES",str(512*1024*1024)))
+    enabled: bool=os.environ.get("TRAIN_CACHE","1")!="0"
+
+
+class TrainingCache: # This class is a content addressed store for fitted transformers, CV scores and fitted estimators.
+    def __init__(self,config: TrainingCacheConfig=None):
+        self.config=config or TrainingCacheConfig()
+        self.index_path=os.path.join(self.config.cache_dir,"index.json")
+        self._lock=threading.Lock()
+        self._index=None
+        self.hits=0
+        self.misses=0
+
+    @staticmethod
+    def key(namespace,*parts)->str:
+        '''
+        This function builds a cache key from a namespace (the stage) and the fingerprints the result depends on
+
+        '''
+        return f"{namespace}-{hash_params(list(parts))[:32]}"
+
+    def file_fingerprint(self,*file_paths)->str: # it is used to fingerprint input files such as stud.csv by content
+        return hash_params([file_checksum(file_path) for file_path in file_paths])
+
+    def config_fingerprint(self,estimator)->str: # it is used to fingerprint an unfitted transformer or estimator by its config
+        return estimator_fingerprint(estimator)
+
+    def data_fingerprint(self,*arrays)->str:
+        return hash_arrays(*arrays)
+
+    def cv_scores_key(self,data_fingerprint,estimator,cv)->str: # it is used for the {candidate: CV score} map of one model
+        return self.key("cv",data_fingerprint,estimator_fingerprint(estimator),cv)
+
+    def estimator_key(self,data_fingerprint,estimator,params)->str: # it is used for an estimator refitted on the full training data
+        return self.key("model",data_fingerprint,estimator_fingerprint(estimator),params)
+
+    def _path(self,key):
+        return os.path.join(self.config.cache_dir,f"{key}.pkl")
+
+    def _load_index(self):
+        if self._index is None:
+            self._index={}
+            if os.path.exists(self.index_path):
+                with open(self.index_path,encoding="utf-8") as file_obj:
+                    self._index=json.load(file_obj)
+        return self._index
+
+    def _save_index(self):
+        os.makedirs(self.config.cache_dir,exist_ok=True)
+        tmp_path=f"{self.index_path}.tmp"
+        with open(tmp_path,"w",encoding="utf-8") as file_obj:
+            json.dump(self._index,file_obj)
+        os.replace(tmp_path,self.index_path) # it is used so that a crash never leaves a half written index
+
+    def get(self,key,default=None):
+        '''
+        This function returns the cached object for key, or default when it is missing or the cache is disabled
+
+        '''
+        if not self.config.enabled:
+            return default
+        try:
+            with self._lock:
+                index=self._load_index()
+                if key not in index or not os.path.exists(self._path(key)):
+                    self.misses+=1
+                    return default
+                index[key]["last_access"]=time.time()
+                self._save_index()
+                self.hits+=1
+            return load_object(self._path(key))
+
+        except Exception as e:
+            raise CustomException(e,sys)
+
+    def put(self,key,obj):
+        '''
+        This function stores obj under key and evicts the least recently used entries above the size limit
+
+        '''
+        if not self.config.enabled:
+            return
+        try:
+            path=self._path(key)
+            save_object(path,obj)
+            with self._lock:
+                index=self._load_index()
+                index[key]={"size": os.path.getsize(path),"last_access": time.time()}
+                self._evict(keep=key)
+                self._save_index()
+
+        except Exception as e:
+            raise CustomException(e,sys)
+
+    def _evict(self,keep):
+        index=self._index
+        total=sum(entry["size"] for entry in index.values())
+        for key in sorted(index,key=lambda k: index[k]["last_access"]):
+            if total<=self.config.max_size_bytes:
+                break
+            if key==keep:
+                continue
+            total-=index[key]["size"]
+            del index[key]
+            serializers.remove(self._path(key))
+            logging.info(f"Evicted {key} from the training cache")
@@ -9,16 +9,54 @@ def error_message_detail(error,error_detail:sys):
 
     return error_message
 
-    
+
 
 class CustomException(Exception):
-    def __init__(self,error_message,error_detail:sys):
+    '''
+    The exception every layer wraps errors in. Only the file and line are recorded when it is created, the
+    message is formatted the first time it is read. Wrapping a CustomException again returns the same object,
+    so a failure that passes through several layers is wrapped (and formatted) once; the original error is
+    kept as __cause__ for the traceback.
+
+    '''
+    def __new__(cls,error_message,error_detail:sys=sys):
+        if isinstance(error_message,cls): # it is already wrapped by a lower layer
+            return error_message
+        return super().__new__(cls,error_message)
+
+    def __init__(self,error_message,error_detail:sys=sys):
+        if self is error_message: # __new__ returned the existing exception, it is only re-raised
+            return
         super().__init__(error_message)
-        self.error_message=error_message_detail(error_message,error_detail=error_detail)
-    
+        self.error=error_message
+        exc_tb=error_detail.exc_info()[2]
+        if exc_tb is None and isinstance(error_message,BaseException): # raised outside an except block
+            exc_tb=error_message.__traceback__
+        self.file_name=exc_tb.tb_frame.f_code.co_filename if exc_tb is not None else "<unknown>"
+        self.line_number=exc_tb.tb_lineno if exc_tb is not None else 0
+        if isinstance(error_message,BaseException):
+            self.__cause__=error_message
+        self._message=None
+
+    @property
+    def error_message(self): # it is used to format the message lazily, at most once
+        if self._message is None:
+            self._message="Error occured in python script name [{0}] line number [{1}] error message[{2}]".format(
+                self.file_name,self.line_number,str(self.error))
+        return self._message
+
     def __str__(self):
         return self.error_message
-    
+
+    def __reduce__(self): # it is used to send the exception back from worker processes with its origin intact
+        return (_restore_custom_exception,(self.__class__,str(self.error),self.file_name,self.line_number))
+
+
+def _restore_custom_exception(cls,error,file_name,line_number):
+    exception=cls(error)
+    exception.file_name,exception.line_number=file_name,line_number
+    return exception
+
 # To check whether the exception.py is working or not run  python src/exception.py in terminal
 # if __name__=="__main__":
 #     try:
@@ -26,4 +64,3 @@ class CustomException(Exception):
 #     except Exception as e:
 #         logging.info("Divide by zero error")
 #         raise CustomException(e,sys) from e
-        
\ No newline at end of file
@@ -1,20 +1,149 @@
-import logging 
+import atexit
+import copy
+import logging
+import logging.handlers
+import multiprocessing
 import os
+import queue
+import threading
 from datetime import datetime
+from multiprocessing import util as multiprocessing_util
 
 LOG_FILE=f"{datetime.now().strftime('%Y-%m-%d')}.log"
 log_path=os.path.join(os.getcwd(),"logs")
-os.makedirs(log_path,exist_ok=True)
 
 LOG_FILE_PATH=os.path.join(log_path,LOG_FILE)
 
+IMPORT_PID=os.getpid()
+
+
+def is_main_process()->bool: # it is used to find the process that writes <date>.log, LOG_MAIN_PID overrides it
+    if os.environ.get("LOG_MAIN_PID"):
+        return os.getpid()==int(os.environ["LOG_MAIN_PID"])
+    # gunicorn workers are forked after the import, spawned multiprocessing and joblib workers import the logger again
+    # and only know their parent once they run, so this is checked when the file is opened, not at import
+    return os.getpid()==IMPORT_PID and multiprocessing.parent_process() is None
+
+
+class LazyFileHandler(logging.handlers.RotatingFileHandler): # it is used to create logs/ and the log file on the first record instead of at import
+    def __init__(self,filename,*args,**kwargs):
+        super().__init__(filename,*args,**kwargs)
+        self.main_file_path=self.baseFilename
+        self._opened_pid=None
+
+    def _open(self):
+        '''
+        This function opens the log file of this process. Worker processes write to <date>.<pid>.log next to the main
+        process's <date>.log, since processes that share a file rotate it under each other and lose records.
+
+        '''
+        if not is_main_process():
+            root,extension=os.path.splitext(self.main_file_path)
+            self.baseFilename=f"{root}.{os.getpid()}{extension}"
+        os.makedirs(os.path.dirname(self.baseFilename),exist_ok=True)
+        self._opened_pid=os.getpid()
+        return super()._open()
+
+    def emit(self,record):
+        if self.stream is not None and self._opened_pid!=os.getpid(): # a forked worker inherits the stream of the main process's file
+            self.stream.close()
+            self.stream=None
+        super().emit(record)
+
+
+class DrainingQueueListener(logging.handlers.QueueListener): # it is used to stop the listener also when the queue is full
+    def enqueue_sentinel(self):
+        self.queue.put(self._sentinel) # waits for the listener to make room, the queued records are written first
+
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler): # it is used to hand records to a background thread that does the formatting and the file I/O
+    def __init__(self,target,max_queue=10000,block_timeout=0.1):
+        super().__init__(queue.Queue(max_queue))
+        self.target=target
+        self.block_timeout=block_timeout # seconds WARNING and above wait for room in a full queue before they are dropped
+        self.dropped=0
+        self._reported=0 # dropped records a warning was already written for
+        self._listener=None
+        self._pid=None
+        self._start_lock=threading.Lock()
+
+    def _start(self):
+        '''
+        This function starts the listener thread of this process. It runs on the first record, also in a forked
+        gunicorn worker, since threads do not survive a fork and the parent's queue must not be shared.
+
+        '''
+        with self._start_lock:
+            if self._pid==os.getpid():
+                return
+            self.queue=queue.Queue(self.queue.maxsize)
+            self._listener=DrainingQueueListener(self.queue,self.target,respect_handler_level=True)
+            self._listener.start()
+            self._pid=os.getpid()
+            atexit.register(self._stop) # it is used to write the queued records before the process exits,
+            multiprocessing_util.Finalize(None,self._stop,exitpriority=0) # also from worker processes, which skip atexit
+
+    def _stop(self):
+        with self._start_lock:
+            listener,self._listener=self._listener,None
+            if listener is not None and self._pid==os.getpid():
+                listener.stop()
+
+    def close(self): # logging.shutdown closes the handlers, the queued records are written first
+        self._stop()
+        super().close()
+
+    def prepare(self,record): # the listener thread formats the record, only the message is merged here so later changes to args do not show up
+        record=copy.copy(record)
+        record.msg=record.getMessage()
+        record.args=None
+        return record
+
+    def enqueue(self,record):
+        if self._pid!=os.getpid():
+            self._start()
+        if self.dropped>self._reported:
+            self._report_dropped()
+        try:
+            if record.levelno>=logging.WARNING:
+                self.queue.put(record,timeout=self.block_timeout)
+            else:
+                self.queue.put_nowait(record)
+        except queue.Full: # a stalled disk drops log records instead of blocking requests
+            self.dropped+=1
+
+    def _report_dropped(self): # it is used to write a warning with the number of records dropped since the last one
+        dropped=self.dropped
+        record=logging.LogRecord(__name__,logging.WARNING,__file__,0,
+                                 f"{dropped-self._reported} log records were dropped because the log queue was full ({dropped} in total)",None,None)
+        try:
+            self.queue.put_nowait(record)
+            self._reported=dropped
+        except queue.Full:
+            pass # reported with the next record that finds room
+
+    def stats(self)->dict:
+        return {"queued": self.queue.qsize(),"max_queue": self.queue.maxsize,"dropped": self.dropped}
+
+
+file_handler=LazyFileHandler(
+    LOG_FILE_PATH,
+    maxBytes=int(os.environ.get("LOG_MAX_BYTES",str(10*1024*1024))), # the file is rotated at this size, 0 never rotates
+    backupCount=int(os.environ.get("LOG_BACKUP_COUNT","5")),
+    delay=True, # importing the logger no longer touches the file system
+)
+file_handler.setFormatter(logging.Formatter('[%(asctime)s]: %(lineno)d %(name)s - %(levelname)s - %(message)s',datefmt='%Y-%m-%d %H:%M:%S'))
+
+queue_handler=NonBlockingQueueHandler(file_handler,int(os.environ.get("LOG_QUEUE_SIZE","10000"))) if os.environ.get("LOG_ASYNC","1")!="0" else None
+
+def log_stats()->dict: # it is used to export the queued and dropped records to the metrics endpoint
+    return queue_handler.stats() if queue_handler is not None else {"queued": 0,"max_queue": 0,"dropped": 0}
+
 logging.basicConfig(
-    filename=LOG_FILE_PATH,
-    format='[%(asctime)s]: %(lineno)d %(name)s - %(levelname)s - %(message)s',
-    level=logging.INFO,
-    datefmt='%Y-%m-%d %H:%M:%S'
+    handlers=[queue_handler or file_handler], # LOG_ASYNC=0 writes on the calling thread
+    level=os.environ.get("LOG_LEVEL","INFO").upper(), # DEBUG enables the per-request logs of the web app
 )
 
 # To check whether the logger.py is working or not run  python src/logger.py in terminal
 # if __name__=="__main__":
-#     logging.info("Logging has started")
\ No newline at end of file
+#     logging.info("Logging has started")
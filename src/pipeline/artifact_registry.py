@@ -0,0 +1,231 @@
+import os
+import sys
+import threading
+import time
+from dataclasses import dataclass
+
+from src.exception import CustomException
+from src.logger import logging
+from src import serializers
+from src.pipeline.prediction_cache import PredictionCache
+from src.components.inference_plan import InferencePlan,file_checksum
+from src.components.model_compiler import CompiledModel
+
+
+@dataclass
+class ArtifactRegistryConfig: # it is used to store the artifact paths watched by the registry
+    model_file_path: str=os.path.join("artifacts","model.pkl")
+    preprocessor_file_path: str=os.path.join("artifacts","proprocessor.pkl")
+    inference_plan_file_path: str=os.path.join("artifacts","inference_plan.json")
+    compiled_model_file_path: str=os.path.join("artifacts","compiled_model.npz")
+    version_file_path: str=os.path.join("artifacts",serializers.VERSION_FILE_NAME) # written last by training, a new pair is loaded only once it changes
+    use_compiled: bool=os.environ.get("SERVE_COMPILED","1")!="0" # serve the NumPy-only export when it matches model.pkl
+    check_interval: float=float(os.environ.get("ARTIFACT_CHECK_INTERVAL","2.0")) # seconds between two file change checks
+
+
+@dataclass(frozen=True)
+class ArtifactBundle: # immutable snapshot of the loaded artifacts, it is swapped as a whole on reload
+    model: object
+    preprocessor: object
+    plan: InferencePlan
+    version: int
+    fingerprint: tuple
+    loaded_at: float
+    load_time: float
+
+
+class ArtifactRegistry: # This class keeps the model and preprocessor in memory and reloads them when a new version is written.
+    def __init__(self,config: ArtifactRegistryConfig=None):
+        self.config=config or ArtifactRegistryConfig()
+        self._bundle=None
+        self._last_check=0.0
+        self._rejected=None # fingerprint of a version whose files did not match the marker, it is not loaded again
+        self._load_lock=threading.Lock() # it is used so that only one thread loads the artifacts at a time
+        self._stats_lock=threading.Lock()
+        self.prediction_cache=PredictionCache() # it belongs to the registry so that a reload always invalidates it
+        self.hits=0
+        self.misses=0
+        self.reloads=0
+        self.load_errors=0
+        self.last_load_time=0.0
+        self.total_load_time=0.0
+
+    def _fingerprint(self):
+        '''
+        This function returns the (mtime, size) of the version marker and of the compiled model, a change in any of them
+        triggers a reload. Artifacts saved before the marker existed are watched file by file.
+
+        '''
+        if os.path.exists(self.config.version_file_path):
+            fingerprint=[]
+            for path in (self.config.version_file_path,self.config.compiled_model_file_path): # the compiled model may be exported later
+                if os.path.exists(path):
+                    stat=os.stat(path)
+                    fingerprint.append((path,stat.st_mtime_ns,stat.st_size))
+            return tuple(fingerprint)
+        fingerprint=[]
+        for path in (self.config.model_file_path,self.config.preprocessor_file_path):
+            stat=os.stat(path)
+            fingerprint.append((stat.st_mtime_ns,stat.st_size))
+        # the plan, the compiled model and the serializer manifests are optional, older artifacts do not have them
+        optional=(
+            self.config.inference_plan_file_path,
+            self.config.compiled_model_file_path,
+            serializers.manifest_path(self.config.model_file_path),
+            serializers.manifest_path(self.config.preprocessor_file_path),
+        )
+        for path in optional:
+            if os.path.exists(path):
+                stat=os.stat(path)
+                fingerprint.append((path,stat.st_mtime_ns,stat.st_size))
+        return tuple(fingerprint)
+
+    def _load_plan(self,preprocessor):
+        '''
+        This function loads the exported inference plan, or compiles one when it is missing or was built from another preprocessor
+
+        '''
+        checksum=file_checksum(self.config.preprocessor_file_path)
+        if os.path.exists(self.config.inference_plan_file_path):
+            plan=InferencePlan.load(self.config.inference_plan_file_path)
+            if plan.source_checksum==checksum:
+                return plan
+            logging.warning("Inference plan does not match the preprocessor, compiling a new one")
+        return InferencePlan.from_preprocessor(preprocessor,source_checksum=checksum)
+
+    def _load_compiled(self):
+        '''
+        This function loads the compiled model when it is enabled, exists and was exported from the current model.pkl
+        and preprocessor; serving it needs neither sklearn nor the boosting libraries
+
+        '''
+        path=self.config.compiled_model_file_path
+        if not self.config.use_compiled or not os.path.exists(path):
+            return None
+        compiled=CompiledModel.load(path)
+        if (compiled.plan is None or compiled.model_checksum!=file_checksum(self.config.model_file_path)
+                or compiled.plan.source_checksum!=file_checksum(self.config.preprocessor_file_path)):
+            logging.warning("Compiled model does not match model.pkl, loading the original artifacts")
+            return None
+        return compiled
+
+    def _count(self,name):
+        with self._stats_lock:
+            setattr(self,name,getattr(self,name)+1)
+
+    def _load(self,fingerprint):
+        start=time.perf_counter()
+        version=serializers.read_version(self.config.version_file_path) # read before the files, training writes it after them
+        compiled=self._load_compiled()
+        if compiled is not None:
+            model,plan=compiled,compiled.plan
+            preprocessor=plan # the plan has transform() too, so it stands in for the ColumnTransformer
+        else:
+            model=serializers.load(self.config.model_file_path)
+            preprocessor=serializers.load(self.config.preprocessor_file_path)
+            plan=self._load_plan(preprocessor)
+        if version is not None and not serializers.matches_version(version,self.config.model_file_path,self.config.preprocessor_file_path):
+            self._rejected=fingerprint
+            raise ValueError(f"{self.config.model_file_path} and {self.config.preprocessor_file_path} do not match "
+                             f"{self.config.version_file_path}, a training run is still writing them")
+        load_time=time.perf_counter()-start
+
+        previous=self._bundle
+        bundle=ArtifactBundle(
+            model=model,
+            preprocessor=preprocessor,
+            plan=plan,
+            version=previous.version+1 if previous is not None else 1,
+            fingerprint=fingerprint,
+            loaded_at=time.time(),
+            load_time=load_time,
+        )
+        with self._stats_lock:
+            self.last_load_time=load_time
+            self.total_load_time+=load_time
+            if previous is not None:
+                self.reloads+=1
+        self._bundle=bundle # single reference swap, in-flight requests keep using the bundle they already hold
+        if previous is not None:
+            self.prediction_cache.clear() # the keys carry the version too, clearing just frees the memory right away
+        logging.info(f"Loaded artifacts version {bundle.version} ({'compiled' if compiled is not None else 'pickled'} model) in {load_time:.3f}s")
+        return bundle
+
+    def get(self)->ArtifactBundle:
+        '''
+        This function returns the current artifact bundle, loading or reloading it only when needed
+
+        '''
+        try:
+            bundle=self._bundle
+            now=time.monotonic()
+            if bundle is not None and now-self._last_check<self.config.check_interval:
+                self._count("hits")
+                return bundle
+
+            fingerprint=self._fingerprint()
+            if bundle is not None and fingerprint in (bundle.fingerprint,self._rejected):
+                self._last_check=now
+                self._count("hits")
+                return bundle
+
+            with self._load_lock:
+                bundle=self._bundle # another thread may have reloaded while we were waiting for the lock
+                if bundle is None or fingerprint not in (bundle.fingerprint,self._rejected):
+                    self._count("misses")
+                    try:
+                        bundle=self._load(fingerprint)
+                    except Exception:
+                        self._count("load_errors")
+                        if bundle is None:
+                            raise
+                        # the files may still be being written or not match the marker, keep serving the previous version
+                        logging.exception("Artifact reload failed, keeping the previous version")
+                else:
+                    self._count("hits")
+                self._last_check=now
+            return bundle
+
+        except Exception as e:
+            raise CustomException(e,sys)
+
+    def reload(self)->ArtifactBundle:
+        '''
+        This function forces a reload of the artifacts from disk and swaps them in atomically
+
+        '''
+        try:
+            with self._load_lock:
+                self._count("misses")
+                bundle=self._load(self._fingerprint())
+                self._last_check=time.monotonic()
+            return bundle
+
+        except Exception as e:
+            raise CustomException(e,sys)
+
+    def stats(self)->dict:
+        bundle=self._bundle
+        with self._stats_lock:
+            return {
+                "version": bundle.version if bundle is not None else None,
+                "loaded_at": bundle.loaded_at if bundle is not None else None,
+                "hits": self.hits,
+                "misses": self.misses,
+                "reloads": self.reloads,
+                "load_errors": self.load_errors,
+                "last_load_time": self.last_load_time,
+                "total_load_time": self.total_load_time,
+            }
+
+
+_registry=None
+_registry_lock=threading.Lock()
+
+def get_registry()->ArtifactRegistry: # it is used to get the process wide artifact registry
+    global _registry
+    if _registry is None:
+        with _registry_lock:
+            if _registry is None:
+                _registry=ArtifactRegistry()
+    return _registry
@@ -0,0 +1,98 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from dataclasses import dataclass
+
+
+class Overloaded(Exception): # it is raised when a request arrives while every prediction slot is taken
+    pass
+
+
+def wait_for(future,timeout=None):
+    '''
+    This function returns the result of future, waiting at most timeout seconds. On a timeout the future is cancelled,
+    so work that has not started yet is dropped, and the TimeoutError is raised to the caller
+
+    '''
+    try:
+        return future.result(timeout=timeout)
+    except TimeoutError:
+        future.cancel()
+        raise
+
+
+@dataclass
+class PredictionExecutorConfig: # it is used to store the concurrency limits of the serving process
+    max_workers: int=int(os.environ.get("PREDICT_WORKERS","4")) # threads running CPU bound predict calls
+    max_pending: int=int(os.environ.get("PREDICT_MAX_PENDING","64")) # requests allowed in flight before new ones get a 429
+    timeout: float=float(os.environ.get("PREDICT_TIMEOUT","10")) # seconds a request waits for its prediction
+
+
+class PredictionExecutor: # This class runs predict calls on a thread pool and rejects requests once too many are in flight.
+    def __init__(self,config: PredictionExecutorConfig=None):
+        self.config=config or PredictionExecutorConfig()
+        self._slots=threading.BoundedSemaphore(self.config.max_pending)
+        self._pool=None
+        self._pool_lock=threading.Lock()
+        self._stats_lock=threading.Lock()
+        self.rejected=0
+
+    def _get_pool(self):
+        # the pool is created lazily so that no threads exist yet when a preloading server forks its workers
+        if self._pool is None:
+            with self._pool_lock:
+                if self._pool is None:
+                    self._pool=ThreadPoolExecutor(max_workers=self.config.max_workers,thread_name_prefix="predict")
+        return self._pool
+
+    @contextmanager
+    def admit(self):
+        '''
+        This function takes one in-flight slot for the duration of the block, or raises Overloaded right away.
+        The block may pass the future of its work to the yielded function: the slot is then released when that
+        future is done, not when the block exits, so work still running after a timed out wait keeps counting
+
+        '''
+        if not self._slots.acquire(blocking=False):
+            with self._stats_lock:
+                self.rejected+=1
+            raise Overloaded("Too many prediction requests in flight")
+        held=[]
+        try:
+            yield held.append
+        finally:
+            if held:
+                held[0].add_done_callback(lambda _: self._slots.release()) # runs right away when the future is done already
+            else:
+                self._slots.release()
+
+    def run(self,fn,*args,**kwargs):
+        '''
+        This function runs fn(*args, **kwargs) on the prediction pool and waits for its result,
+        so the request thread (or event loop) is not the one doing the CPU work
+
+        '''
+        with self.admit() as hold:
+            future=self._get_pool().submit(fn,*args,**kwargs)
+            hold(future)
+            return wait_for(future,self.config.timeout)
+
+    def stats(self)->dict:
+        return {
+            "max_workers": self.config.max_workers,
+            "max_pending": self.config.max_pending,
+            "rejected": self.rejected,
+        }
+
+
+_executor=None
+_executor_lock=threading.Lock()
+
+def get_executor()->PredictionExecutor: # it is used to get the process wide prediction executor
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor=PredictionExecutor()
+    return _executor
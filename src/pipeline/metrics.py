@@ -0,0 +1,139 @@
+import os
+import threading
+import time
+from dataclasses import dataclass
+
+
+@dataclass
+class MetricsConfig: # it is used to store whether timings are recorded and how many recent samples the quantiles use
+    enabled: bool=os.environ.get("METRICS_ENABLED","1")!="0"
+    window: int=int(os.environ.get("METRICS_WINDOW","2048")) # samples kept per span for p50/p95/p99
+    namespace: str="mlproject"
+    quantiles: tuple=(0.5,0.95,0.99)
+
+
+class LatencyHistogram: # This class keeps the count, the sum and a ring buffer of the latest samples of one span.
+    def __init__(self,window):
+        self.window=window
+        self._samples=[0.0]*window # preallocated, observe only overwrites one slot
+        self._lock=threading.Lock()
+        self.count=0
+        self.sum=0.0
+
+    def observe(self,seconds):
+        with self._lock:
+            self._samples[self.count%self.window]=seconds
+            self.count+=1
+            self.sum+=seconds
+
+    def snapshot(self,quantiles)->dict:
+        '''
+        This function returns the count, the sum and the requested quantiles of the samples in the window
+
+        '''
+        with self._lock:
+            count,total=self.count,self.sum
+            samples=sorted(self._samples[:min(count,self.window)]) # sorting happens on scrape, never on the request path
+        values={}
+        for q in quantiles:
+            values[q]=samples[min(len(samples)-1,int(q*len(samples)))] if samples else 0.0
+        return {"count": count,"sum": total,"quantiles": values}
+
+
+class _Span: # it is used to time a with block and record it on exit
+    __slots__=("metrics","name","start")
+
+    def __init__(self,metrics,name):
+        self.metrics=metrics
+        self.name=name
+
+    def __enter__(self):
+        self.start=time.perf_counter()
+        return self
+
+    def __exit__(self,*exc_info):
+        self.metrics.observe(self.name,time.perf_counter()-self.start)
+        return False
+
+
+class _NullSpan: # it is returned while metrics are off, so a disabled span costs one method call and no clock reads
+    __slots__=()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self,*exc_info):
+        return False
+
+
+_NULL_SPAN=_NullSpan()
+
+
+class Metrics: # This class collects span timings and component stats and renders them in the Prometheus text format.
+    def __init__(self,config: MetricsConfig=None):
+        self.config=config or MetricsConfig()
+        self.enabled=self.config.enabled
+        self._histograms={}
+        self._histograms_lock=threading.Lock()
+        self._collectors={}
+
+    def span(self,name):
+        '''
+        This function returns a context manager that records the time spent in its block under name
+
+        '''
+        if not self.enabled:
+            return _NULL_SPAN
+        return _Span(self,name)
+
+    def observe(self,name,seconds):
+        histogram=self._histograms.get(name)
+        if histogram is None:
+            with self._histograms_lock:
+                histogram=self._histograms.setdefault(name,LatencyHistogram(self.config.window))
+        histogram.observe(seconds)
+
+    def register_collector(self,name,stats_fn): # it is used to export a component's stats() dict as gauges
+        self._collectors[name]=stats_fn
+
+    def render(self)->str:
+        '''
+        This function renders the span summaries and the collector gauges in the Prometheus text exposition format
+
+        '''
+        prefix=self.config.namespace
+        lines=[
+            f"# HELP {prefix}_span_seconds Time spent in each stage of a prediction request",
+            f"# TYPE {prefix}_span_seconds summary",
+        ]
+        for name,histogram in sorted(self._histograms.items()):
+            snapshot=histogram.snapshot(self.config.quantiles)
+            for q,value in snapshot["quantiles"].items():
+                lines.append(f'{prefix}_span_seconds{{span="{name}",quantile="{q}"}} {value!r}')
+            lines.append(f'{prefix}_span_seconds_sum{{span="{name}"}} {snapshot["sum"]!r}')
+            lines.append(f'{prefix}_span_seconds_count{{span="{name}"}} {snapshot["count"]}')
+
+        lines.append(f"# TYPE {prefix}_metrics_enabled gauge")
+        lines.append(f"{prefix}_metrics_enabled {int(self.enabled)}")
+        for collector,stats_fn in sorted(self._collectors.items()):
+            for key,value in stats_fn().items():
+                if isinstance(value,bool):
+                    value=int(value)
+                if not isinstance(value,(int,float)): # versions, timestamps set to None and other labels are skipped
+                    continue
+                metric=f"{prefix}_{collector}_{key}"
+                lines.append(f"# TYPE {metric} gauge")
+                lines.append(f"{metric} {value!r}")
+        return "\n".join(lines)+"\n"
+
+
+_metrics=None
+_metrics_lock=threading.Lock()
+
+def get_metrics()->Metrics: # it is used to get the process wide metrics, every gunicorn worker reports its own
+    global _metrics
+    if _metrics is None:
+        with _metrics_lock:
+            if _metrics is None:
+                _metrics=Metrics()
+    return _metrics
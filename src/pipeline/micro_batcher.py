@@ -0,0 +1,115 @@
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+from src.logger import logging
+from src.pipeline.concurrency import wait_for
+from src.pipeline.predict_pipeline import PredictPipeline
+
+
+@dataclass
+class MicroBatcherConfig: # it is used to store the batching limits, both can be set from the environment
+    max_batch_size: int=int(os.environ.get("BATCH_MAX_SIZE","64")) # maximum number of rows merged into one predict call
+    max_wait_ms: float=float(os.environ.get("BATCH_MAX_WAIT_MS","5")) # how long the first request of a batch waits for company
+
+
+class MicroBatcher: # This class merges concurrent prediction requests into one preprocessor.transform + model.predict call.
+    def __init__(self,predict_fn=None,config: MicroBatcherConfig=None):
+        self.config=config or MicroBatcherConfig()
+        self.predict_fn=predict_fn or PredictPipeline().predict
+        self._queue=queue.Queue()
+        self._worker=None
+        self._worker_lock=threading.Lock()
+        self.batches=0
+        self.rows=0
+
+    def _ensure_worker(self):
+        # the worker is started lazily so that the batcher is safe to create before a fork
+        if self._worker is None or not self._worker.is_alive():
+            with self._worker_lock:
+                if self._worker is None or not self._worker.is_alive():
+                    self._worker=threading.Thread(target=self._run,name="micro-batcher",daemon=True)
+                    self._worker.start()
+
+    def submit(self,features: pd.DataFrame)->Future:
+        '''
+        This function queues a dataframe of one or more rows and returns a future with its predictions
+
+        '''
+        future=Future()
+        self._ensure_worker()
+        self._queue.put((features,future))
+        return future
+
+    def predict(self,features: pd.DataFrame,timeout: float=None)->np.ndarray:
+        return wait_for(self.submit(features),timeout) # a timed out request is cancelled, the worker skips it
+
+    def _collect(self):
+        first=self._queue.get()
+        batch=[first]
+        rows=len(first[0])
+        deadline=time.monotonic()+self.config.max_wait_ms/1000.0
+        while rows<self.config.max_batch_size:
+            remaining=deadline-time.monotonic()
+            if remaining<=0:
+                break
+            try:
+                item=self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            batch.append(item)
+            rows+=len(item[0])
+        return batch
+
+    def _run(self):
+        while True:
+            batch=self._collect()
+            self._process(batch)
+
+    def _process(self,batch):
+        batch=[(features,future) for features,future in batch if future.set_running_or_notify_cancel()] # it is used to drop cancelled requests
+        if not batch:
+            return
+        frames=[features for features,_ in batch]
+        futures=[future for _,future in batch]
+        try:
+            data=frames[0] if len(frames)==1 else pd.concat(frames,ignore_index=True)
+            preds=np.asarray(self.predict_fn(data))
+        except Exception as e:
+            logging.exception("Micro-batch prediction failed")
+            for future in futures:
+                future.set_exception(e)
+            return
+
+        self.batches+=1
+        self.rows+=len(data)
+        offset=0
+        for features,future in zip(frames,futures):
+            future.set_result(preds[offset:offset+len(features)]) # it is used to hand each caller back only its own rows
+            offset+=len(features)
+
+    def stats(self)->dict:
+        return {
+            "batches": self.batches,
+            "rows": self.rows,
+            "mean_batch_size": self.rows/self.batches if self.batches else 0.0,
+            "queued": self._queue.qsize(),
+        }
+
+
+_batcher=None
+_batcher_lock=threading.Lock()
+
+def get_batcher()->MicroBatcher: # it is used to get the process wide micro batcher
+    global _batcher
+    if _batcher is None:
+        with _batcher_lock:
+            if _batcher is None:
+                _batcher=MicroBatcher()
+    return _batcher
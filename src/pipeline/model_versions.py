@@ -0,0 +1,354 @@
+import argparse
+import os
+import queue
+import random
+import re
+import shutil
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+from src.exception import CustomException
+from src.logger import logging
+from src import serializers
+from src.pipeline.artifact_registry import ArtifactRegistry,ArtifactRegistryConfig,get_registry
+from src.pipeline.concurrency import wait_for
+from src.pipeline.metrics import LatencyHistogram
+from src.pipeline.micro_batcher import MicroBatcher,get_batcher
+from src.pipeline.predict_pipeline import PredictPipeline
+
+ARTIFACT_FILES=("model.pkl","proprocessor.pkl","inference_plan.json","compiled_model.npz") # the files that make up one model version
+
+
+@dataclass
+class ModelVersionsConfig: # it is used to store which versions are loaded and how traffic is split between them
+    artifacts_dir: str="artifacts" # the primary version is the one in artifacts/, like before
+    versions_dir: str=os.path.join("artifacts","versions") # named versions live in versions_dir/<name>/
+    primary_name: str=os.environ.get("MODEL_PRIMARY_NAME","primary")
+    versions: str=os.environ.get("MODEL_VERSIONS","") # comma separated names loaded side by side with the primary
+    candidate: str=os.environ.get("MODEL_CANDIDATE","") # canary and shadow target, the first of versions when empty
+    canary_percent: float=float(os.environ.get("CANARY_PERCENT","0")) # share of requests answered by the candidate
+    shadow_percent: float=float(os.environ.get("SHADOW_PERCENT","0")) # share of primary requests also scored by the candidate
+    shadow_queue_size: int=int(os.environ.get("SHADOW_QUEUE_SIZE","256")) # requests waiting for shadow scoring, more are dropped
+    shadow_max_batch: int=int(os.environ.get("SHADOW_MAX_BATCH","256")) # rows per shadow predict call
+    shadow_when_idle: bool=os.environ.get("SHADOW_WHEN_IDLE","1")!="0" # score only while no primary request is in flight
+    window: int=2048 # latency and delta samples kept for the quantiles
+
+    def __post_init__(self):
+        self.version_names=[name.strip() for name in self.versions.split(",") if name.strip()]
+        if not self.candidate and self.version_names:
+            self.candidate=self.version_names[0]
+
+
+def version_registry_config(name,config: ModelVersionsConfig=None)->ArtifactRegistryConfig: # it is used to point a registry at one version's files
+    config=config or ModelVersionsConfig()
+    directory=config.artifacts_dir if name==config.primary_name else os.path.join(config.versions_dir,name)
+    return ArtifactRegistryConfig(
+        model_file_path=os.path.join(directory,"model.pkl"),
+        preprocessor_file_path=os.path.join(directory,"proprocessor.pkl"),
+        inference_plan_file_path=os.path.join(directory,"inference_plan.json"),
+        compiled_model_file_path=os.path.join(directory,"compiled_model.npz"),
+        version_file_path=os.path.join(directory,serializers.VERSION_FILE_NAME),
+    )
+
+
+def _copy_artifacts(source_dir,target_dir):
+    '''
+    This function copies the files of one model version (with their serializer manifests) from source_dir to target_dir,
+    each through a temporary file and os.replace so a registry watching target_dir never reads a half written file.
+    The version marker is copied last, the registry swaps in the new pair only then. A pair that does not match its
+    marker (a training run is still writing it) is not copied; artifacts without a marker get one in target_dir.
+
+    '''
+    version=serializers.read_version(os.path.join(source_dir,serializers.VERSION_FILE_NAME))
+    pair=[(os.path.join(directory,"model.pkl"),os.path.join(directory,"proprocessor.pkl")) for directory in (source_dir,target_dir)]
+    if version is not None and not serializers.matches_version(version,*pair[0]):
+        raise ValueError(f"The model and preprocessor in {source_dir} do not match their version marker, retry once the training run is done")
+
+    os.makedirs(target_dir,exist_ok=True)
+    for file_name in ARTIFACT_FILES:
+        for path in (os.path.join(source_dir,file_name),serializers.manifest_path(os.path.join(source_dir,file_name))):
+            if not os.path.exists(path):
+                continue
+            target=os.path.join(target_dir,os.path.basename(path))
+            shutil.copyfile(path,f"{target}.tmp")
+            os.replace(f"{target}.tmp",target)
+
+    if version is None: # artifacts saved before the marker existed
+        serializers.write_version(*pair[1],file_path=os.path.join(target_dir,serializers.VERSION_FILE_NAME))
+    elif serializers.matches_version(version,*pair[1]): # the source may have changed while it was copied
+        target=os.path.join(target_dir,serializers.VERSION_FILE_NAME)
+        shutil.copyfile(os.path.join(source_dir,serializers.VERSION_FILE_NAME),f"{target}.tmp")
+        os.replace(f"{target}.tmp",target)
+    else:
+        raise ValueError(f"The model and preprocessor in {source_dir} changed while they were copied, retry once the training run is done")
+
+
+def publish_version(name,config: ModelVersionsConfig=None)->str: # it is used to keep the current artifacts as a named version, e.g. as a candidate
+    try:
+        config=config or ModelVersionsConfig()
+        target_dir=os.path.join(config.versions_dir,name)
+        _copy_artifacts(config.artifacts_dir,target_dir)
+        logging.info(f"Published the artifacts in {config.artifacts_dir} as model version {name}")
+        return target_dir
+
+    except Exception as e:
+        raise CustomException(e,sys)
+
+
+def promote_version(name,config: ModelVersionsConfig=None): # it is used to make a named version the primary, the registry picks it up on its next check
+    try:
+        config=config or ModelVersionsConfig()
+        _copy_artifacts(os.path.join(config.versions_dir,name),config.artifacts_dir)
+        logging.info(f"Promoted model version {name} to primary")
+
+    except Exception as e:
+        raise CustomException(e,sys)
+
+
+class ShadowScorer: # This class scores sampled primary requests with the candidate on a background thread and records the prediction deltas.
+    def __init__(self,predict_fn,idle,config: ModelVersionsConfig):
+        self.predict_fn=predict_fn
+        self.idle=idle # set while no primary request is in flight, the worker only scores then
+        self.config=config
+        self._queue=queue.Queue(maxsize=config.shadow_queue_size)
+        self._worker=None
+        self._worker_lock=threading.Lock()
+        self._stats_lock=threading.Lock()
+        self.latency=LatencyHistogram(config.window) # seconds per shadow predict call
+        self.abs_deltas=LatencyHistogram(config.window) # |candidate - primary| per row
+        self.submitted=0
+        self.dropped=0
+        self.failed=0
+        self.rows=0
+        self.delta_sum=0.0
+        self.max_abs_delta=0.0
+
+    def _ensure_worker(self):
+        if self._worker is None or not self._worker.is_alive():
+            with self._worker_lock:
+                if self._worker is None or not self._worker.is_alive():
+                    self._worker=threading.Thread(target=self._run,name="shadow-scorer",daemon=True)
+                    self._worker.start()
+
+    def submit(self,features,primary_predictions): # it is called on the request path, so it only enqueues and never waits
+        self._ensure_worker()
+        try:
+            self._queue.put_nowait((features,np.asarray(primary_predictions,dtype=np.float64)))
+            self.submitted+=1
+        except queue.Full:
+            self.dropped+=1 # the candidate falls behind under load, sampling fewer requests is better than slowing the primary
+
+    def _collect(self):
+        batch=[self._queue.get()]
+        rows=len(batch[0][0])
+        while rows<self.config.shadow_max_batch:
+            try:
+                item=self._queue.get_nowait()
+            except queue.Empty:
+                break
+            batch.append(item)
+            rows+=len(item[0])
+        return batch
+
+    def _run(self):
+        while True:
+            batch=self._collect()
+            if self.config.shadow_when_idle:
+                self.idle.wait() # it is used to stay off the CPU (and the GIL) while the primary serves a request
+            self._process(batch)
+
+    def _process(self,batch):
+        frames=[features for features,_ in batch]
+        features=frames[0] if len(frames)==1 else pd.concat(frames,ignore_index=True)
+        primary=np.concatenate([predictions for _,predictions in batch])
+        start=time.perf_counter()
+        try:
+            candidate=np.asarray(self.predict_fn(features),dtype=np.float64)
+        except Exception:
+            self.failed+=len(batch)
+            logging.exception("Shadow prediction failed")
+            return
+        self.latency.observe(time.perf_counter()-start)
+
+        deltas=candidate-primary
+        abs_deltas=np.abs(deltas)
+        for value in abs_deltas.tolist():
+            self.abs_deltas.observe(value)
+        with self._stats_lock:
+            self.rows+=len(deltas)
+            self.delta_sum+=float(deltas.sum())
+            self.max_abs_delta=max(self.max_abs_delta,float(abs_deltas.max()))
+
+    def stats(self)->dict:
+        latency=self.latency.snapshot((0.5,0.99))
+        abs_deltas=self.abs_deltas.snapshot((0.5,0.95))
+        with self._stats_lock:
+            return {
+                "submitted": self.submitted,
+                "dropped": self.dropped,
+                "failed": self.failed,
+                "queued": self._queue.qsize(),
+                "rows": self.rows,
+                "mean_delta": self.delta_sum/self.rows if self.rows else 0.0, # a non zero mean means the candidate is biased against the primary
+                "mean_abs_delta": abs_deltas["sum"]/abs_deltas["count"] if abs_deltas["count"] else 0.0, # over the delta window
+                "p50_abs_delta": abs_deltas["quantiles"][0.5],
+                "p95_abs_delta": abs_deltas["quantiles"][0.95],
+                "max_abs_delta": self.max_abs_delta,
+                "p50_ms": latency["quantiles"][0.5]*1000,
+                "p99_ms": latency["quantiles"][0.99]*1000,
+            }
+
+
+class ModelRouter: # This class serves several model versions side by side, with canary routing and shadow scoring of a candidate.
+    def __init__(self,config: ModelVersionsConfig=None):
+        self.config=config or ModelVersionsConfig()
+        self.primary=self.config.primary_name
+        self.pipelines={self.primary:PredictPipeline(get_registry())} # the primary keeps the process wide registry and batcher
+        self.batchers={self.primary:get_batcher()}
+        for name in self.config.version_names:
+            pipeline=PredictPipeline(ArtifactRegistry(version_registry_config(name,self.config)))
+            self.pipelines[name]=pipeline
+            self.batchers[name]=MicroBatcher(predict_fn=pipeline.predict)
+        self.candidate=self.config.candidate if self.config.candidate in self.pipelines and self.config.candidate!=self.primary else None
+        if self.config.candidate and self.candidate is None:
+            logging.warning(f"Model candidate {self.config.candidate!r} is not one of the loaded versions, canary and shadow are off")
+
+        self.latency={name:LatencyHistogram(self.config.window) for name in self.pipelines}
+        self.requests={name:0 for name in self.pipelines}
+        self._in_flight=0
+        self._in_flight_lock=threading.Lock()
+        self._idle=threading.Event()
+        self._idle.set()
+        self.shadow=None
+        if self.candidate is not None and self.config.shadow_percent>0:
+            candidate=self.pipelines[self.candidate]
+            self.shadow=ShadowScorer(lambda features: candidate.predict(features,use_cache=False),self._idle,self.config) # sampled rows rarely repeat
+
+    @property
+    def versions(self)->list:
+        return list(self.pipelines)
+
+    def choose(self,version=None)->str:
+        '''
+        This function returns the version that answers a request: the pinned version when given, otherwise
+        the candidate for canary_percent of the requests and the primary for the rest
+
+        '''
+        if version is not None:
+            if version not in self.pipelines:
+                raise KeyError(f"Unknown model version {version!r}, loaded: {self.versions}")
+            return version
+        if self.candidate is not None and self.config.canary_percent>0 and random.random()*100<self.config.canary_percent:
+            return self.candidate
+        return self.primary
+
+    @contextmanager
+    def _serving(self,name): # it is used to time a request per version and to keep the shadow worker idle meanwhile
+        with self._in_flight_lock:
+            self._in_flight+=1
+            self._idle.clear()
+        start=time.perf_counter()
+        try:
+            yield
+        finally:
+            self.latency[name].observe(time.perf_counter()-start)
+            with self._in_flight_lock:
+                self._in_flight-=1
+                self.requests[name]+=1
+                if not self._in_flight:
+                    self._idle.set()
+
+    def _sample_shadow(self,name)->bool: # it is used to pick the primary requests the candidate also scores
+        return self.shadow is not None and name==self.primary and random.random()*100<self.config.shadow_percent
+
+    def predict(self,features,timeout=None,version=None,hold=None):
+        '''
+        This function scores a DataFrame on the chosen version through its micro batcher and returns (predictions, version).
+        hold gets the future of the batched call, e.g. the function PredictionExecutor.admit yields.
+
+        '''
+        name=self.choose(version)
+        with self._serving(name):
+            future=self.batchers[name].submit(features)
+            if hold is not None:
+                hold(future)
+            predictions=wait_for(future,timeout)
+        if self._sample_shadow(name):
+            self.shadow.submit(features,predictions)
+        return predictions,name
+
+    def predict_record(self,record,version=None):
+        '''
+        This function scores one record on the chosen version with the single-row fast path and returns (predictions, version)
+
+        '''
+        name=self.choose(version)
+        with self._serving(name):
+            predictions=self.pipelines[name].predict_record(record)
+        if self._sample_shadow(name):
+            self.shadow.submit(pd.DataFrame([record]),predictions)
+        return predictions,name
+
+    def warm_up(self)->float: # it is used to load every version and run one prediction on each before the app reports ready
+        return sum(pipeline.warm_up() for pipeline in self.pipelines.values())
+
+    def stats(self)->dict:
+        versions={}
+        for name,histogram in self.latency.items():
+            snapshot=histogram.snapshot((0.5,0.99))
+            versions[name]={
+                "requests": self.requests[name],
+                "p50_ms": snapshot["quantiles"][0.5]*1000,
+                "p99_ms": snapshot["quantiles"][0.99]*1000,
+                "artifacts_version": self.pipelines[name].registry.stats()["version"],
+            }
+        return {
+            "primary": self.primary,
+            "candidate": self.candidate,
+            "canary_percent": self.config.canary_percent if self.candidate else 0.0,
+            "shadow_percent": self.config.shadow_percent if self.shadow else 0.0,
+            "versions": versions,
+            "shadow": self.shadow.stats() if self.shadow is not None else None,
+        }
+
+    def gauges(self)->dict: # it is used to flatten stats() into the numeric gauges the metrics endpoint exports
+        stats=self.stats()
+        gauges={f"{re.sub(r'[^a-zA-Z0-9_]','_',name)}_{key}":value for name,version in stats["versions"].items() for key,value in version.items()}
+        gauges.update({"canary_percent": stats["canary_percent"],"shadow_percent": stats["shadow_percent"]})
+        if stats["shadow"] is not None:
+            gauges.update({f"shadow_{key}":value for key,value in stats["shadow"].items()})
+        return gauges
+
+
+_router=None
+_router_lock=threading.Lock()
+
+def get_router()->ModelRouter: # it is used to get the process wide model router
+    global _router
+    if _router is None:
+        with _router_lock:
+            if _router is None:
+                _router=ModelRouter()
+    return _router
+
+
+def main(argv=None): # This function publishes the current artifacts as a named version or promotes a version to primary.
+    parser=argparse.ArgumentParser(description="Manage the model versions served side by side.")
+    parser.add_argument("action",choices=("publish","promote"))
+    parser.add_argument("name",help="version name, the files live in artifacts/versions/<name>/")
+    args=parser.parse_args(argv)
+    if args.action=="publish":
+        print(f"Published {publish_version(args.name)}")
+    else:
+        promote_version(args.name)
+        print(f"Promoted {args.name} to primary")
+
+
+if __name__=="__main__":
+    main()
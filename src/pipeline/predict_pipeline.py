@@ -1,32 +1,103 @@
-import sys
+import argparse
 import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+
+import numpy as np
 import pandas as pd
 from src.exception import CustomException
-from src.utils import load_object
+from src.logger import logging
+from src.pipeline.artifact_registry import ArtifactRegistry,ArtifactRegistryConfig,get_registry
+from src.pipeline.metrics import get_metrics
 
 
 class PredictPipeline: # This class is responsible for loading the trained model and making predictions on new data.
-    def __init__(self):
-        pass
+    def __init__(self,registry=None):
+        self.registry=registry or get_registry() # the model and preprocessor are loaded once per process by the registry
 
-    def predict(self,features): # This method is responsible for making predictions using the trained model.
+    def predict(self,features,use_cache=True): # This method is responsible for making predictions using the trained model.
         try:
-            model_path=os.path.join("artifacts","model.pkl")
-            preprocessor_path=os.path.join('artifacts','proprocessor.pkl')
-            print("Before Loading")
-            model=load_object(file_path=model_path)
-            preprocessor=load_object(file_path=preprocessor_path)
-            print("After Loading")
-            data_scaled=preprocessor.transform(features)
-            preds=model.predict(data_scaled)
+            metrics=get_metrics()
+            with metrics.span("artifact_load"):
+                artifacts=self.registry.get()
+            if not use_cache: # bulk scoring rarely repeats rows, so the per-row key building would only cost time
+                with metrics.span("transform"):
+                    data_scaled=artifacts.preprocessor.transform(features)
+                with metrics.span("model_predict"):
+                    return artifacts.model.predict(data_scaled)
+            cache=self.registry.prediction_cache
+            with metrics.span("cache_lookup"):
+                keys=[
+                    cache.make_key(record,CustomData.feature_columns,artifacts.version)
+                    for record in features[CustomData.feature_columns].to_dict(orient="records")
+                ]
+                preds=np.array([cache.get(key) for key in keys],dtype=np.float64) # None becomes NaN for the rows that are not cached
+            missing=np.flatnonzero(np.isnan(preds))
+            if len(missing):
+                with metrics.span("transform"):
+                    data_scaled=artifacts.preprocessor.transform(features.iloc[missing]) # only the uncached rows go through the model, in one call
+                with metrics.span("model_predict"):
+                    preds[missing]=artifacts.model.predict(data_scaled)
+                for i in missing:
+                    cache.put(keys[i],preds[i])
             return preds
         
         except Exception as e:
             raise CustomException(e,sys)
 
+    def warm_up(self)->float: # This method runs both prediction paths once on a synthetic record before real traffic arrives.
+        try:
+            start=time.perf_counter()
+            artifacts=self.registry.get()
+            record=artifacts.plan.sample_record()
+            artifacts.model.predict(artifacts.plan.transform_record(record)) # the single-row path, without adding to the prediction cache
+            self.predict(CustomData.get_records_as_data_frame([record]),use_cache=False) # the DataFrame path of /predict and the batch scorer
+            self.registry.prediction_cache.build_lookup_table(artifacts) # with PREDICTION_LOOKUP_TABLE=1, so no request waits for it
+            seconds=time.perf_counter()-start
+            logging.info(f"Warm-up prediction finished in {seconds:.3f}s")
+            return seconds
+
+        except Exception as e:
+            raise CustomException(e,sys)
+
+    def predict_record(self,record: dict): # This method is the fast path for one row, it skips pandas and the ColumnTransformer.
+        try:
+            metrics=get_metrics()
+            with metrics.span("artifact_load"):
+                artifacts=self.registry.get()
+            cache=self.registry.prediction_cache
+            with metrics.span("cache_lookup"):
+                key=cache.make_key(record,CustomData.feature_columns,artifacts.version)
+                pred=cache.get(key)
+                if pred is None:
+                    pred=cache.lookup(record,artifacts)
+            if pred is None:
+                with metrics.span("transform"):
+                    data_scaled=artifacts.plan.transform_record(record)
+                with metrics.span("model_predict"):
+                    pred=artifacts.model.predict(data_scaled)[0]
+                cache.put(key,pred)
+            return np.array([pred])
+
+        except Exception as e:
+            raise CustomException(e,sys)
+
 
 
 class CustomData: # This class is responsible for taking user input and converting it into a format that can be used for prediction.
+    feature_columns=[
+        "gender",
+        "race_ethnicity",
+        "parental_level_of_education",
+        "lunch",
+        "test_preparation_course",
+        "reading_score",
+        "writing_score",
+    ]
+
     def __init__(  self,
         gender: str,
         race_ethnicity: str,
@@ -50,6 +121,9 @@ class CustomData: # This class is responsible for taking user input and converti
 
         self.writing_score = writing_score
 
+    def get_data_as_dict(self): # This method is responsible for converting the user input into a plain dict for the single-row fast path.
+        return {column: getattr(self,column) for column in CustomData.feature_columns}
+
     def get_data_as_data_frame(self): # This method is responsible for converting the user input into a pandas DataFrame.
         try:
             custom_data_input_dict = {
@@ -66,4 +140,108 @@ class CustomData: # This class is responsible for taking user input and converti
 
         except Exception as e:
             raise CustomException(e, sys)
- 
\ No newline at end of file
+
+    @staticmethod
+    def get_records_as_data_frame(records): # This method is responsible for converting a list of JSON records into a pandas DataFrame.
+        try:
+            missing=sorted({column for record in records for column in CustomData.feature_columns if column not in record})
+            if missing:
+                raise ValueError(f"Missing fields: {missing}")
+
+            return pd.DataFrame.from_records(records,columns=CustomData.feature_columns)
+
+        except Exception as e:
+            raise CustomException(e, sys)
+
+
+@dataclass
+class BatchScoringConfig: # it is used to store the settings of the offline bulk scoring entry point
+    chunksize: int=100_000 # rows read, scored and written at a time
+    n_workers: int=os.cpu_count() or 1
+    max_chunks_in_flight: int=0 # 0 means two per worker, it bounds the memory held by pending chunks
+    prediction_column: str="prediction"
+
+
+_worker_pipeline=None
+
+def _init_scoring_worker(registry_config): # it is used to load the model once per worker process
+    global _worker_pipeline
+    _worker_pipeline=PredictPipeline(registry=ArtifactRegistry(registry_config))
+    _worker_pipeline.registry.get()
+
+def _score_chunk(chunk):
+    return _worker_pipeline.predict(chunk[CustomData.feature_columns],use_cache=False)
+
+
+class BatchScorer: # This class scores a CSV/Parquet/Feather file chunk by chunk across a process pool.
+    def __init__(self,config: BatchScoringConfig=None,registry_config: ArtifactRegistryConfig=None):
+        self.config=config or BatchScoringConfig()
+        self.registry_config=registry_config or ArtifactRegistryConfig()
+
+    def score_file(self,input_path,output_path)->dict:
+        '''
+        This function streams input_path in chunks, predicts every chunk in a worker process and appends the
+        chunk with its predictions to output_path in input order. At most max_chunks_in_flight chunks are held.
+
+        '''
+        from src.utils import TableWriter,iter_table_chunks # file I/O helpers live with the training code, the web app does not need them
+
+        try:
+            start=time.perf_counter()
+            rows=0
+            n_workers=max(1,self.config.n_workers)
+            max_in_flight=self.config.max_chunks_in_flight or 2*n_workers
+
+            def write(writer,chunk,preds):
+                nonlocal rows
+                writer.write(chunk.assign(**{self.config.prediction_column:preds}))
+                rows+=len(chunk)
+                logging.info(f"Scored {rows} rows, {rows/(time.perf_counter()-start):.0f} rows/s")
+
+            with TableWriter(output_path) as writer:
+                if n_workers==1: # no pool, the chunks are scored in this process
+                    _init_scoring_worker(self.registry_config)
+                    for chunk in iter_table_chunks(input_path,self.config.chunksize):
+                        write(writer,chunk,_score_chunk(chunk))
+                else:
+                    with ProcessPoolExecutor(max_workers=n_workers,initializer=_init_scoring_worker,initargs=(self.registry_config,)) as pool:
+                        pending=deque()
+                        for chunk in iter_table_chunks(input_path,self.config.chunksize):
+                            pending.append((chunk,pool.submit(_score_chunk,chunk)))
+                            if len(pending)>=max_in_flight: # it is used to wait for the oldest chunk before reading more
+                                chunk,future=pending.popleft()
+                                write(writer,chunk,future.result())
+                        while pending:
+                            chunk,future=pending.popleft()
+                            write(writer,chunk,future.result())
+
+            elapsed=time.perf_counter()-start
+            summary={"rows": rows,"seconds": elapsed,"rows_per_second": rows/elapsed if elapsed else 0.0,"workers": n_workers}
+            logging.info(f"Batch scoring finished: {summary}")
+            return summary
+
+        except Exception as e:
+            raise CustomException(e,sys)
+
+
+def main(argv=None): # This function is the console script entry point for offline bulk scoring.
+    parser=argparse.ArgumentParser(description="Score a CSV, Parquet or Feather file of student records in parallel chunks.")
+    parser.add_argument("input",help="input file, the format is taken from the extension")
+    parser.add_argument("output",help="output file with a prediction column added, the format is taken from the extension")
+    parser.add_argument("--chunksize",type=int,default=BatchScoringConfig.chunksize)
+    parser.add_argument("--workers",type=int,default=BatchScoringConfig.n_workers)
+    parser.add_argument("--model",default=ArtifactRegistryConfig.model_file_path)
+    parser.add_argument("--preprocessor",default=ArtifactRegistryConfig.preprocessor_file_path)
+    args=parser.parse_args(argv)
+
+    scorer=BatchScorer(
+        BatchScoringConfig(chunksize=args.chunksize,n_workers=args.workers),
+        ArtifactRegistryConfig(model_file_path=args.model,preprocessor_file_path=args.preprocessor),
+    )
+    summary=scorer.score_file(args.input,args.output)
+    print(f"Scored {summary['rows']} rows in {summary['seconds']:.1f}s ({summary['rows_per_second']:.0f} rows/s) with {summary['workers']} workers")
+
+
+if __name__=="__main__":
+    main()
+
@@ -0,0 +1,187 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from itertools import product
+
+import numpy as np
+
+from src.logger import logging
+
+
+@dataclass
+class PredictionCacheConfig: # it is used to store the size and lifetime of cached predictions
+    max_entries: int=int(os.environ.get("PREDICTION_CACHE_SIZE","100000")) # 0 disables the cache
+    ttl: float=float(os.environ.get("PREDICTION_CACHE_TTL","3600")) # seconds, 0 keeps entries until they are evicted
+    lookup_table: bool=os.environ.get("PREDICTION_LOOKUP_TABLE","0")=="1" # precompute every integer score combination
+    score_range: tuple=(0,100)
+
+
+class PredictionLookupTable: # This class holds a precomputed prediction for every combination of categories and integer scores.
+    def __init__(self,plan,model,score_range=(0,100),chunk_rows=250_000):
+        self.score_low,self.score_high=score_range
+        n_scores=self.score_high-self.score_low+1
+        self.categorical=[(c["column"],{category:i for i,category in enumerate(c["categories"])}) for c in plan.categorical]
+        self.numerical=[c["column"] for c in plan.numerical]
+        self.shape=tuple(len(index) for _,index in self.categorical)+(n_scores,)*len(self.numerical)
+
+        # the design matrix is built block by block: one-hot columns from the category combination,
+        # scaled score columns from the integer grid, in the same row order as np.ravel_multi_index
+        scores=np.arange(self.score_low,self.score_high+1,dtype=np.float64)
+        score_grid=np.array(list(product(scores,repeat=len(self.numerical))),dtype=np.float64).reshape(-1,len(self.numerical))
+        predictions=[]
+        pending=[]
+        for combination in product(*(c["categories"] for c in plan.categorical)):
+            record=dict(zip((c["column"] for c in plan.categorical),combination))
+            record.update({column:0.0 for column in self.numerical})
+            block=np.repeat(plan.transform_record(record),len(score_grid),axis=0)
+            for j,c in enumerate(plan.numerical):
+                block[:,c["position"]]=(score_grid[:,j]-c["mean"])/c["scale"]
+            pending.append(block)
+            if sum(len(b) for b in pending)>=chunk_rows:
+                predictions.append(np.asarray(model.predict(np.vstack(pending)),dtype=np.float64))
+                pending=[]
+        if pending:
+            predictions.append(np.asarray(model.predict(np.vstack(pending)),dtype=np.float64))
+        self.values=np.concatenate(predictions)
+
+    def lookup(self,record):
+        '''
+        This function returns the precomputed prediction for record, or None when it is outside the grid
+
+        '''
+        index=[]
+        for column,categories in self.categorical:
+            position=categories.get(record.get(column))
+            if position is None:
+                return None
+            index.append(position)
+        for column in self.numerical:
+            try:
+                value=float(record.get(column))
+            except (TypeError,ValueError):
+                return None
+            if not value.is_integer() or not self.score_low<=value<=self.score_high: # NaN fails both checks as well
+                return None
+            index.append(int(value)-self.score_low)
+        return self.values[np.ravel_multi_index(tuple(index),self.shape)]
+
+
+class PredictionCache: # This class is an LRU/TTL cache of predictions keyed by the feature values and the artifact version.
+    def __init__(self,config: PredictionCacheConfig=None):
+        self.config=config or PredictionCacheConfig()
+        self._entries=OrderedDict()
+        self._lock=threading.Lock()
+        self._build_lock=threading.Lock() # a table build takes seconds, it must not hold up the LRU lookups
+        self._lookup_table=None # (artifact version, PredictionLookupTable)
+        self._building=None # (pid, artifact version) of the background build, threads do not survive a gunicorn fork
+        self.hits=0
+        self.misses=0
+        self.evictions=0
+        self.expirations=0
+        self.lookup_hits=0
+
+    @staticmethod
+    def make_key(record,columns,version):
+        '''
+        This function normalizes a record into a hashable key, so numeric values such as 72 and 72.0 share one entry
+
+        '''
+        key=[version]
+        for column in columns:
+            value=record.get(column)
+            if isinstance(value,(int,float,np.number)) and not isinstance(value,bool):
+                value=float(value)
+            key.append(value)
+        return tuple(key)
+
+    def get(self,key):
+        if not self.config.max_entries:
+            return None
+        with self._lock:
+            entry=self._entries.get(key)
+            if entry is None:
+                self.misses+=1
+                return None
+            value,expires_at=entry
+            if expires_at and expires_at<time.monotonic():
+                del self._entries[key]
+                self.expirations+=1
+                self.misses+=1
+                return None
+            self._entries.move_to_end(key) # it is used to mark the entry as most recently used
+            self.hits+=1
+            return value
+
+    def put(self,key,value):
+        if not self.config.max_entries:
+            return
+        expires_at=time.monotonic()+self.config.ttl if self.config.ttl else 0.0
+        with self._lock:
+            self._entries[key]=(value,expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries)>self.config.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions+=1
+
+    def build_lookup_table(self,bundle):
+        '''
+        This function builds the lookup table of bundle when it is enabled and not built yet. The warm-up calls it, so the
+        table is ready before traffic arrives (and shared with the forked workers); lookup calls it on a background thread.
+
+        '''
+        if not self.config.lookup_table:
+            return
+        with self._build_lock:
+            table=self._lookup_table
+            if table is None or table[0]<bundle.version: # a late build of an older version does not replace a newer table
+                start=time.perf_counter()
+                self._lookup_table=(bundle.version,PredictionLookupTable(bundle.plan,bundle.model,self.config.score_range))
+                logging.info(f"Built prediction lookup table of {self._lookup_table[1].values.size} entries in {time.perf_counter()-start:.1f}s")
+
+    def _build_in_background(self,bundle):
+        try:
+            self.build_lookup_table(bundle)
+        except Exception:
+            logging.exception("Building the prediction lookup table failed, the model answers instead") # not retried for this version
+
+    def lookup(self,record,bundle):
+        '''
+        This function answers from the precomputed lookup table when it is enabled. The table of a new artifact version
+        is built on a background thread, None is returned until it is ready so the model answers in the meantime.
+
+        '''
+        if not self.config.lookup_table:
+            return None
+        table=self._lookup_table
+        if table is None or table[0]!=bundle.version:
+            with self._lock:
+                start=self._building!=(os.getpid(),bundle.version)
+                self._building=(os.getpid(),bundle.version)
+            if start:
+                threading.Thread(target=self._build_in_background,args=(bundle,),name="lookup-table",daemon=True).start()
+            return None
+        value=table[1].lookup(record)
+        if value is not None:
+            with self._lock:
+                self.lookup_hits+=1
+        return value
+
+    def clear(self): # it is used to drop every cached prediction when the artifacts are reloaded
+        with self._lock:
+            self._entries.clear()
+            self._lookup_table=None
+
+    def stats(self)->dict:
+        with self._lock:
+            lookups=self.hits+self.misses
+            return {
+                "size": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits/lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "lookup_table_hits": self.lookup_hits,
+            }
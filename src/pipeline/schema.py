@@ -0,0 +1,184 @@
+import os
+import threading
+from dataclasses import dataclass,field
+
+import numpy as np
+import pandas as pd
+
+from src.pipeline.artifact_registry import get_registry
+
+
+@dataclass
+class RecordSchemaConfig: # it is used to store the accepted score range and how many row errors a response lists
+    score_min: float=float(os.environ.get("SCHEMA_SCORE_MIN","0"))
+    score_max: float=float(os.environ.get("SCHEMA_SCORE_MAX","100"))
+    max_errors: int=int(os.environ.get("SCHEMA_MAX_ERRORS","100")) # further invalid rows are only counted
+
+
+@dataclass
+class DecodedBatch: # typed columns of a whole payload with the rows that failed validation
+    columns: dict # column -> float64 array for scores, object array for categories, missing values already filled
+    valid: np.ndarray # bool mask of the rows that can be scored
+    errors: dict=field(default_factory=dict) # row -> {field: message}, for at most max_errors rows
+
+    @property
+    def n_rows(self)->int:
+        return len(self.valid)
+
+    @property
+    def n_invalid(self)->int:
+        return int(self.n_rows-self.valid.sum())
+
+    def frame(self,columns)->pd.DataFrame: # it is used to hand the valid rows to the predict pipeline
+        if self.valid.all():
+            return pd.DataFrame({column: self.columns[column] for column in columns})
+        return pd.DataFrame({column: self.columns[column][self.valid] for column in columns})
+
+    def error_list(self)->list:
+        return [{"row": row,"errors": errors} for row,errors in sorted(self.errors.items())]
+
+
+_JSON_NUMBER_TYPES={int,float,type(None)} # bool is a subclass of int, it is excluded by comparing the exact types
+
+
+def _is_number(value): # it is used to accept ints, floats and NumPy numbers but not bools, strings, lists or objects
+    return value is None or (isinstance(value,(int,float,np.integer,np.floating)) and not isinstance(value,bool))
+
+
+def _as_float(values):
+    '''
+    This function converts a list of JSON scores to float64 (None becomes NaN). Booleans, strings, lists and
+    objects are rejected even when NumPy could convert them, e.g. true or "5". The types are checked in one pass
+    and the conversion is one call when every value is a number, otherwise a per value loop finds the bad entries
+
+    '''
+    if {type(value) for value in values}<=_JSON_NUMBER_TYPES:
+        return np.asarray(values,dtype=np.float64),None
+    out=np.full(len(values),np.nan)
+    bad=np.zeros(len(values),dtype=bool)
+    for row,value in enumerate(values):
+        if not _is_number(value):
+            bad[row]=True
+        elif value is not None:
+            out[row]=float(value)
+    return out,bad
+
+
+class RecordSchema: # This class validates and decodes the CustomData fields of many records at once against the fitted preprocessor.
+    def __init__(self,numerical,categorical,config: RecordSchemaConfig=None,version=None):
+        self.numerical=numerical # column -> imputer fill (None when missing values are not imputed)
+        self.categorical=categorical # column -> (categories of the fitted one-hot encoder, fill, handle_unknown)
+        self.config=config or RecordSchemaConfig()
+        self.version=version
+        self.columns=list(numerical)+list(categorical)
+        self._range_message=f"must be between {self.config.score_min:g} and {self.config.score_max:g}"
+        self._category_messages={column:f"must be one of {sorted(categories)}" for column,(categories,_,_) in categorical.items()}
+
+    @classmethod
+    def from_plan(cls,plan,config: RecordSchemaConfig=None,version=None): # it is used to take the categories and fills from the inference plan
+        numerical={c["column"]:c["fill"] for c in plan.numerical}
+        categorical={c["column"]:(frozenset(c["categories"]),c["fill"],c["handle_unknown"]) for c in plan.categorical}
+        return cls(numerical,categorical,config,version)
+
+    def _payload_columns(self,payload):
+        '''
+        This function turns a list of records or a {column: list} payload into {column: (values, present mask or None)}
+
+        '''
+        if isinstance(payload,dict):
+            lengths={len(values) for values in payload.values() if isinstance(values,list)}
+            if len(lengths)!=1 or not all(isinstance(payload.get(column,[]),list) for column in self.columns):
+                raise ValueError("Column payloads must map every field to a list of the same length")
+            n_rows=lengths.pop()
+            return n_rows,{column:(payload[column],None) if column in payload else ([None]*n_rows,np.zeros(n_rows,dtype=bool)) for column in self.columns}
+        if not isinstance(payload,list) or not all(isinstance(record,dict) for record in payload):
+            raise ValueError("Payloads must be a list of records (objects) or an object of column lists")
+
+        n_rows=len(payload)
+        fields=frozenset(self.columns)
+        incomplete=[row for row,record in enumerate(payload) if not fields<=record.keys()] # one set comparison per record
+        columns={}
+        for column in self.columns:
+            present=None # None when every record has the field, the common case
+            if incomplete:
+                present=np.ones(n_rows,dtype=bool)
+                for row in incomplete:
+                    present[row]=column in payload[row]
+            columns[column]=([record.get(column) for record in payload],present)
+        return n_rows,columns
+
+    def decode(self,payload)->DecodedBatch:
+        '''
+        This function decodes a list of records (or a dict of column lists) into typed NumPy columns and checks every
+        field column-wise: presence, numbers within [score_min, score_max] and categories the encoder was fitted on.
+        Invalid rows are reported per row and field instead of failing the batch. A ValueError is raised only
+        when the payload itself is malformed.
+
+        '''
+        n_rows,raw=self._payload_columns(payload)
+        columns={}
+        problems=[] # (column, mask of failing rows, message), only for checks that failed somewhere
+        invalid=np.zeros(n_rows,dtype=bool)
+
+        def check(column,mask,message):
+            nonlocal invalid
+            if mask.any():
+                problems.append((column,mask,message))
+                invalid|=mask
+
+        for column,fill in self.numerical.items():
+            values,present=raw[column]
+            if present is not None:
+                check(column,~present,"is missing") # the first failing check of a field is the one reported
+            decoded,bad=_as_float(values)
+            if bad is not None:
+                check(column,bad,"must be a number")
+            if fill is None:
+                missing=np.isnan(decoded) if present is None else np.isnan(decoded)&present
+                check(column,missing if bad is None else missing&~bad,"must not be null")
+            check(column,(decoded<self.config.score_min)|(decoded>self.config.score_max),self._range_message) # NaN compares False
+            columns[column]=decoded if fill is None else np.where(np.isnan(decoded),fill,decoded)
+
+        for column,(categories,fill,handle_unknown) in self.categorical.items():
+            values,present=raw[column]
+            if present is not None:
+                check(column,~present,"is missing")
+            decoded=np.empty(n_rows,dtype=object)
+            decoded[:]=values # element-wise, so nested JSON values cannot add a dimension
+            try:
+                known=np.fromiter((value in categories for value in values),dtype=bool,count=n_rows)
+            except TypeError: # unhashable JSON values such as lists or objects
+                known=np.fromiter((isinstance(value,str) and value in categories for value in values),dtype=bool,count=n_rows)
+            if not known.all(): # only the rows outside the fitted categories can be missing or unknown
+                missing=np.zeros(n_rows,dtype=bool)
+                missing[~known]=pd.isna(decoded[~known])
+                if fill is None:
+                    check(column,missing if present is None else missing&present,"must not be null")
+                elif missing.any():
+                    decoded[missing]=fill # the imputer would fill the same value, None is not a missing value for it
+                if handle_unknown!="ignore":
+                    check(column,~known&~missing,self._category_messages[column])
+            columns[column]=decoded
+
+        errors={}
+        if problems:
+            reported=np.flatnonzero(invalid)[:self.config.max_errors]
+            for column,mask,message in problems:
+                for row in reported[mask[reported]]:
+                    errors.setdefault(int(row),{}).setdefault(column,message)
+        return DecodedBatch(columns=columns,valid=~invalid,errors=errors)
+
+
+_schemas={} # registry -> RecordSchema of the artifacts it serves
+_schema_lock=threading.Lock()
+
+def get_schema(registry=None)->RecordSchema: # it is used to get the schema of the artifacts a registry (the primary's by default) serves, it is rebuilt after a reload
+    registry=registry or get_registry()
+    bundle=registry.get()
+    schema=_schemas.get(registry)
+    if schema is None or schema.version!=bundle.version:
+        with _schema_lock:
+            schema=_schemas.get(registry)
+            if schema is None or schema.version!=bundle.version:
+                schema=_schemas[registry]=RecordSchema.from_plan(bundle.plan,version=bundle.version)
+    return schema
@@ -0,0 +1,270 @@
+import argparse
+import os
+import sys
+import time
+from collections import Counter
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+from src.exception import CustomException
+from src.logger import logging
+from src import serializers
+
+from src.components.data_ingestion import DataIngestion
+from src.components.data_transformation import DataTransformation
+from src.components.model_trainers import CONTINUABLE_MODELS,ModelTrainer
+from src.components.model_compiler import ModelCompiler,ModelCompilerConfig
+from src.utils import load_object,save_object,read_table,iter_table_chunks
+
+
+@dataclass
+class TrainPipelineConfig: # it is used to store when the incremental mode falls back to the full search
+    state_file_path: str=os.path.join("artifacts","training_state.pkl") # source checkpoint, running statistics and drift reference
+    strategy: str=os.environ.get("TRAIN_INCREMENTAL","refit") # "refit" with the known-good hyperparameters or "continue" boosting
+    extra_estimators: int=int(os.environ.get("TRAIN_CONTINUE_ESTIMATORS","20")) # boosting rounds added per incremental run
+    full_search_days: float=float(os.environ.get("TRAIN_FULL_SEARCH_DAYS","7")) # the full search reruns at least this often, 0 disables the schedule
+    drift_threshold: float=float(os.environ.get("TRAIN_DRIFT_THRESHOLD","0.2")) # population stability index of any column that triggers the full search
+    drift_min_rows: int=int(os.environ.get("TRAIN_DRIFT_MIN_ROWS","200")) # new rows are pooled until the drift estimate is stable
+    drift_bins: int=10 # quantile bins of the numeric columns
+
+
+def drift_value_counts(df)->dict: # it is used to collect the value counts a drift reference is built from, counts of several chunks are merged with merge_value_counts
+    value_counts={}
+    for column in df.columns:
+        values=df[column].dropna()
+        numeric=values.dtype.kind in "iuf"
+        counts=(values.astype(np.float64) if numeric else values.astype(str)).value_counts()
+        value_counts[column]={"numeric": numeric,"counts": Counter(counts.to_dict())}
+    return value_counts
+
+
+def merge_value_counts(total,value_counts)->dict: # it is used to add the value counts of one chunk to the running ones
+    for column,entry in value_counts.items():
+        if column not in total:
+            total[column]={"numeric": entry["numeric"],"counts": Counter()}
+        total[column]["counts"].update(entry["counts"])
+    return total
+
+
+def _weighted_quantile(values,weights,q): # it is used to get np.quantile of the values repeated weights times without repeating them
+    cumulative=np.cumsum(weights)
+    position=q*(cumulative[-1]-1)
+    lower=np.floor(position)
+    below=values[np.searchsorted(cumulative,lower,side="right")]
+    above=values[np.minimum(np.searchsorted(cumulative,lower+1,side="right"),len(values)-1)]
+    return below+(above-below)*(position-lower)
+
+
+def drift_reference_from_counts(value_counts,bins=10)->dict:
+    '''
+    This function returns the binning and the expected share per bin of every column from the merged value counts,
+    so the reference of a file streamed chunk by chunk matches the one drift_reference computes from the whole dataframe
+
+    '''
+    reference={}
+    for column,entry in value_counts.items():
+        counts=entry["counts"]
+        keys=sorted(counts)
+        if entry["numeric"]:
+            values=np.asarray(keys,dtype=np.float64)
+            weights=np.asarray([counts[key] for key in keys],dtype=np.float64)
+            if len(values):
+                edges=np.unique(_weighted_quantile(values,weights,np.linspace(0,1,bins+1)[1:-1]))
+            else:
+                edges=np.empty(0)
+            index=np.searchsorted(edges,values,side="right")
+            expected=np.bincount(index,weights=weights,minlength=len(edges)+1)
+            reference[column]={"edges": edges}
+        else:
+            expected=np.asarray([counts[key] for key in keys]+[0],dtype=np.float64) # the last bin holds unseen categories
+            reference[column]={"categories": keys}
+        reference[column]["expected"]=expected/max(expected.sum(),1)
+    return reference
+
+
+def drift_reference(df,bins=10)->dict:
+    '''
+    This function returns the binning and the expected share per bin of every column of df, the reference
+    the population stability index of newer rows is computed against
+
+    '''
+    return drift_reference_from_counts(drift_value_counts(df),bins)
+
+
+def drift_counts(df,reference)->dict: # it is used to count rows per reference bin, unseen categories share one extra bin
+    counts={}
+    for column,binning in reference.items():
+        values=df[column].dropna()
+        if "edges" in binning:
+            index=np.searchsorted(binning["edges"],values.to_numpy(dtype=np.float64),side="right")
+            counts[column]=np.bincount(index,minlength=len(binning["edges"])+1).astype(np.float64)
+        else:
+            codes=pd.Categorical(values.astype(str),categories=binning["categories"]).codes # -1 for unseen categories
+            counts[column]=np.append(np.bincount(codes[codes>=0],minlength=len(binning["categories"])),(codes<0).sum()).astype(np.float64)
+    return counts
+
+
+def population_stability_index(expected,counts,epsilon=1e-4)->float: # it is used to score how far the new rows moved from the reference
+    actual=counts/max(counts.sum(),1)
+    expected=np.clip(expected,epsilon,None)
+    actual=np.clip(actual,epsilon,None)
+    return float(np.sum((actual-expected)*np.log(actual/expected)))
+
+
+class TrainPipeline: # This class decides between an incremental update and the full pipeline and runs it.
+    def __init__(self,config: TrainPipelineConfig=None):
+        self.config=config or TrainPipelineConfig()
+        self.data_ingestion=DataIngestion()
+        self.data_transformation=DataTransformation()
+        self.model_trainer=ModelTrainer()
+
+    def _compile(self,test_path): # it is used to refresh the NumPy-only serving artifact after the model changed
+        return ModelCompiler(ModelCompilerConfig(test_data_path=test_path)).initiate_model_compilation()
+
+    def _write_version(self): # it is used to mark model.pkl and proprocessor.pkl as one version once both are saved, the app swaps them in together
+        serializers.write_version(self.model_trainer.model_trainer_config.trained_model_file_path,
+                                  self.data_transformation.data_transformation_config.preprocessor_obj_file_path)
+
+    def _full_search_due(self,state): # it is used to rerun the full search on a schedule
+        days=self.config.full_search_days
+        return bool(days) and time.time()-state["last_full_search"]>=days*86400
+
+    def _drift(self,state,new_rows):
+        '''
+        This function adds new_rows to the rows pooled since the last full search and returns {column: population
+        stability index} once at least drift_min_rows are pooled, or an empty dict before that
+
+        '''
+        for column,counts in drift_counts(new_rows,state["drift_reference"]).items():
+            state["drift_counts"][column]=state["drift_counts"].get(column,0)+counts
+        state["drift_rows"]+=len(new_rows)
+        if state["drift_rows"]<self.config.drift_min_rows:
+            return {}
+        return {
+            column:population_stability_index(binning["expected"],state["drift_counts"][column])
+            for column,binning in state["drift_reference"].items()
+        }
+
+    def run_full(self,reason="requested")->dict:
+        '''
+        This function runs ingestion, transformation, the full hyperparameter search and the model compilation,
+        then stores the source checkpoint and the statistics later incremental runs start from
+
+        '''
+        try:
+            logging.info(f"Running the full training pipeline: {reason}")
+            checkpoint=self.data_ingestion.source_checkpoint()
+            chunksize=self.data_ingestion.ingestion_config.chunksize
+            if chunksize:
+                train_path,test_path=self.data_ingestion.initiate_chunked_data_ingestion()
+                train_arr,test_arr,preprocessor_path=self.data_transformation.initiate_chunked_data_transformation(train_path,test_path,chunksize=chunksize)
+            else:
+                train_path,test_path=self.data_ingestion.initiate_data_ingestion()
+                train_arr,test_arr,preprocessor_path=self.data_transformation.initiate_data_transformation(train_path,test_path)
+
+            r2_square=self.model_trainer.initiate_model_trainer(train_arr,test_arr)
+            compilation=self._compile(test_path)
+            self._write_version()
+
+            preprocessor=load_object(preprocessor_path)
+            if chunksize: # the statistics are merged chunk by chunk so the train file is never loaded as a whole
+                value_counts,counts={},{}
+                for chunk in iter_table_chunks(train_path,chunksize):
+                    merge_value_counts(value_counts,drift_value_counts(chunk))
+                    for column,counter in self.data_transformation.column_counts(preprocessor,chunk).items():
+                        counts.setdefault(column,Counter()).update(counter)
+            else:
+                train_df=read_table(train_path)
+                value_counts=drift_value_counts(train_df)
+                counts=self.data_transformation.column_counts(preprocessor,train_df)
+            reference=drift_reference_from_counts(value_counts,self.config.drift_bins) # the target is included to catch label drift
+            save_object(self.config.state_file_path,{
+                "checkpoint": checkpoint,
+                "preprocessor": preprocessor, # carries the running scaler statistics, it is saved for serving only on refits
+                "counts": counts,
+                "model_class": type(load_object(self.model_trainer.model_trainer_config.trained_model_file_path)).__name__,
+                "last_full_search": time.time(),
+                "drift_reference": reference,
+                "drift_counts": {},
+                "drift_rows": 0,
+            })
+            return {"mode": "full","reason": reason,"r2": r2_square,"compiled": compilation.get("passed")}
+
+        except Exception as e:
+            raise CustomException(e,sys)
+
+    def run_incremental(self)->dict:
+        '''
+        This function trains on the rows appended to the source since the last run without the hyperparameter search.
+        It falls back to run_full when the schedule is due, the ingested part of the source changed, new categories
+        appear, a column drifted past drift_threshold or the updated model scores below the trainer's min_r2.
+
+        '''
+        try:
+            state=load_object(self.config.state_file_path)
+            if self._full_search_due(state):
+                return self.run_full(f"scheduled full search every {self.config.full_search_days:g} days")
+            if not self.data_ingestion.is_source_appended(state["checkpoint"]):
+                return self.run_full("the already ingested source rows changed")
+
+            new_train,new_test,checkpoint=self.data_ingestion.initiate_incremental_data_ingestion(state["checkpoint"])
+            state["checkpoint"]=checkpoint
+            save_object(self.config.state_file_path,state) # the rows are appended now, a failed run must not append them again
+            if not len(new_train)+len(new_test):
+                return {"mode": "unchanged","new_rows": 0}
+
+            new_rows=pd.concat([new_train,new_test],ignore_index=True)
+            unseen=self.data_transformation.unseen_categories(state["preprocessor"],new_rows)
+            if unseen:
+                return self.run_full(f"new categories {unseen}")
+            drift=self._drift(state,new_rows)
+            drifted={column:round(psi,4) for column,psi in drift.items() if psi>self.config.drift_threshold}
+            if drifted:
+                return self.run_full(f"drift above {self.config.drift_threshold} in {drifted}")
+
+            continue_boosting=self.config.strategy=="continue" and state["model_class"] in CONTINUABLE_MODELS
+            ingestion_config=self.data_ingestion.ingestion_config
+            train_arr,test_arr,_=self.data_transformation.initiate_incremental_data_transformation(
+                ingestion_config.train_data_path,ingestion_config.test_data_path,new_train,
+                state["preprocessor"],state["counts"],serve=not continue_boosting, # boosted trees keep the input scaling they were fitted on
+            )
+            r2_square=self.model_trainer.initiate_incremental_model_trainer(
+                train_arr,test_arr,len(new_train),
+                strategy="continue" if continue_boosting else "refit",
+                extra_estimators=self.config.extra_estimators,
+            )
+            if r2_square<self.model_trainer.model_trainer_config.min_r2:
+                return self.run_full(f"incremental r2 {r2_square:.4f} below {self.model_trainer.model_trainer_config.min_r2}")
+
+            compilation=self._compile(ingestion_config.test_data_path)
+            self._write_version()
+            save_object(self.config.state_file_path,state)
+            return {
+                "mode": "continue" if continue_boosting else "refit",
+                "new_rows": len(new_rows),
+                "r2": r2_square,
+                "max_drift": round(max(drift.values()),4) if drift else None,
+                "compiled": compilation.get("passed"),
+            }
+
+        except Exception as e:
+            raise CustomException(e,sys)
+
+    def run(self,mode="auto")->dict: # it is used to run the incremental mode when a previous full run left its state behind
+        if mode=="full" or (mode=="auto" and not os.path.exists(self.config.state_file_path)):
+            return self.run_full("no incremental state" if mode=="auto" else "requested")
+        return self.run_incremental()
+
+
+def main(argv=None): # This function is the console script entry point for (re)training.
+    parser=argparse.ArgumentParser(description="Train on the rows appended to the source data, or rerun the full pipeline with the hyperparameter search.")
+    parser.add_argument("--mode",choices=("auto","incremental","full"),default="auto",
+                        help="auto trains incrementally when a previous full run exists")
+    args=parser.parse_args(argv)
+    print(TrainPipeline().run(args.mode))
+
+
+if __name__=="__main__":
+    main()
@@ -0,0 +1,218 @@
+import hashlib
+import json
+import os
+import pickle
+import time
+
+
+MANIFEST_SUFFIX=".manifest.json"
+VERSION_FILE_NAME="artifacts_version.json" # names the model and preprocessor files that were saved together
+
+
+def manifest_path(file_path): # it is used to find the manifest written next to every saved object
+    return f"{file_path}{MANIFEST_SUFFIX}"
+
+
+def file_sha256(file_path):
+    digest=hashlib.sha256()
+    with open(file_path,"rb") as file_obj:
+        for block in iter(lambda: file_obj.read(1<<20),b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _is_json(value):
+    try:
+        json.dumps(value)
+        return True
+    except (TypeError,ValueError):
+        return False
+
+
+def _class_path(obj):
+    return f"{type(obj).__module__}.{type(obj).__qualname__}"
+
+
+class PickleSerializer: # Plain pickle, it works for any object and is the format of artifacts saved before the manifest existed.
+    name="pickle"
+
+    def version(self):
+        return str(pickle.HIGHEST_PROTOCOL)
+
+    def dump(self,obj,file_path):
+        with open(file_path,"wb") as file_obj:
+            pickle.dump(obj,file_obj,protocol=pickle.HIGHEST_PROTOCOL)
+
+    def load(self,file_path,class_path=None,params=None):
+        with open(file_path,"rb") as file_obj:
+            return pickle.load(file_obj)
+
+
+class JoblibSerializer: # joblib stores numpy arrays as raw buffers, which are memory mapped on load and shared between processes.
+    name="joblib"
+
+    def __init__(self,mmap_mode="r"):
+        self.mmap_mode=mmap_mode
+
+    def version(self):
+        import joblib
+        return joblib.__version__
+
+    def dump(self,obj,file_path):
+        import joblib
+        joblib.dump(obj,file_path) # uncompressed, compressed files cannot be memory mapped
+
+    def load(self,file_path,class_path=None,params=None):
+        import joblib
+        return joblib.load(file_path,mmap_mode=self.mmap_mode)
+
+
+class CatBoostSerializer: # CatBoost's own .cbm format, it loads faster than pickle and does not execute code.
+    name="catboost"
+
+    def version(self):
+        import catboost
+        return catboost.__version__
+
+    def dump(self,obj,file_path):
+        obj.save_model(file_path,format="cbm")
+
+    def load(self,file_path,class_path=None,params=None): # the .cbm file keeps the training parameters itself
+        import catboost
+        class_name=(class_path or "catboost.CatBoostRegressor").rsplit(".",1)[-1]
+        model=getattr(catboost,class_name,catboost.CatBoostRegressor)()
+        model.load_model(file_path,format="cbm")
+        return model
+
+
+class XGBoostSerializer: # XGBoost's UBJSON model format, it does not execute code. The sklearn wrapper parameters go in the manifest.
+    name="xgboost"
+
+    def params(self,obj): # it is used to keep learning_rate, n_estimators, early_stopping_rounds..., which UBJSON does not store
+        return {key:value for key,value in obj.get_params().items() if _is_json(value)}
+
+    def version(self):
+        import xgboost
+        return xgboost.__version__
+
+    def dump(self,obj,file_path):
+        ubj_path=f"{file_path}.ubj" # xgboost picks the format from the extension
+        obj.save_model(ubj_path)
+        os.replace(ubj_path,file_path)
+
+    def load(self,file_path,class_path=None,params=None):
+        import xgboost
+        class_name=(class_path or "xgboost.XGBRegressor").rsplit(".",1)[-1]
+        model=getattr(xgboost,class_name,xgboost.XGBRegressor)()
+        with open(file_path,"rb") as file_obj:
+            model.load_model(bytearray(file_obj.read())) # loading from a buffer detects the format from the content
+        if params:
+            model.set_params(**params) # without them clone() would refit with the library defaults
+        return model
+
+
+SERIALIZERS={serializer.name:serializer for serializer in (PickleSerializer(),JoblibSerializer(),CatBoostSerializer(),XGBoostSerializer())}
+
+
+def choose_serializer(obj):
+    '''
+    This function picks the native format of a model when there is one. joblib is only chosen for estimators that keep
+    their training data as plain arrays (nearest neighbours), where memory mapping avoids a copy; sklearn tree ensembles
+    copy their node arrays into Cython trees on load, so for them pickle protocol 5 is faster (see benchmarks/bench_serializers.py)
+
+    '''
+    modules=[cls.__module__ for cls in type(obj).__mro__]
+    if any(module.startswith("catboost") for module in modules):
+        return SERIALIZERS["catboost"]
+    if any(module.startswith("xgboost") for module in modules):
+        return SERIALIZERS["xgboost"]
+    if any(module.startswith("sklearn.neighbors") for module in modules):
+        return SERIALIZERS["joblib"]
+    return SERIALIZERS["pickle"]
+
+
+def dump(obj,file_path,serializer=None):
+    '''
+    This function saves obj with the given (or automatically chosen) serializer and writes a manifest next to it
+    recording the format, the library version and a checksum. Both files are replaced atomically.
+
+    '''
+    serializer=SERIALIZERS[serializer] if isinstance(serializer,str) else serializer or choose_serializer(obj)
+    tmp_path=f"{file_path}.tmp"
+    serializer.dump(obj,tmp_path)
+    manifest={
+        "format": serializer.name,
+        "format_version": serializer.version(),
+        "class": _class_path(obj),
+        "sha256": file_sha256(tmp_path),
+        "size": os.path.getsize(tmp_path),
+        "created_at": time.time(),
+    }
+    if hasattr(serializer,"params"):
+        manifest["params"]=serializer.params(obj)
+    os.replace(tmp_path,file_path)
+    tmp_manifest=f"{manifest_path(file_path)}.tmp"
+    with open(tmp_manifest,"w",encoding="utf-8") as file_obj:
+        json.dump(manifest,file_obj,indent=1)
+    os.replace(tmp_manifest,manifest_path(file_path))
+    return manifest
+
+
+def read_manifest(file_path):
+    if not os.path.exists(manifest_path(file_path)):
+        return None
+    with open(manifest_path(file_path),encoding="utf-8") as file_obj:
+        return json.load(file_obj)
+
+
+def load(file_path,verify=True):
+    '''
+    This function loads an object saved by dump, checking its checksum first.
+    Files without a manifest are loaded with pickle, which is how artifacts were saved before.
+
+    '''
+    manifest=read_manifest(file_path)
+    if manifest is None:
+        return SERIALIZERS["pickle"].load(file_path)
+    if verify and file_sha256(file_path)!=manifest["sha256"]:
+        raise ValueError(f"Checksum mismatch for {file_path}, the file does not match its manifest")
+    return SERIALIZERS[manifest["format"]].load(file_path,class_path=manifest.get("class"),params=manifest.get("params"))
+
+
+def version_path(model_path): # it is used to find the version marker, it lives next to model.pkl
+    return os.path.join(os.path.dirname(model_path),VERSION_FILE_NAME)
+
+
+def write_version(model_path,preprocessor_path,file_path=None):
+    '''
+    This function writes the version marker naming the checksums of a model and the preprocessor it was trained with.
+    It is written after both files, so a reader that only swaps in a pair matching the marker never mixes two trainings.
+
+    '''
+    file_path=file_path or version_path(model_path)
+    version={
+        "model": file_sha256(model_path),
+        "preprocessor": file_sha256(preprocessor_path),
+        "created_at": time.time(),
+    }
+    with open(f"{file_path}.tmp","w",encoding="utf-8") as file_obj:
+        json.dump(version,file_obj,indent=1)
+    os.replace(f"{file_path}.tmp",file_path)
+    return version
+
+
+def read_version(file_path):
+    if not os.path.exists(file_path):
+        return None
+    with open(file_path,encoding="utf-8") as file_obj:
+        return json.load(file_obj)
+
+
+def matches_version(version,model_path,preprocessor_path)->bool: # it is used to check that the files on disk are the pair the marker names
+    return file_sha256(model_path)==version["model"] and file_sha256(preprocessor_path)==version["preprocessor"]
+
+
+def remove(file_path): # it is used to delete a saved object together with its manifest
+    for path in (file_path,manifest_path(file_path)):
+        if os.path.exists(path):
+            os.remove(path)
@@ -1,52 +1,391 @@
+import json
 import os
+import shutil
 import sys
+import tempfile
+import time
 
 import numpy as np 
 import pandas as pd
-import dill # it is used to serialize and deserialize the python objects 
-import pickle
-from sklearn.metrics import r2_score
-from sklearn.model_selection import GridSearchCV
 
+# sklearn and joblib are imported inside the training helpers below, like pyarrow in the table helpers,
+# so that importing this module for save_object/load_object or the table I/O stays cheap
+from src import serializers
 from src.exception import CustomException
+from src.logger import logging
 
-def save_object(file_path, obj): # it is used to save the object in the specified path
+def save_object(file_path, obj, serializer=None): # it is used to save the object in the specified path
     try:
         dir_path = os.path.dirname(file_path) # it is used to get the directory path of the file
 
         os.makedirs(dir_path, exist_ok=True) # it is used to create the directory if it does not exist
 
-        with open(file_path, "wb") as file_obj: # it is used to open the file in write binary mode
-            pickle.dump(obj, file_obj) # it is used to dump the object in the file
+        # native formats are used where they exist (CatBoost .cbm, XGBoost UBJSON), joblib with memory mapping for
+        # nearest neighbour models and pickle otherwise; a manifest with the format, version and checksum is written next to the file
+        serializers.dump(obj, file_path, serializer=serializer)
 
     except Exception as e:
         raise CustomException(e, sys)
     
-def evaluate_models(X_train, y_train,X_test,y_test,models,param):
+def _split_n_jobs(n_jobs,n_models): # it is used to share the cores between model level and fold level parallelism
+    cores=os.cpu_count() or 1
+    total=cores if n_jobs is None or n_jobs<0 else max(1,n_jobs)
+    model_jobs=max(1,min(n_models,total))
+    fold_jobs=max(1,total//model_jobs)
+    return model_jobs,fold_jobs
+
+def _candidates(para,search,n_iter,random_state): # it is used to list the parameter combinations a search will try
+    from sklearn.model_selection import ParameterGrid,ParameterSampler
+    grid=ParameterGrid(para)
+    if search=="random":
+        return list(ParameterSampler(para,n_iter=min(n_iter,len(grid)),random_state=random_state))
+    candidates=list(grid)
+    np.random.RandomState(random_state).shuffle(candidates) # shuffled so that a budget cut does not only see one corner of the grid
+    return candidates
+
+def _candidate_id(model,candidate): # it is used to identify a candidate across processes and runs
+    defaults=model.get_params()
+    # values equal to the estimator default are dropped, so adding a key to a grid does not invalidate earlier scores
+    effective={key:value for key,value in candidate.items() if key not in defaults or defaults[key]!=value}
+    return json.dumps(effective,sort_keys=True,default=repr)
+
+# the parameter that only adds stages to an ensemble: a fit with the largest value contains every smaller one
+STAGED_PARAMS={
+    "GradientBoostingRegressor": "n_estimators",
+    "AdaBoostRegressor": "n_estimators",
+    "RandomForestRegressor": "n_estimators",
+    "XGBRegressor": "n_estimators",
+    "CatBoostRegressor": "iterations",
+}
+EARLY_STOPPING_MODELS=("XGBRegressor","CatBoostRegressor")
+# models that fit faster on the CSR one-hot matrix; sklearn trees slow down 25-30x on it and XGBoost reads the absent zeros as missing values
+SPARSE_MODELS=("LinearRegression",)
+# models that convert X to float32 before fitting, one float32 copy per search gives the same fits without a conversion per fit
+FLOAT32_MODELS=("RandomForestRegressor","DecisionTreeRegressor","GradientBoostingRegressor","AdaBoostRegressor","XGBRegressor","CatBoostRegressor")
+
+def peak_rss_mb(children=False): # it is used to report the peak resident memory of this process, or of its finished worker processes
     try:
-        report = {}
+        import resource
+    except ImportError: # not available on Windows
+        return float("nan")
+    usage=resource.getrusage(resource.RUSAGE_CHILDREN if children else resource.RUSAGE_SELF)
+    return usage.ru_maxrss/(1024*1024 if sys.platform=="darwin" else 1024) # bytes on macOS, kilobytes on Linux
+
+def fit_estimator(estimator,X,y,early_stopping_rounds=0):
+    '''
+    This function fits estimator, holding out 10% of the rows as a validation set for early stopping
+    when early_stopping_rounds is set and the model supports it (XGBoost, CatBoost)
+
+    '''
+    from sklearn.model_selection import train_test_split
+    name=type(estimator).__name__
+    if not early_stopping_rounds or name not in EARLY_STOPPING_MODELS:
+        return estimator.fit(X,y)
+    X_fit,X_val,y_fit,y_val=train_test_split(X,y,test_size=0.1,random_state=0)
+    if name=="XGBRegressor":
+        estimator.set_params(early_stopping_rounds=early_stopping_rounds) # predict then uses the best iteration
+        return estimator.fit(X_fit,y_fit,eval_set=[(X_val,y_val)],verbose=False)
+    return estimator.fit(X_fit,y_fit,eval_set=(X_val,y_val),early_stopping_rounds=early_stopping_rounds) # CatBoost keeps the best iteration only
+
+def _staged_predictions(estimator,X,stages):
+    '''
+    This function returns {stage: predictions of the first stage members of the fitted ensemble} without refitting,
+    using staged_predict, iteration_range (XGBoost), ntree_end (CatBoost), a weighted median (AdaBoost) or a running mean (forests)
+
+    '''
+    name=type(estimator).__name__
+    if name=="XGBRegressor":
+        best_iteration=getattr(estimator,"best_iteration",None) if estimator.get_params().get("early_stopping_rounds") else None
+        limit=best_iteration+1 if best_iteration is not None else max(stages)
+        return {stage:estimator.predict(X,iteration_range=(0,min(stage,limit))) for stage in stages}
+    if name=="CatBoostRegressor":
+        return {stage:estimator.predict(X,ntree_end=min(stage,estimator.tree_count_)) for stage in stages}
+    if name=="AdaBoostRegressor": # weighted median of the first k estimators, computed only for the wanted stages
+        members=np.stack([member.predict(X) for member in estimator.estimators_],axis=1)
+        rows=np.arange(len(members))
+        predictions={}
+        for stage in stages:
+            limit=min(stage,members.shape[1]) # AdaBoost stops early on a perfect fit
+            sorted_index=np.argsort(members[:,:limit],axis=1)
+            weight_cdf=np.cumsum(estimator.estimator_weights_[:limit][sorted_index],axis=1,dtype=np.float64)
+            median_index=(weight_cdf>=0.5*weight_cdf[:,-1][:,None]).argmax(axis=1)
+            predictions[stage]=members[rows,sorted_index[rows,median_index]]
+        return predictions
+    if hasattr(estimator,"staged_predict"): # gradient boosting
+        wanted=set(stages)
+        predictions={}
+        pred=None
+        for count,pred in enumerate(estimator.staged_predict(X),start=1):
+            if count in wanted:
+                predictions[count]=pred
+        return {stage:predictions.get(stage,pred) for stage in stages}
+    X=np.asarray(X,dtype=np.float32) # forests: the prediction of k trees is the mean of the first k trees
+    total=np.zeros(len(X))
+    predictions={}
+    wanted=set(stages)
+    for count,tree in enumerate(estimator.estimators_,start=1):
+        total+=tree.predict(X,check_input=False)
+        if count in wanted:
+            predictions[count]=total/count
+    return predictions
+
+def _score_stages(model,params,stage_param,stages,X,y,train_index,test_index,early_stopping_rounds):
+    '''
+    This function fits the largest ensemble of one parameter combination on one CV fold and returns {stage: r2 on the held out part}
+
+    '''
+    from sklearn.base import clone
+    from sklearn.metrics import r2_score
+    estimator=clone(model).set_params(**params,**{stage_param:max(stages)})
+    fit_estimator(estimator,X[train_index],y[train_index],early_stopping_rounds)
+    predictions=_staged_predictions(estimator,X[test_index],stages)
+    return {stage:r2_score(y[test_index],pred) for stage,pred in predictions.items()}
+
+def _run_staged_candidates(model,stage_param,candidates,X_train,y_train,cv,n_jobs,deadline,early_stopping_rounds):
+    '''
+    This function cross validates candidates that differ only in stage_param with one fit of the largest value per fold,
+    and returns {candidate id: mean CV score}. The folds are the ones GridSearchCV would use (cv may be a list of splits).
+
+    '''
+    from joblib import Parallel,delayed
+    from sklearn.model_selection import check_cv
+    groups={}
+    for candidate in candidates:
+        params={key:value for key,value in candidate.items() if key!=stage_param}
+        groups.setdefault(json.dumps(params,sort_keys=True,default=repr),(params,[]))[1].append(candidate)
+    groups=list(groups.values())
+    splits=list(check_cv(cv,y_train,classifier=False).split(X_train,y_train))
+
+    new_scores={}
+    round_size=len(groups) if deadline is None else max(1,n_jobs)
+    for start in range(0,len(groups),max(1,round_size)):
+        chunk=groups[start:start+round_size]
+        fold_scores=Parallel(n_jobs=n_jobs)(
+            delayed(_score_stages)(model,params,stage_param,sorted({c[stage_param] for c in group}),X_train,y_train,train_index,test_index,early_stopping_rounds)
+            for params,group in chunk
+            for train_index,test_index in splits
+        )
+        for i,(params,group) in enumerate(chunk):
+            folds=fold_scores[i*len(splits):(i+1)*len(splits)]
+            for candidate in group:
+                new_scores[_candidate_id(model,candidate)]=float(np.mean([scores[candidate[stage_param]] for scores in folds]))
+        if deadline is not None and time.time()>=deadline and start+round_size<len(groups):
+            logging.info(f"Search budget exhausted after {start+len(chunk)} of {len(groups)} staged fits")
+            break
+    logging.info(f"{type(model).__name__}: scored {len(new_scores)} candidates with {len(groups)*len(splits)} staged fits instead of {len(candidates)*len(splits)}")
+    return new_scores
+
+def _run_candidates(model,candidates,known_scores,X_train,y_train,cv,n_jobs,deadline,early_stopping_rounds=0):
+    '''
+    This function cross validates the candidates that have no known score yet and returns {candidate id: mean CV score}.
+    Candidates of boosting models and forests are grouped by everything but their number of stages and scored from one
+    fit of the largest ensemble per fold. The rest are evaluated in one GridSearchCV without a deadline; with one they
+    are evaluated in small rounds and no new round is started once the deadline has passed.
+
+    '''
+    from sklearn.model_selection import GridSearchCV
+    missing=[candidate for candidate in candidates if _candidate_id(model,candidate) not in known_scores]
+    new_scores={}
+    stage_param=STAGED_PARAMS.get(type(model).__name__)
+    if stage_param is not None:
+        staged=[candidate for candidate in missing if stage_param in candidate]
+        missing=[candidate for candidate in missing if stage_param not in candidate]
+        if staged:
+            new_scores.update(_run_staged_candidates(model,stage_param,staged,X_train,y_train,cv,n_jobs,deadline,early_stopping_rounds))
+            if deadline is not None and time.time()>=deadline:
+                return new_scores
+    round_size=len(missing) if deadline is None else max(2,2*n_jobs)
+    for start in range(0,len(missing),max(1,round_size)):
+        chunk=missing[start:start+round_size]
+        gs=GridSearchCV(model,[{key:[value] for key,value in candidate.items()} for candidate in chunk],cv=cv,n_jobs=n_jobs,refit=False)
+        gs.fit(X_train,y_train)
+        for candidate,score in zip(chunk,gs.cv_results_["mean_test_score"]):
+            new_scores[_candidate_id(model,candidate)]=float(score)
+        if deadline is not None and time.time()>=deadline and start+round_size<len(missing):
+            logging.info(f"Search budget exhausted after {start+len(chunk)} of {len(missing)} new candidates")
+            break
+    return new_scores
+
+def _best_candidate(model,candidates,scores):
+    scored=[candidate for candidate in candidates if _candidate_id(model,candidate) in scores]
+    return max(scored,key=lambda candidate: scores[_candidate_id(model,candidate)])
+
+def _training_matrix(model,X,sparse_density,block_bytes=64*1024*1024):
+    '''
+    This function returns X in the representation the model fits best on, converted once per search instead of in every fit:
+    CSR for SPARSE_MODELS when at most sparse_density of the entries are non-zero, float32 for FLOAT32_MODELS, X otherwise.
+    An X that is float32 already (SharedTrainingData.X32) is used as it is.
+
+    '''
+    name=type(model).__name__
+    if name in SPARSE_MODELS and sparse_density>0:
+        from scipy import sparse
+        step=max(1,block_bytes//max(1,X[:1].nbytes))
+        blocks=[X[start:start+step] for start in range(0,len(X),step)] # row blocks, a dense copy is never made
+        density=sum(np.count_nonzero(block) for block in blocks)/max(1,X.size)
+        if density<=sparse_density:
+            logging.info(f"{name}: searched on CSR, feature density {density:.2f}")
+            return sparse.vstack([sparse.csr_matrix(block) for block in blocks],format="csr")
+    if name in FLOAT32_MODELS:
+        return np.asarray(X,dtype=np.float32)
+    return X
 
-        for i in range(len(list(models))): # it is used to iterate through the models
-            model = list(models.values())[i] # it is used to get the model from the list of models
-            para=param[list(models.keys())[i]] # it is used to get the parameters of the model from the list of parameters
+class SharedTrainingData: # This class prepares the training data once for the hyperparameter searches of every model.
+    def __init__(self,X,y,cv,shared=False,float32=False):
+        '''
+        The CV folds are split once and every search uses the same ones. With shared=True (parallel workers) the matrix,
+        the target and the fold indices are written once to memory maps, preferably in /dev/shm, so joblib hands every
+        worker and every nested search a file name instead of pickling them. Persisted feature matrices are memory maps already.
+        With float32=True the float32 copy the FLOAT32_MODELS fit on is made once here as X32, shared the same way.
 
-            gs = GridSearchCV(model,para,cv=3) # it is used to perform grid search cross validation on the model with the parameters
-            gs.fit(X_train,y_train) # it is used to fit the model on the training data
+        '''
+        from sklearn.model_selection import check_cv
+        self.shared=shared
+        self.nbytes=X.nbytes
+        self.temp_dir=None
+        self.X=self._share("X",X)
+        self.y=self._share("y",y)
+        self.splits=self._share("splits",list(check_cv(cv,y,classifier=False).split(X,y)))
+        self.X32=self._float32(X) if float32 else None
 
-            model.set_params(**gs.best_params_) # it is used to set the best parameters of the model
-            model.fit(X_train,y_train) # it is used to fit the model on the training data
+    def _temp_path(self,file_name):
+        if self.temp_dir is None:
+            shm="/dev/shm"
+            use_shm=os.path.isdir(shm) and shutil.disk_usage(shm).free>2*self.nbytes
+            self.temp_dir=tempfile.mkdtemp(prefix="training_data_",dir=shm if use_shm else None)
+        return os.path.join(self.temp_dir,file_name)
 
+    def _share(self,name,obj):
+        if not self.shared or isinstance(obj,np.memmap):
+            return obj
+        import joblib
+        path=self._temp_path(f"{name}.joblib")
+        joblib.dump(obj,path)
+        return joblib.load(path,mmap_mode="r")
 
-            y_train_pred = model.predict(X_train)
+    def _float32(self,X,block_rows=65536): # shared, it converts in row blocks straight into the memory map the workers open
+        if not self.shared:
+            return np.asarray(X,dtype=np.float32)
+        path=self._temp_path("X32.npy")
+        X32=np.lib.format.open_memmap(path,mode="w+",dtype=np.float32,shape=X.shape)
+        for start in range(0,len(X),block_rows):
+            X32[start:start+block_rows]=X[start:start+block_rows]
+        X32.flush()
+        del X32
+        return np.load(path,mmap_mode="r")
 
-            y_test_pred = model.predict(X_test)
+    def close(self):
+        if self.temp_dir is not None:
+            shutil.rmtree(self.temp_dir,ignore_errors=True) # open memory maps keep their pages until they are released
+            self.temp_dir=None
 
-            train_model_score = r2_score(y_train, y_train_pred)
+    def __enter__(self):
+        return self
 
-            test_model_score = r2_score(y_test, y_test_pred)
+    def __exit__(self,*exc_info):
+        self.close()
 
-            report[list(models.keys())[i]] = test_model_score # it is used to store the model name and the score of the model in the report dictionary
+def _search_model(name,model,para,X_train,y_train,X_test,y_test,search,cv,n_jobs,n_iter,time_budget,random_state,known_scores,early_stopping_rounds=0,sparse_density=0):
+    '''
+    This function runs the hyperparameter search of one model and returns its refitted best estimator, test score,
+    best parameters and the CV scores of the candidates it evaluated. time_budget (seconds) starts with this search,
+    so a slow model searched earlier cannot use up the time of the later ones.
 
+    '''
+    from sklearn.base import clone
+    from sklearn.metrics import r2_score
+    start=time.time()
+    deadline=start+time_budget if time_budget else None
+    new_scores={}
+    X_train=_training_matrix(model,X_train,sparse_density)
+    if search=="halving":
+        from sklearn.experimental import enable_halving_search_cv # noqa: F401 it is needed before importing the halving searches
+        from sklearn.model_selection import HalvingGridSearchCV
+        gs=HalvingGridSearchCV(model,para,cv=cv,n_jobs=n_jobs,random_state=random_state)
+        gs.fit(X_train,y_train) # with refit=True the best candidate is refitted on the full training data once, inside the search
+        best_model,best_params=gs.best_estimator_,gs.best_params_
+    elif search in ("grid","random"):
+        candidates=_candidates(para,search,n_iter,random_state)
+        new_scores=_run_candidates(model,candidates,known_scores,X_train,y_train,cv,n_jobs,deadline,early_stopping_rounds)
+        best_params=_best_candidate(model,candidates,{**known_scores,**new_scores})
+        best_model=clone(model).set_params(**best_params)
+        fit_estimator(best_model,X_train,y_train,early_stopping_rounds) # the winner is fitted once on the full training data
+    else:
+        raise ValueError(f"Unknown search strategy: {search}")
+
+    test_model_score=r2_score(y_test,best_model.predict(X_test))
+    logging.info(f"{name}: test r2 {test_model_score:.4f} with {best_params} in {time.time()-start:.1f}s, peak RSS {peak_rss_mb():.0f} MB")
+    return name,best_model,test_model_score,best_params,new_scores
+
+def evaluate_models(X_train, y_train,X_test,y_test,models,param,n_jobs=1,search="grid",n_iter=20,time_budget=None,cv=3,random_state=42,cache=None,early_stopping_rounds=0,sparse_density=0.5):
+    '''
+    This function searches the hyperparameters of every model and returns {model name: test r2}.
+    The entries of models are replaced by their fitted best estimators, so the caller does not need to refit them.
+    n_jobs spreads the models over worker processes and the CV folds over the remaining cores,
+    search is one of "grid", "random" or "halving", and time_budget (seconds, for all models) is split evenly between the
+    model searches, each one stops starting new candidates once its share, counted from its own start, is used up.
+    With a TrainingCache, CV scores and fitted estimators of earlier runs on the same data are reused,
+    so only grid points that were never evaluated are fitted again.
+    Grids over n_estimators (iterations for CatBoost) fit only the largest ensemble and score the smaller ones from it;
+    early_stopping_rounds > 0 stops XGBoost and CatBoost fits on a 10% validation split.
+    The CV folds are split once for all models (SharedTrainingData), the float32 matrix the trees fit on is made once for all
+    of them and each search of SPARSE_MODELS converts to CSR when the density is at most sparse_density (0 keeps them dense).
+
+    '''
+    try:
+        from joblib import Parallel,delayed,parallel_backend
+        from sklearn.metrics import r2_score
+
+        report = {}
+        start=time.time()
+
+        model_jobs,fold_jobs=_split_n_jobs(n_jobs,len(models))
+        data_fingerprint=cache.data_fingerprint(X_train,y_train) if cache is not None else None
+        search_id=cv if not early_stopping_rounds else [cv,{"early_stopping_rounds": early_stopping_rounds}] # early stopping changes the scores and the fits
+
+        pending={}
+        for name,model in models.items():
+            known_scores={}
+            if cache is not None and search in ("grid","random"):
+                candidates=_candidates(param[name],search,n_iter,random_state)
+                cached_scores=cache.get(cache.cv_scores_key(data_fingerprint,model,search_id),{})
+                known_scores={_candidate_id(model,c):cached_scores[_candidate_id(model,c)] for c in candidates if _candidate_id(model,c) in cached_scores}
+                if len(known_scores)==len(candidates):
+                    best_params=_best_candidate(model,candidates,known_scores)
+                    best_model=cache.get(cache.estimator_key(data_fingerprint,model,best_params if not early_stopping_rounds else [best_params,search_id]))
+                    if best_model is not None: # nothing new to evaluate and the winner is already fitted
+                        models[name]=best_model
+                        report[name]=r2_score(y_test,best_model.predict(X_test))
+                        logging.info(f"{name}: reused cached search, test r2 {report[name]:.4f} with {best_params}")
+                        continue
+            pending[name]=known_scores
+
+        model_jobs=min(model_jobs,max(1,len(pending)))
+        model_budget=time_budget*model_jobs/len(pending) if time_budget and pending else None # model_jobs searches run at once
+        float32=any(type(models[name]).__name__ in FLOAT32_MODELS for name in pending)
+        with SharedTrainingData(X_train,y_train,cv,shared=max(model_jobs,fold_jobs)>1,float32=float32) as data, \
+                parallel_backend("loky",inner_max_num_threads=fold_jobs): # it is used to stop every worker from using all cores for BLAS/OpenMP
+            results=Parallel(n_jobs=model_jobs)(
+                delayed(_search_model)(
+                    name,models[name],param[name],data.X32 if type(models[name]).__name__ in FLOAT32_MODELS else data.X,data.y,X_test,y_test,
+                    search,data.splits,fold_jobs,n_iter,model_budget,random_state,known_scores,early_stopping_rounds,sparse_density
+                )
+                for name,known_scores in pending.items()
+            )
+
+        for name,best_model,test_model_score,best_params,new_scores in results:
+            if cache is not None and search in ("grid","random"):
+                base_model=models[name]
+                if new_scores:
+                    scores_key=cache.cv_scores_key(data_fingerprint,base_model,search_id)
+                    cache.put(scores_key,{**cache.get(scores_key,{}),**new_scores}) # it is used to merge the new grid points into the earlier ones
+                cache.put(cache.estimator_key(data_fingerprint,base_model,best_params if not early_stopping_rounds else [best_params,search_id]),best_model)
+            models[name]=best_model # it is used to hand back the fitted best estimator instead of the unfitted one
+            report[name]=test_model_score # it is used to store the model name and the score of the model in the report dictionary
+
+        report={name:report[name] for name in models} # it is used to keep the report in the same order as the models
+        logging.info(f"Searched {len(pending)} of {len(models)} models in {time.time()-start:.1f}s, peak RSS {peak_rss_mb():.0f} MB"
+                     f" (finished workers {peak_rss_mb(children=True):.0f} MB)")
         return report
 
     except Exception as e:
@@ -54,8 +393,184 @@ def evaluate_models(X_train, y_train,X_test,y_test,models,param):
     
 def load_object(file_path): # it is used to load the object from the specified path
     try:
-        with open(file_path, "rb") as file_obj: # it is used to open the file in read binary mode
-            return pickle.load(file_obj) # it is used to load the object from the file
+        return serializers.load(file_path) # it is used to verify the checksum and load the object with the format in its manifest
+
+    except Exception as e:
+        raise CustomException(e, sys)
+
+def measure_serving_cost(model,X,single_calls=200,batch_size=1000,warmup=5):
+    '''
+    This function measures what a fitted model costs to serve: single-row predict latency (p50/p95/p99 in ms),
+    batched throughput in rows per second and the size of the file save_object would write for it
+
+    '''
+    try:
+        rows=[X[i%len(X)][None,:] for i in range(single_calls+warmup)] # one row 2D arrays, the shape the web app predicts on
+        for row in rows[:warmup]:
+            model.predict(row)
+        samples=[]
+        for row in rows[warmup:]:
+            start=time.perf_counter()
+            model.predict(row)
+            samples.append(time.perf_counter()-start)
+        samples=np.asarray(samples)*1000
+
+        batch=X[:batch_size]
+        start=time.perf_counter()
+        model.predict(batch)
+        batch_seconds=time.perf_counter()-start
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            manifest=serializers.dump(model,os.path.join(tmp_dir,"model.pkl"))
+
+        return {
+            "p50_ms": float(np.percentile(samples,50)),
+            "p95_ms": float(np.percentile(samples,95)),
+            "p99_ms": float(np.percentile(samples,99)),
+            "batch_rows_per_second": len(batch)/batch_seconds if batch_seconds else float("inf"),
+            "serialized_bytes": manifest["size"],
+            "format": manifest["format"],
+        }
+
+    except Exception as e:
+        raise CustomException(e, sys)
+
+def _table_format(file_path): # it is used to pick the file format from the extension
+    extension=os.path.splitext(file_path)[1].lower()
+    return {".parquet":"parquet",".feather":"feather",".arrow":"feather"}.get(extension,"csv")
+
+def _with_categories(df,categorical_columns):
+    columns=[column for column in categorical_columns or [] if column in df.columns]
+    return df.astype({column:"category" for column in columns}) if columns else df
+
+def write_table(df,file_path,categorical_columns=None): # it is used to save a dataframe as csv, parquet or feather by extension
+    try:
+        os.makedirs(os.path.dirname(file_path) or ".",exist_ok=True)
+        file_format=_table_format(file_path)
+        if file_format=="csv":
+            df.to_csv(file_path,index=False,header=True)
+        elif file_format=="parquet":
+            _with_categories(df,categorical_columns).to_parquet(file_path,index=False)
+        else:
+            _with_categories(df,categorical_columns).reset_index(drop=True).to_feather(file_path)
 
     except Exception as e:
-        raise CustomException(e, sys)
\ No newline at end of file
+        raise CustomException(e, sys)
+
+def append_table(df,file_path,categorical_columns=None): # it is used to add rows to an existing csv, parquet or feather file
+    try:
+        if not os.path.exists(file_path):
+            return write_table(df,file_path,categorical_columns)
+        if _table_format(file_path)=="csv": # csv rows are appended in place, the existing rows are not read
+            df.to_csv(file_path,mode="a",index=False,header=False)
+            return
+
+        merged=pd.concat([read_table(file_path),df],ignore_index=True) # columnar files are rewritten next to the old one
+        root,extension=os.path.splitext(file_path)
+        temp_path=f"{root}.tmp{extension}" # the extension picks the format
+        write_table(merged,temp_path,categorical_columns)
+        os.replace(temp_path,file_path)
+
+    except Exception as e:
+        raise CustomException(e, sys)
+
+def read_table(file_path,columns=None): # it is used to load a csv, parquet or feather file, columnar files are memory mapped
+    try:
+        file_format=_table_format(file_path)
+        if file_format=="csv":
+            return pd.read_csv(file_path,usecols=columns)
+
+        import pyarrow.feather as feather
+        import pyarrow.parquet as pq
+        if file_format=="parquet":
+            table=pq.read_table(file_path,columns=columns,memory_map=True)
+        else:
+            table=feather.read_table(file_path,columns=columns,memory_map=True)
+        return table.to_pandas()
+
+    except Exception as e:
+        raise CustomException(e, sys)
+
+def iter_table_chunks(file_path,chunksize): # it is used to stream a csv, parquet or feather file as dataframes of chunksize rows
+    try:
+        file_format=_table_format(file_path)
+        if file_format=="csv":
+            yield from pd.read_csv(file_path,chunksize=chunksize)
+        elif file_format=="parquet":
+            import pyarrow.parquet as pq
+            for batch in pq.ParquetFile(file_path,memory_map=True).iter_batches(batch_size=chunksize):
+                yield batch.to_pandas()
+        else:
+            import pyarrow.feather as feather
+            table=feather.read_table(file_path,memory_map=True)
+            for batch in table.to_batches(max_chunksize=chunksize):
+                yield batch.to_pandas()
+
+    except Exception as e:
+        raise CustomException(e, sys)
+
+class TableWriter: # This class appends dataframe chunks to a csv, parquet or feather file without holding them in memory.
+    def __init__(self,file_path,categorical_columns=None):
+        self.file_path=file_path
+        self.file_format=_table_format(file_path)
+        self.categorical_columns=categorical_columns
+        self._file=None
+        self._writer=None
+        self._schema=None
+        self._categories={} # column -> categories seen so far, new ones are only ever appended
+
+    def _encode_categories(self,df):
+        '''
+        This function encodes the categorical columns against categories that only grow, so each chunk's
+        dictionary extends the previous one (Arrow IPC files accept dictionary deltas but not replacements)
+
+        '''
+        columns={}
+        for column in self.categorical_columns or []:
+            if column not in df.columns:
+                continue
+            categories=self._categories.setdefault(column,[])
+            known=set(categories)
+            categories.extend(sorted(value for value in df[column].dropna().unique() if value not in known))
+            columns[column]=pd.Categorical(df[column],categories=categories)
+        return df.assign(**columns) if columns else df
+
+    def write(self,df):
+        try:
+            if self.file_format=="csv":
+                if self._file is None:
+                    os.makedirs(os.path.dirname(self.file_path) or ".",exist_ok=True)
+                    self._file=open(self.file_path,"w",newline="")
+                    df.to_csv(self._file,index=False,header=True)
+                else:
+                    df.to_csv(self._file,index=False,header=False)
+                return
+
+            import pyarrow as pa
+            df=self._encode_categories(df)
+            if self._schema is None:
+                self._schema=pa.Schema.from_pandas(df,preserve_index=False)
+                os.makedirs(os.path.dirname(self.file_path) or ".",exist_ok=True)
+                if self.file_format=="parquet":
+                    import pyarrow.parquet as pq
+                    self._writer=pq.ParquetWriter(self.file_path,self._schema)
+                else:
+                    self._file=pa.OSFile(self.file_path,"wb")
+                    self._writer=pa.ipc.new_file(self._file,self._schema,options=pa.ipc.IpcWriteOptions(emit_dictionary_deltas=True))
+            self._writer.write_table(pa.Table.from_pandas(df,schema=self._schema,preserve_index=False))
+
+        except Exception as e:
+            raise CustomException(e, sys)
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+        if self._file is not None:
+            self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self,*exc_info):
+        self.close()
+
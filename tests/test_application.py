@@ -0,0 +1,40 @@
+import os
+
+os.environ["WARMUP"]="0" # the tests below drive the warm-up themselves
+os.environ.pop("PRELOAD_ARTIFACTS",None)
+
+import application
+
+
+class FlakyRouter: # a router whose first warm-up fails, like artifacts that are not there yet at startup
+    def __init__(self):
+        self.calls=0
+
+    def warm_up(self):
+        self.calls+=1
+        if self.calls==1:
+            raise FileNotFoundError("artifacts/model.pkl")
+        return 0.0
+
+
+def test_ready_retries_a_failed_warm_up(monkeypatch):
+    router=FlakyRouter()
+    monkeypatch.setattr(application,"get_router",lambda: router)
+    monkeypatch.setattr(application,"ready",application.threading.Event())
+    client=application.app.test_client()
+
+    assert client.get("/ready").status_code==503
+    assert client.get("/ready").status_code==200
+    assert router.calls==2
+
+
+def test_warm_up_thread_retries_until_it_succeeds(monkeypatch):
+    router=FlakyRouter()
+    monkeypatch.setattr(application,"get_router",lambda: router)
+    monkeypatch.setattr(application,"ready",application.threading.Event())
+    monkeypatch.setattr(application,"warm_up_retry_seconds",0.01)
+
+    application.warm_up_with_retries()
+
+    assert application.ready.is_set()
+    assert router.calls==2
@@ -0,0 +1,36 @@
+import threading
+import time
+
+import pytest
+
+from src.pipeline.concurrency import Overloaded,PredictionExecutor,PredictionExecutorConfig
+
+
+def test_timed_out_work_keeps_its_slot_until_it_finishes():
+    executor=PredictionExecutor(PredictionExecutorConfig(max_workers=1,max_pending=1,timeout=0.05))
+    release=threading.Event()
+
+    with pytest.raises(TimeoutError):
+        executor.run(release.wait)
+    with pytest.raises(Overloaded): # the first call still runs on the pool
+        executor.run(time.sleep,0)
+
+    release.set()
+    time.sleep(0.05)
+    assert executor.run(lambda: "done")=="done"
+
+
+def test_timed_out_work_that_has_not_started_is_cancelled():
+    executor=PredictionExecutor(PredictionExecutorConfig(max_workers=1,max_pending=2,timeout=0.05))
+    release=threading.Event()
+    calls=[]
+    blocker=executor._get_pool().submit(release.wait) # occupies the only worker thread
+
+    with pytest.raises(TimeoutError):
+        executor.run(calls.append,"queued")
+    release.set()
+    blocker.result()
+    time.sleep(0.05)
+
+    assert calls==[]
+    assert executor._slots.acquire(blocking=False) and executor._slots.acquire(blocking=False) # both slots are free again
@@ -0,0 +1,27 @@
+import numpy as np
+import pandas as pd
+
+from src.pipeline.train_pipeline import drift_reference,drift_reference_from_counts,drift_value_counts,merge_value_counts
+
+
+def test_reference_merged_from_chunks_matches_the_whole_dataframe():
+    rng=np.random.default_rng(0)
+    df=pd.DataFrame({
+        "score": rng.integers(0,100,size=500),
+        "noise": rng.normal(size=500),
+        "group": rng.choice(["group A","group B","group C"],size=500),
+    })
+    df.loc[::7,"noise"]=np.nan
+
+    value_counts={}
+    for start in range(0,len(df),97):
+        merge_value_counts(value_counts,drift_value_counts(df.iloc[start:start+97]))
+    chunked=drift_reference_from_counts(value_counts,bins=10)
+    whole=drift_reference(df,bins=10)
+
+    for column in ("score","noise"):
+        expected_edges=np.unique(np.quantile(df[column].dropna().to_numpy(dtype=np.float64),np.linspace(0,1,11)[1:-1]))
+        np.testing.assert_allclose(chunked[column]["edges"],expected_edges)
+        np.testing.assert_allclose(chunked[column]["expected"],whole[column]["expected"])
+    assert chunked["group"]["categories"]==whole["group"]["categories"]==["group A","group B","group C"]
+    np.testing.assert_allclose(chunked["group"]["expected"],whole["group"]["expected"])
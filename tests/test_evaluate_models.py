@@ -0,0 +1,38 @@
+import time
+
+import numpy as np
+from sklearn.base import BaseEstimator,RegressorMixin
+
+from src.utils import evaluate_models
+
+FITS=[] # (delay, alpha) of every fit, the searches run in this process with n_jobs=1
+
+
+class SleepyRegressor(BaseEstimator,RegressorMixin): # a constant predictor whose fit takes delay seconds
+    def __init__(self,delay=0.0,alpha=0.0):
+        self.delay=delay
+        self.alpha=alpha
+
+    def fit(self,X,y):
+        time.sleep(self.delay)
+        FITS.append((self.delay,self.alpha))
+        self.mean_=float(np.mean(y))+self.alpha
+        return self
+
+    def predict(self,X):
+        return np.full(len(X),self.mean_)
+
+
+def test_slow_model_does_not_starve_later_models():
+    rng=np.random.default_rng(0)
+    X=rng.normal(size=(60,3))
+    y=X.sum(axis=1)
+    alphas=[i/10 for i in range(10)]
+    models={"slow": SleepyRegressor(delay=0.2),"fast": SleepyRegressor()}
+    params={name:{"alpha": alphas} for name in models}
+    FITS.clear()
+
+    evaluate_models(X[:40],y[:40],X[40:],y[40:],models,params,n_jobs=1,time_budget=1.0,cv=2)
+
+    assert len({alpha for delay,alpha in FITS if delay})<len(alphas) # the slow search stopped at its share of the budget
+    assert {alpha for delay,alpha in FITS if not delay}==set(alphas) # the search after it still evaluated its whole grid
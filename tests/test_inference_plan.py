@@ -0,0 +1,61 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.components.data_transformation import DataTransformation
+from src.components.inference_plan import InferencePlan
+
+
+def make_features(n_rows=60):
+    rng=np.random.default_rng(0)
+    return pd.DataFrame({
+        "writing_score": rng.integers(20,100,size=n_rows).astype(float),
+        "reading_score": rng.integers(20,100,size=n_rows).astype(float),
+        "gender": rng.choice(["female","male"],size=n_rows),
+        "race_ethnicity": rng.choice(["group A","group B","group C"],size=n_rows),
+        "parental_level_of_education": rng.choice(["high school","some college"],size=n_rows),
+        "lunch": rng.choice(["standard","free/reduced"],size=n_rows),
+        "test_preparation_course": rng.choice(["none","completed"],size=n_rows),
+    })
+
+
+def fitted_preprocessor(handle_unknown="error"):
+    preprocessor=DataTransformation().get_data_transformer_object()
+    preprocessor.set_params(cat_pipelines__one_hot_encoder__handle_unknown=handle_unknown)
+    return preprocessor.fit(make_features())
+
+
+def with_value(column,value):
+    features=make_features(3).astype(object)
+    features.loc[0,column]=value
+    return features
+
+
+@pytest.mark.parametrize("column,value",[("gender",np.nan),("reading_score",np.nan),("reading_score",None)])
+def test_missing_values_match_sklearn(column,value):
+    preprocessor=fitted_preprocessor()
+    plan=InferencePlan.from_preprocessor(preprocessor)
+    features=with_value(column,value)
+
+    expected=preprocessor.transform(features)
+    np.testing.assert_allclose(plan.transform(features),expected)
+    np.testing.assert_allclose(plan.transform_records(features.to_dict(orient="records")),expected)
+
+
+def test_none_category_is_unknown_like_sklearn():
+    features=with_value("gender",None)
+
+    preprocessor=fitted_preprocessor()
+    plan=InferencePlan.from_preprocessor(preprocessor)
+    with pytest.raises(ValueError):
+        preprocessor.transform(features)
+    with pytest.raises(ValueError):
+        plan.transform(features)
+    with pytest.raises(ValueError):
+        plan.transform_record(features.iloc[0].to_dict())
+
+    preprocessor=fitted_preprocessor(handle_unknown="ignore")
+    plan=InferencePlan.from_preprocessor(preprocessor)
+    expected=preprocessor.transform(features)
+    np.testing.assert_allclose(plan.transform(features),expected)
+    np.testing.assert_allclose(plan.transform_records(features.to_dict(orient="records")),expected)
@@ -0,0 +1,23 @@
+import pytest
+
+from src.pipeline.schema import RecordSchema,RecordSchemaConfig
+
+
+def make_schema():
+    return RecordSchema({"reading_score": 70.0},{"gender": (frozenset({"female","male"}),"female","error")},
+                        RecordSchemaConfig(score_min=0,score_max=100,max_errors=100))
+
+
+@pytest.mark.parametrize("value",[True,False,"5","abc",[5],{"score": 5}])
+def test_score_that_numpy_could_convert_is_not_a_number(value):
+    batch=make_schema().decode([{"reading_score": 50,"gender": "male"},{"reading_score": value,"gender": "male"}])
+
+    assert batch.valid.tolist()==[True,False]
+    assert batch.errors=={1: {"reading_score": "must be a number"}}
+
+
+def test_null_score_is_filled_and_ints_and_floats_pass():
+    batch=make_schema().decode({"reading_score": [None,5,7.5],"gender": ["male","female","male"]})
+
+    assert batch.valid.all()
+    assert batch.columns["reading_score"].tolist()==[70.0,5.0,7.5]